@@ -28,6 +28,11 @@ babel = Babel()
 def create_app(config_class=Config):
     app = Flask(__name__)
     app.config.from_object(config_class)
+    if 'pool_size' in app.config['SQLALCHEMY_ENGINE_OPTIONS']:
+        from app.pool import InstrumentedQueuePool
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = dict(
+            app.config['SQLALCHEMY_ENGINE_OPTIONS'],
+            poolclass=InstrumentedQueuePool)
 
     db.init_app(app)
     migrate.init_app(app, db)
@@ -57,6 +62,10 @@ def create_app(config_class=Config):
     from app.api import bp as api_bp
     app.register_blueprint(api_bp, url_prefix='/api')
 
+    if app.config['REQUEST_TIMING']:
+        from app.instrumentation import init_request_timing
+        init_request_timing(app)
+
     if not app.debug and not app.testing:
         if app.config['MAIL_SERVER']:
             auth = None
@@ -0,0 +1,90 @@
+"""Coalesced tracking of User.last_seen.
+
+Requests only record activity in memory. Each worker writes the buffered
+timestamps in one batched UPDATE at most every LAST_SEEN_FLUSH_INTERVAL
+seconds, so a busy user costs one row update per interval instead of one
+per request. The buffer is flushed again when the worker exits.
+"""
+import atexit
+from datetime import datetime, timezone
+import threading
+import time
+import sqlalchemy as sa
+from flask import current_app
+from app import db
+from app.models import User
+
+
+class ActivityTracker:
+    def __init__(self, app):
+        self.app = app
+        self.interval = app.config['LAST_SEEN_FLUSH_INTERVAL']
+        self.pending = {}
+        self.flushed_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def record(self, user_id, when=None):
+        """Note that a user was active; flush the buffer if it is due."""
+        when = when or datetime.now(timezone.utc)
+        with self._lock:
+            self.pending[user_id] = when
+            due = time.monotonic() - self.flushed_at >= self.interval
+        if due:
+            self.flush()
+
+    def flush(self):
+        """Write buffered timestamps. Needs an application context."""
+        with self._lock:
+            pending, self.pending = self.pending, {}
+            self.flushed_at = time.monotonic()
+        if not pending:
+            return 0
+        user = User.__table__
+        # never move last_seen backwards, another worker may be ahead
+        stmt = sa.update(user).where(
+            user.c.id == sa.bindparam('b_id'),
+            sa.or_(user.c.last_seen.is_(None),
+                   user.c.last_seen < sa.bindparam('b_last_seen'))
+        ).values(last_seen=sa.bindparam('b_last_seen'))
+        try:
+            # sorted ids keep the row lock order the same in every worker
+            db.session.execute(stmt, [
+                {'b_id': user_id, 'b_last_seen': when}
+                for user_id, when in sorted(pending.items())])
+            db.session.commit()
+        except sa.exc.SQLAlchemyError:
+            db.session.rollback()
+            with self._lock:
+                for user_id, when in pending.items():
+                    self.pending.setdefault(user_id, when)
+            current_app.logger.warning('Could not update last_seen',
+                                       exc_info=True)
+            return 0
+        return len(pending)
+
+    def shutdown(self):
+        with self.app.app_context():
+            self.flush()
+
+
+def get_activity_tracker(app=None):
+    app = app or current_app._get_current_object()
+    tracker = app.extensions.get('activity_tracker')
+    if tracker is None:
+        tracker = ActivityTracker(app)
+        if app.extensions.setdefault('activity_tracker', tracker) is \
+                tracker and not app.testing:
+            atexit.register(tracker.shutdown)
+        tracker = app.extensions['activity_tracker']
+    return tracker
+
+
+def record_activity(user_id):
+    get_activity_tracker().record(user_id)
+
+
+def flush_activity(app):
+    """Flush buffered activity, e.g. from a server's worker exit hook."""
+    tracker = app.extensions.get('activity_tracker')
+    if tracker is not None:
+        tracker.shutdown()
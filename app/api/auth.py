@@ -1,17 +1,108 @@
+from datetime import datetime, timezone
+import threading
+import time
 import sqlalchemy as sa
+import jwt
+from flask import current_app
 from flask_httpauth import HTTPBasicAuth, HTTPTokenAuth
 from app import db
-from app.models import User
+from app.models import User, RevokedToken
 from app.api.errors import error_response
 
 basic_auth = HTTPBasicAuth()
 token_auth = HTTPTokenAuth()
 
 
+class RevocationList:
+    """Per-worker copy of the unexpired revoked signed tokens.
+
+    The list is reloaded at most every API_REVOCATION_REFRESH seconds, so
+    a token revoked through another worker stops working within that time.
+    Revocations made through this worker apply immediately.
+    """
+
+    def __init__(self):
+        self.revoked = {}
+        self.loaded_at = None
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        interval = current_app.config['API_REVOCATION_REFRESH']
+        if self.loaded_at is not None and \
+                time.monotonic() - self.loaded_at < interval:
+            return
+        now = datetime.now(timezone.utc)
+        revoked = dict(db.session.execute(
+            sa.select(RevokedToken.jti, RevokedToken.expires_at)
+            .where(RevokedToken.expires_at > now)).all())
+        with self._lock:
+            self.revoked = {jti: expires_at.replace(tzinfo=timezone.utc)
+                            for jti, expires_at in revoked.items()}
+            self.loaded_at = time.monotonic()
+
+    def is_revoked(self, jti):
+        self.refresh()
+        return jti in self.revoked
+
+    def revoke(self, jti, user_id, expires_at):
+        now = datetime.now(timezone.utc)
+        db.session.execute(sa.delete(RevokedToken).where(
+            RevokedToken.expires_at <= now))
+        if db.session.scalar(sa.select(RevokedToken.id).where(
+                RevokedToken.jti == jti)) is None:
+            db.session.add(RevokedToken(jti=jti, user_id=user_id,
+                                        expires_at=expires_at))
+        with self._lock:
+            self.revoked[jti] = expires_at
+
+
+def get_revocation_list():
+    app = current_app._get_current_object()
+    return app.extensions.setdefault('api_token_revocations',
+                                     RevocationList())
+
+
+class TokenUser:
+    """User authenticated by a signed token.
+
+    Only the id is known up front; the User row is loaded the first time
+    any other attribute is used.
+    """
+
+    def __init__(self, id, jti, expires_at):
+        self.id = id
+        self.jti = jti
+        self.expires_at = expires_at
+        self._user = None
+
+    def __getattr__(self, name):
+        if self._user is None:
+            self._user = db.session.get(User, self.id)
+        return getattr(self._user, name)
+
+    def revoke_token(self):
+        get_revocation_list().revoke(self.jti, self.id, self.expires_at)
+
+
+def check_signed_token(token):
+    try:
+        payload = jwt.decode(token, current_app.config['SECRET_KEY'],
+                             algorithms=['HS256'],
+                             options={'require': ['exp', 'jti']})
+        id = int(payload['api_token'])
+    except (jwt.InvalidTokenError, KeyError, TypeError, ValueError):
+        return None
+    if get_revocation_list().is_revoked(payload['jti']):
+        return None
+    return TokenUser(id, payload['jti'], datetime.fromtimestamp(
+        payload['exp'], timezone.utc))
+
+
 @basic_auth.verify_password
 def verify_password(username, password):
     user = db.session.scalar(sa.select(User).where(User.username == username))
     if user and user.check_password(password):
+        db.session.commit()  # a rehashed password
         return user
 
 
@@ -22,7 +113,11 @@ def basic_auth_error(status):
 
 @token_auth.verify_token
 def verify_token(token):
-    return User.check_token(token) if token else None
+    if not token:
+        return None
+    if '.' in token:
+        return check_signed_token(token)
+    return User.check_token(token)
 
 
 @token_auth.error_handler
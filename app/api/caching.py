@@ -0,0 +1,61 @@
+"""Conditional GET support for the API.
+
+Views compute their validators from cheap indexed lookups (a row's
+updated_at, or the row count and updated_at high-water mark of a small
+collection) and call not_modified() before doing any other work. Where
+no index serves such an aggregate, the page is validated by its content
+instead (content_etag()): a 304 then saves the transfer, not the query.
+"""
+from datetime import timezone
+import hashlib
+import json
+from flask import request, make_response
+
+
+def make_etag(*parts):
+    """Build a strong entity tag from the values that identify a version."""
+    data = '\0'.join(str(part) for part in parts)
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+
+def content_etag(data):
+    """Build a strong entity tag from a JSON response body."""
+    return make_etag(request.full_path,
+                     json.dumps(data, sort_keys=True, default=str))
+
+
+def _http_date(value):
+    if value is None:
+        return None
+    return value.replace(tzinfo=timezone.utc, microsecond=0)
+
+
+def not_modified(etag, last_modified=None):
+    """Return a 304 response if the client's copy is current, else None.
+
+    If-None-Match takes precedence over If-Modified-Since, as in RFC 9110.
+    """
+    last_modified = _http_date(last_modified)
+    if request.if_none_match:
+        fresh = request.if_none_match.contains(etag)
+    elif request.if_modified_since and last_modified is not None:
+        fresh = last_modified <= request.if_modified_since
+    else:
+        fresh = False
+    if not fresh:
+        return None
+    response = make_response('', 304)
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    return response
+
+
+def with_validators(rv, etag, last_modified=None):
+    """Attach ETag and Last-Modified headers to a view's return value."""
+    response = make_response(rv)
+    if response.status_code == 200:
+        response.set_etag(etag)
+        response.last_modified = _http_date(last_modified)
+        # clients may store the response but must revalidate it
+        response.cache_control.no_cache = True
+    return response
@@ -0,0 +1,44 @@
+from flask import request, current_app
+from app.api.errors import bad_request
+
+TOTAL_MODES = ('none', 'estimate', 'exact')
+
+
+def collection_response(model, query, keys, endpoint, descending=True,
+                        **kwargs):
+    """Serialize a collection in page-number or cursor mode.
+
+    Requests that carry a ``cursor`` argument (an empty one starts at the
+    first page) are served with keyset pagination ordered by ``keys``;
+    all others keep the original ``page``/``per_page`` behaviour.
+    """
+    per_page = min(request.args.get('per_page', 10, type=int), 100)
+    if 'cursor' not in request.args:
+        page = request.args.get('page', 1, type=int)
+        return model.to_collection_dict(query, page, per_page, endpoint,
+                                        **kwargs)
+    total = request.args.get('total', 'none')
+    if total not in TOTAL_MODES:
+        return bad_request('total must be one of ' + ', '.join(TOTAL_MODES))
+    try:
+        return model.to_cursor_collection_dict(
+            query, keys, request.args['cursor'], per_page, endpoint,
+            descending=descending, total=total, **kwargs)
+    except ValueError:
+        return bad_request('invalid cursor')
+
+
+def parse_ids(value):
+    """Parse a comma separated ``ids`` argument.
+
+    Returns the unique ids in the given order, or None if the value is not
+    a list of integers or has more than API_BATCH_LIMIT entries.
+    """
+    try:
+        ids = [int(id) for id in value.split(',') if id.strip()]
+    except ValueError:
+        return None
+    ids = list(dict.fromkeys(ids))
+    if not ids or len(ids) > current_app.config['API_BATCH_LIMIT']:
+        return None
+    return ids
@@ -1,47 +1,168 @@
 import sqlalchemy as sa
-from flask import request, url_for, abort
+import sqlalchemy.orm as so
+from flask import request, url_for, abort, current_app, Response, \
+    stream_with_context
 from app import db
-from app.models import Recipe, User, Rating
+from app.models import Recipe, RecipeFacet, User, Rating
 from app.api import bp
 from app.api.auth import token_auth
 from app.api.errors import bad_request
+from app.api.pagination import collection_response, parse_ids
+from app.export import export_recipes, parse_fields, parse_since
+from app.api.caching import make_etag, content_etag, not_modified, \
+    with_validators
+from app.pantry import find_by_ingredients, parse_terms
+
+
+def load_recipes(ids, include_author=False):
+    """Load recipes with what to_dict() reads, also after a commit"""
+    query = sa.select(Recipe).where(Recipe.id.in_(ids)).options(
+        so.selectinload(Recipe.ingredient_items))
+    if include_author:
+        query = query.options(so.selectinload(Recipe.author))
+    return {recipe.id: recipe for recipe in db.session.scalars(query)}
+
+
+def collection_etag(filters=(), include_author=False):
+    """Strong validator for a collection of recipes.
+
+    Derived from the row count and the id and updated_at high-water marks
+    of the matching recipes (and of their authors when they are embedded),
+    so a create, update or delete changes it, and from the request's query
+    string (page, per_page, cursor and the filters). Collections get no
+    Last-Modified header: a delete does not move the high-water mark back.
+    """
+    query = sa.select(sa.func.count(Recipe.id), sa.func.max(Recipe.id),
+                      sa.func.max(Recipe.updated_at)).where(*filters)
+    if include_author:
+        query = query.add_columns(sa.func.max(User.updated_at)).join(
+            User, User.id == Recipe.user_id)
+    return make_etag(request.full_path, *db.session.execute(query).one())
 
 
 @bp.route('/recipes', methods=['GET'])
 def get_recipes():
     """Get paginated list of recipes"""
-    page = request.args.get('page', 1, type=int)
-    per_page = min(request.args.get('per_page', 10, type=int), 100)
     include_author = request.args.get('include_author', False, type=bool)
-    
-    # Get query with optional filtering
-    query = sa.select(Recipe).order_by(Recipe.timestamp.desc())
+
+    # Multi-get: ?ids=1,2,3 returns those recipes in the requested order
+    if 'ids' in request.args:
+        ids = parse_ids(request.args['ids'])
+        if ids is None:
+            return bad_request('ids must be a comma separated list of at '
+                               'most {} integers'.format(
+                                   current_app.config['API_BATCH_LIMIT']))
+        etag = collection_etag([Recipe.id.in_(ids)], include_author)
+        response = not_modified(etag)
+        if response:
+            return response
+        recipes = load_recipes(ids, include_author)
+        return with_validators({
+            'items': [recipes[id].to_dict(include_author=include_author)
+                      for id in ids if id in recipes],
+            'missing': [id for id in ids if id not in recipes]
+        }, etag)
+
+    filters = []
     
     # Filter by category if provided
     category = request.args.get('category')
     if category:
-        query = query.where(Recipe.category == category)
+        filters.append(Recipe.category == category)
     
     # Filter by difficulty if provided
     difficulty = request.args.get('difficulty')
     if difficulty:
-        query = query.where(Recipe.difficulty == difficulty)
+        filters.append(Recipe.difficulty == difficulty)
     
+    # Filter by total time bucket if provided
+    time_bucket = request.args.get('time_bucket')
+    if time_bucket:
+        filters.append(Recipe.time_bucket == time_bucket)
+
     # Filter by author if provided
     author_id = request.args.get('author_id', type=int)
     if author_id:
-        query = query.where(Recipe.user_id == author_id)
-    
-    return Recipe.to_collection_dict(query, page, per_page, 'api.get_recipes',
-                                   include_author=include_author)
+        filters.append(Recipe.user_id == author_id)
+
+    # Filter by normalized ingredient name if provided
+    ingredient = request.args.get('ingredient')
+    if ingredient:
+        filters.append(Recipe.has_ingredient(ingredient))
+
+    # Each filter on its own is served by an index, so the aggregate is
+    # checked before the page is loaded. No index covers a combination;
+    # those pages are validated by their content instead.
+    etag = None
+    if len(filters) <= 1:
+        etag = collection_etag(filters, include_author)
+        response = not_modified(etag)
+        if response:
+            return response
+    query = sa.select(Recipe).where(*filters).order_by(
+        Recipe.timestamp.desc()).options(
+            so.selectinload(Recipe.ingredient_items))
+    data = collection_response(
+        Recipe, query, (Recipe.timestamp, Recipe.id), 'api.get_recipes',
+        include_author=include_author)
+    if not isinstance(data, dict):
+        return data
+    if etag is None:
+        etag = content_etag(data)
+        response = not_modified(etag)
+        if response:
+            return response
+    return with_validators(data, etag)
+
+
+@bp.route('/recipes/export', methods=['GET'])
+@token_auth.login_required
+def export_recipes_ndjson():
+    """Stream all recipes as newline-delimited JSON
+
+    Optional arguments: since (ISO 8601 timestamp, exclusive) and fields
+    (comma separated list of recipe fields, "author" included).
+    """
+    try:
+        since = parse_since(request.args.get('since'))
+        fields = parse_fields(request.args.get('fields'))
+    except ValueError as e:
+        return bad_request(str(e))
+    return Response(stream_with_context(export_recipes(since, fields)),
+                    mimetype='application/x-ndjson')
 
 
 @bp.route('/recipes/<int:id>', methods=['GET'])
 def get_recipe(id):
     """Get specific recipe by ID"""
-    recipe = db.get_or_404(Recipe, id)
     include_author = request.args.get('include_author', True, type=bool)
-    return recipe.to_dict(include_author=include_author)
+    versions = db.session.execute(
+        sa.select(Recipe.updated_at, User.updated_at)
+        .join(User, User.id == Recipe.user_id)
+        .where(Recipe.id == id)).first()
+    if versions is None:
+        abort(404)
+    if not include_author:
+        versions = versions[:1]
+    etag = make_etag('recipe', id, include_author, *versions)
+    last_modified = max(versions)
+    response = not_modified(etag, last_modified)
+    if response:
+        return response
+    recipe = db.get_or_404(Recipe, id)
+    return with_validators(recipe.to_dict(include_author=include_author),
+                           etag, last_modified)
+
+
+def validate_recipe(data):
+    """Return an error message for invalid new recipe data, else None"""
+    if not data or not isinstance(data, dict):
+        return 'must include recipe data'
+    required_fields = ['title', 'ingredients', 'instructions']
+    for field in required_fields:
+        if field not in data or not data[field]:
+            return f'must include {field} field'
+    return None
 
 
 @bp.route('/recipes', methods=['POST'])
@@ -49,14 +170,9 @@ def get_recipe(id):
 def create_recipe():
     """Create a new recipe"""
     data = request.get_json()
-    if not data:
-        return bad_request('must include recipe data')
-    
-    # Required fields validation
-    required_fields = ['title', 'ingredients', 'instructions']
-    for field in required_fields:
-        if field not in data or not data[field]:
-            return bad_request(f'must include {field} field')
+    error = validate_recipe(data)
+    if error:
+        return bad_request(error)
     
     # Create new recipe
     recipe = Recipe()
@@ -71,6 +187,57 @@ def create_recipe():
     }
 
 
+@bp.route('/recipes/batch', methods=['POST'])
+@token_auth.login_required
+def create_recipes_batch():
+    """Create many recipes in a single transaction
+
+    By default the batch is all-or-nothing. With "atomic": false the valid
+    recipes are created and a per-item status is returned.
+    """
+    data = request.get_json(silent=True) or {}
+    items = data.get('recipes')
+    limit = current_app.config['API_BATCH_LIMIT']
+    if not isinstance(items, list) or not items or len(items) > limit:
+        return bad_request(f'recipes must be a list of 1 to {limit} recipes')
+    atomic = data.get('atomic', True)
+    include_author = request.args.get('include_author', False, type=bool)
+    errors = [validate_recipe(item) for item in items]
+    if atomic and any(errors):
+        return {
+            'error': 'Bad Request',
+            'errors': [{'index': i, 'message': error}
+                       for i, error in enumerate(errors) if error]
+        }, 400
+
+    user_id = token_auth.current_user().id
+    recipes = []
+    for item, error in zip(items, errors):
+        if error:
+            recipes.append(None)
+            continue
+        recipe = Recipe()
+        recipe.from_dict(item, new_recipe=True)
+        recipe.user_id = user_id
+        recipes.append(recipe)
+    db.session.add_all([recipe for recipe in recipes if recipe is not None])
+    db.session.commit()
+    load_recipes([recipe.id for recipe in recipes if recipe is not None],
+                 include_author)
+
+    if atomic:
+        return {'items': [recipe.to_dict(include_author=include_author)
+                          for recipe in recipes]}, 201
+    results = []
+    for recipe, error in zip(recipes, errors):
+        if error:
+            results.append({'status': 400, 'message': error})
+        else:
+            results.append({'status': 201, 'item': recipe.to_dict(
+                include_author=include_author)})
+    return {'items': results}, 207
+
+
 @bp.route('/recipes/<int:id>', methods=['PUT'])
 @token_auth.login_required
 def update_recipe(id):
@@ -120,50 +287,88 @@ def search_recipes():
     per_page = min(request.args.get('per_page', 10, type=int), 100)
     include_author = request.args.get('include_author', False, type=bool)
     
-    # Use Elasticsearch if available, otherwise fallback to database search
-    if Recipe.__searchable__:
-        recipes, total = Recipe.search(query, page, per_page)
-        if recipes:
-            data = {
-                'items': [recipe.to_dict(include_author=include_author) for recipe in recipes],
-                '_meta': {
-                    'page': page,
-                    'per_page': per_page,
-                    'total_items': total,
-                    'total_pages': (total + per_page - 1) // per_page
-                },
-                '_links': {
-                    'self': url_for('api.search_recipes', q=query, page=page, per_page=per_page),
-                    'next': url_for('api.search_recipes', q=query, page=page + 1, per_page=per_page) if page * per_page < total else None,
-                    'prev': url_for('api.search_recipes', q=query, page=page - 1, per_page=per_page) if page > 1 else None
-                }
-            }
-            return data
-    
-    # Fallback to database search
-    search_query = sa.select(Recipe).where(
-        sa.or_(
-            Recipe.title.ilike(f'%{query}%'),
-            Recipe.description.ilike(f'%{query}%'),
-            Recipe.ingredients.ilike(f'%{query}%'),
-            Recipe.instructions.ilike(f'%{query}%'),
-            Recipe.category.ilike(f'%{query}%')
-        )
-    ).order_by(Recipe.timestamp.desc())
-    
-    return Recipe.to_collection_dict(search_query, page, per_page, 'api.search_recipes',
-                                   q=query, include_author=include_author)
+    recipes, total = Recipe.search(query, page, per_page)
+    return {
+        'items': [recipe.to_dict(include_author=include_author) for recipe in recipes],
+        '_meta': {
+            'page': page,
+            'per_page': per_page,
+            'total_items': total,
+            'total_pages': (total + per_page - 1) // per_page
+        },
+        '_links': {
+            'self': url_for('api.search_recipes', q=query, page=page, per_page=per_page),
+            'next': url_for('api.search_recipes', q=query, page=page + 1, per_page=per_page) if page * per_page < total else None,
+            'prev': url_for('api.search_recipes', q=query, page=page - 1, per_page=per_page) if page > 1 else None
+        }
+    }
+
+
+@bp.route('/recipes/by-ingredients', methods=['GET'])
+def get_recipes_by_ingredients():
+    """Rank recipes by the ingredients the caller has
+
+    Arguments: have and exclude (comma separated ingredient names) and
+    optionally max_missing. Recipes using an excluded ingredient are left
+    out; the rest are ordered by fewest missing ingredients.
+    """
+    have = parse_terms(request.args.get('have'))
+    if not have:
+        return bad_request('must include have parameter')
+    exclude = parse_terms(request.args.get('exclude'))
+    max_missing = request.args.get('max_missing', type=int)
+    page = request.args.get('page', 1, type=int)
+    per_page = min(request.args.get('per_page', 10, type=int), 100)
+    include_author = request.args.get('include_author', False, type=bool)
+
+    results, total = find_by_ingredients(have, exclude, page, per_page,
+                                         max_missing)
+    items = []
+    for recipe, match, missing in results:
+        data = recipe.to_dict(include_author=include_author)
+        data['matched_count'] = match.matched
+        data['missing_count'] = match.missing
+        data['missing_ingredients'] = missing
+        items.append(data)
+    args = {'have': ','.join(have), 'exclude': ','.join(exclude) or None,
+            'max_missing': max_missing, 'per_page': per_page}
+    return {
+        'items': items,
+        '_meta': {
+            'page': page,
+            'per_page': per_page,
+            'total_items': total,
+            'total_pages': (total + per_page - 1) // per_page
+        },
+        '_links': {
+            'self': url_for('api.get_recipes_by_ingredients', page=page, **args),
+            'next': url_for('api.get_recipes_by_ingredients', page=page + 1, **args) if page * per_page < total else None,
+            'prev': url_for('api.get_recipes_by_ingredients', page=page - 1, **args) if page > 1 else None
+        }
+    }
 
 
 @bp.route('/recipes/<int:id>/ratings', methods=['GET'])
 def get_recipe_ratings(id):
     """Get all ratings for a specific recipe"""
-    recipe = db.get_or_404(Recipe, id)
-    page = request.args.get('page', 1, type=int)
-    per_page = min(request.args.get('per_page', 10, type=int), 100)
+    # rating changes bump the recipe's updated_at, except a re-rating with
+    # the same value, which only moves the rating's timestamp
+    updated_at = db.session.scalar(
+        sa.select(Recipe.updated_at).where(Recipe.id == id))
+    if updated_at is None:
+        abort(404)
+    ratings = db.session.execute(
+        sa.select(sa.func.count(Rating.id), sa.func.max(Rating.timestamp))
+        .where(Rating.recipe_id == id)).one()
+    etag = make_etag(request.full_path, updated_at, *ratings)
+    response = not_modified(etag)
+    if response:
+        return response
     
     query = sa.select(Rating).where(Rating.recipe_id == id).order_by(Rating.timestamp.desc())
-    return Rating.to_collection_dict(query, page, per_page, 'api.get_recipe_ratings', id=id)
+    return with_validators(collection_response(
+        Rating, query, (Rating.timestamp, Rating.id),
+        'api.get_recipe_ratings', id=id), etag)
 
 
 @bp.route('/recipes/<int:id>/ratings', methods=['POST'])
@@ -187,17 +392,77 @@ def rate_recipe(id):
     
     if existing_rating:
         # Update existing rating
+        recipe.update_rating_stats(existing_rating.rating, rating_value)
         existing_rating.rating = rating_value
     else:
         # Create new rating
         rating = Rating(recipe_id=id, user_id=current_user.id, rating=rating_value)
         db.session.add(rating)
+        recipe.update_rating_stats(new_rating=rating_value)
     
     db.session.commit()
     
     return recipe.to_dict(include_author=True), 201
 
 
+@bp.route('/recipes/ratings/batch', methods=['POST'])
+@token_auth.login_required
+def rate_recipes_batch():
+    """Rate many recipes at once, all-or-nothing
+
+    Expects {"ratings": [{"recipe_id": 1, "rating": 5}, ...]}.
+    """
+    data = request.get_json(silent=True) or {}
+    items = data.get('ratings')
+    limit = current_app.config['API_BATCH_LIMIT']
+    if not isinstance(items, list) or not items or len(items) > limit:
+        return bad_request(f'ratings must be a list of 1 to {limit} ratings')
+    errors = []
+    values = {}
+    for i, item in enumerate(items):
+        recipe_id = item.get('recipe_id') if isinstance(item, dict) else None
+        rating_value = item.get('rating') if isinstance(item, dict) else None
+        if not isinstance(recipe_id, int):
+            errors.append({'index': i, 'message': 'must include recipe_id'})
+        elif not isinstance(rating_value, int) or rating_value < 1 or \
+                rating_value > 5:
+            errors.append({'index': i, 'message':
+                           'rating must be an integer between 1 and 5'})
+        elif recipe_id in values:
+            errors.append({'index': i, 'message': 'duplicate recipe_id'})
+        else:
+            values[recipe_id] = rating_value
+    if not errors:
+        recipes = {recipe.id: recipe for recipe in db.session.scalars(
+            sa.select(Recipe).where(Recipe.id.in_(values)))}
+        errors = [{'index': i, 'message': 'recipe not found'}
+                  for i, item in enumerate(items)
+                  if item['recipe_id'] not in recipes]
+    if errors:
+        return {'error': 'Bad Request', 'errors': errors}, 400
+
+    current_user = token_auth.current_user()
+    existing = {rating.recipe_id: rating for rating in db.session.scalars(
+        sa.select(Rating).where(Rating.user_id == current_user.id,
+                                Rating.recipe_id.in_(values)))}
+    for recipe_id, rating_value in values.items():
+        rating = existing.get(recipe_id)
+        if rating:
+            recipes[recipe_id].update_rating_stats(rating.rating,
+                                                   rating_value)
+            rating.rating = rating_value
+        else:
+            db.session.add(Rating(recipe_id=recipe_id,
+                                  user_id=current_user.id,
+                                  rating=rating_value))
+            recipes[recipe_id].update_rating_stats(new_rating=rating_value)
+    db.session.commit()
+    load_recipes(list(values))
+
+    return {'items': [recipes[recipe_id].to_dict()
+                      for recipe_id in values]}, 201
+
+
 @bp.route('/recipes/<int:id>/ratings', methods=['DELETE'])
 @token_auth.login_required
 def delete_recipe_rating(id):
@@ -210,33 +475,56 @@ def delete_recipe_rating(id):
     if not rating:
         abort(404)
     
+    rating.recipe.update_rating_stats(old_rating=rating.rating)
     db.session.delete(rating)
     db.session.commit()
     
     return '', 204
 
 
+@bp.route('/recipes/facets', methods=['GET'])
+def get_recipe_facets():
+    """Get recipe counts per category, difficulty and time bucket
+
+    Accepts the category, difficulty, time_bucket and author_id filters of
+    GET /api/recipes. Each facet is counted with the filters of the other
+    facets applied; total applies all of them.
+    """
+    filters = {name: request.args[name] for name in RecipeFacet.FACETS
+               if request.args.get(name)}
+    author_id = request.args.get('author_id', type=int) or None
+    facets = RecipeFacet.counts(filters, author_id)
+    etag = make_etag(request.full_path, sorted(
+        (name, sorted(counts.items()) if isinstance(counts, dict) else counts)
+        for name, counts in facets.items()))
+    return not_modified(etag) or with_validators(facets, etag)
+
+
 @bp.route('/recipes/categories', methods=['GET'])
 def get_recipe_categories():
-    """Get list of available recipe categories"""
-    categories = db.session.scalars(
-        sa.select(Recipe.category).where(Recipe.category.isnot(None)).distinct()
-    ).all()
-    
-    return {
-        'categories': [cat for cat in categories if cat],
-        'count': len([cat for cat in categories if cat])
-    }
+    """Get list of available recipe categories, with recipe counts"""
+    counts = RecipeFacet.counts({})['category']
+    etag = make_etag(request.full_path, sorted(counts.items()))
+    response = not_modified(etag)
+    if response:
+        return response
+    return with_validators({
+        'categories': list(counts),
+        'counts': counts,
+        'count': len(counts)
+    }, etag)
 
 
 @bp.route('/recipes/difficulties', methods=['GET'])
 def get_recipe_difficulties():
-    """Get list of available recipe difficulties"""
-    difficulties = db.session.scalars(
-        sa.select(Recipe.difficulty).where(Recipe.difficulty.isnot(None)).distinct()
-    ).all()
-    
-    return {
-        'difficulties': [diff for diff in difficulties if diff],
-        'count': len([diff for diff in difficulties if diff])
-    }
+    """Get list of available recipe difficulties, with recipe counts"""
+    counts = RecipeFacet.counts({})['difficulty']
+    etag = make_etag(request.full_path, sorted(counts.items()))
+    response = not_modified(etag)
+    if response:
+        return response
+    return with_validators({
+        'difficulties': list(counts),
+        'counts': counts,
+        'count': len(counts)
+    }, etag)
@@ -1,10 +1,11 @@
 import sqlalchemy as sa
-from flask import request, url_for, abort
+from flask import request, url_for, abort, current_app
 from app import db
 from app.models import User
 from app.api import bp
 from app.api.auth import token_auth
 from app.api.errors import bad_request
+from app.api.pagination import collection_response, parse_ids
 
 
 @bp.route('/users/<int:id>', methods=['GET'])
@@ -16,30 +17,34 @@ def get_user(id):
 @bp.route('/users', methods=['GET'])
 @token_auth.login_required
 def get_users():
-    page = request.args.get('page', 1, type=int)
-    per_page = min(request.args.get('per_page', 10, type=int), 100)
-    return User.to_collection_dict(sa.select(User), page, per_page,
-                                   'api.get_users')
+    if 'ids' in request.args:
+        ids = parse_ids(request.args['ids'])
+        if ids is None:
+            return bad_request('ids must be a comma separated list of at '
+                               'most {} integers'.format(
+                                   current_app.config['API_BATCH_LIMIT']))
+        users = {user.id: user for user in db.session.scalars(
+            sa.select(User).where(User.id.in_(ids)))}
+        return {'items': [users[id].to_dict() for id in ids if id in users],
+                'missing': [id for id in ids if id not in users]}
+    return collection_response(User, sa.select(User), (User.id,),
+                               'api.get_users', descending=False)
 
 
 @bp.route('/users/<int:id>/followers', methods=['GET'])
 @token_auth.login_required
 def get_followers(id):
     user = db.get_or_404(User, id)
-    page = request.args.get('page', 1, type=int)
-    per_page = min(request.args.get('per_page', 10, type=int), 100)
-    return User.to_collection_dict(user.followers.select(), page, per_page,
-                                   'api.get_followers', id=id)
+    return collection_response(User, user.followers.select(), (User.id,),
+                               'api.get_followers', descending=False, id=id)
 
 
 @bp.route('/users/<int:id>/following', methods=['GET'])
 @token_auth.login_required
 def get_following(id):
     user = db.get_or_404(User, id)
-    page = request.args.get('page', 1, type=int)
-    per_page = min(request.args.get('per_page', 10, type=int), 100)
-    return User.to_collection_dict(user.following.select(), page, per_page,
-                                   'api.get_following', id=id)
+    return collection_response(User, user.following.select(), (User.id,),
+                               'api.get_following', descending=False, id=id)
 
 
 @bp.route('/users', methods=['POST'])
@@ -22,6 +22,7 @@ def login():
         if user is None or not user.check_password(form.password.data):
             flash(_('Invalid username or password'))
             return redirect(url_for('auth.login'))
+        db.session.commit()  # a rehashed password
         login_user(user, remember=form.remember_me.data)
         next_page = request.args.get('next')
         if not next_page or urlsplit(next_page).netloc != '':
@@ -62,6 +63,7 @@ def reset_password_request():
             sa.select(User).where(User.email == form.email.data))
         if user:
             send_password_reset_email(user)
+            db.session.commit()
         flash(
             _('Check your email for the instructions to reset your password'))
         return redirect(url_for('auth.login'))
@@ -0,0 +1,129 @@
+"""Caching helpers: a per-process LRU and a fragment cache for HTML."""
+from collections import OrderedDict
+import threading
+import time
+from flask import current_app
+
+
+class LRUCache:
+    """Thread-safe least-recently-used cache with an optional TTL.
+
+    Each process (gunicorn worker) holds its own instance, so entries are
+    never shared between workers; anything that must survive a restart
+    belongs in the database or a shared cache in front of this one.
+    """
+
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                value, expires = item
+                if expires is None or expires > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        expires = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        return {'size': len(self._data), 'maxsize': self.maxsize,
+                'hits': self.hits, 'misses': self.misses}
+
+
+class RedisCache:
+    """Shared cache backend on a Redis server.
+
+    Needs the optional ``redis`` package. Errors talking to the server are
+    logged and treated as cache misses, so an outage only costs rendering
+    time.
+    """
+
+    def __init__(self, url, ttl=None, prefix='foody:'):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+        self.errors = redis.RedisError
+
+    def get(self, key, default=None):
+        try:
+            value = self.client.get(self.prefix + key)
+        except self.errors:
+            current_app.logger.warning('Cache read failed', exc_info=True)
+            return default
+        return default if value is None else value.decode('utf-8')
+
+    def set(self, key, value, ttl=None):
+        try:
+            self.client.set(self.prefix + key, value, ex=ttl or self.ttl)
+        except self.errors:
+            current_app.logger.warning('Cache write failed', exc_info=True)
+
+
+class FragmentCache:
+    """Rendered HTML fragments in a local LRU, optionally backed by Redis.
+
+    Keys must contain a version stamp of everything the fragment shows;
+    entries are never invalidated, stale versions simply stop being read.
+    """
+
+    def __init__(self, maxsize, ttl, url=None):
+        self.local = LRUCache(maxsize, ttl)
+        self.shared = RedisCache(url, ttl) if url else None
+
+    def get(self, key):
+        value = self.local.get(key)
+        if value is None and self.shared is not None:
+            value = self.shared.get(key)
+            if value is not None:
+                self.local.set(key, value)
+        return value
+
+    def set(self, key, value):
+        self.local.set(key, value)
+        if self.shared is not None:
+            self.shared.set(key, value)
+
+    def stats(self):
+        return dict(self.local.stats(), shared=self.shared is not None)
+
+
+def get_fragment_cache():
+    app = current_app._get_current_object()
+    cache = app.extensions.get('fragment_cache')
+    if cache is None:
+        cache = app.extensions.setdefault('fragment_cache', FragmentCache(
+            app.config['FRAGMENT_CACHE_SIZE'],
+            app.config['FRAGMENT_CACHE_TTL'],
+            app.config['FRAGMENT_CACHE_URL']))
+    return cache
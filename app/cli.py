@@ -1,8 +1,11 @@
+import multiprocessing
 import os
+import signal
+import time
 from flask import Blueprint, current_app
 import click
 from app import create_app, db
-from app.models import User, Recipe
+from app.models import User, Recipe, RecipeFacet
 from app.auth.welcome_email import send_welcome_email, send_recipe_share_email, send_rating_notification_email
 from app.auth.email import send_password_reset_email
 
@@ -44,6 +47,13 @@ def compile():
         raise RuntimeError('compile command failed')
 
 
+@translate.command('purge-cache')
+def purge_cache():
+    """Delete expired entries from the translation cache."""
+    from app.translate import purge_translation_cache
+    click.echo(f'Removed {purge_translation_cache()} expired translations.')
+
+
 @bp.cli.group()
 def email():
     """Email testing and management commands."""
@@ -325,3 +335,191 @@ The Foody Team""",
             
         except Exception as e:
             click.echo(f"❌ Error sending emails: {e}")
+
+
+@email.command()
+@click.option('--once', is_flag=True, help='Exit once the outbox is empty')
+@click.option('--connections', '-c', type=int, default=None,
+              help='Persistent SMTP connections (default: MAIL_DRAIN_CONNECTIONS)')
+@click.option('--rate', type=float, default=None,
+              help='Messages per second (default: MAIL_RATE_LIMIT)')
+def drain(once, connections, rate):
+    """Deliver queued emails from the outbox."""
+    from app.email import OutboxDrainer
+    drainer = OutboxDrainer(connections=connections, rate=rate)
+    signal.signal(signal.SIGTERM, drainer.stop)
+    drainer.drain(once=once)
+
+
+@email.command()
+def status():
+    """Show the number of outbox messages per status."""
+    from app.email import outbox_depth
+    depth = outbox_depth()
+    for name in ('queued', 'sending', 'sent', 'failed'):
+        click.echo(f'{name}: {depth.get(name, 0)}')
+
+
+@bp.cli.group()
+def users():
+    """User maintenance commands."""
+    pass
+
+
+@users.command('reconcile-counters')
+@click.option('--chunk-size', default=1000, help='Users per transaction')
+def reconcile_counters(chunk_size):
+    """Repair drift in the denormalized recipe and follower counters."""
+    count = User.reconcile_counters(chunk_size=chunk_size)
+    click.echo(f'Corrected counters of {count} users.')
+
+
+@bp.cli.group()
+def data():
+    """Bulk data commands."""
+    pass
+
+
+@data.command('import')
+@click.option('--users', type=click.Path(exists=True, dir_okay=False))
+@click.option('--recipes', type=click.Path(exists=True, dir_okay=False))
+@click.option('--follows', type=click.Path(exists=True, dir_okay=False))
+@click.option('--ratings', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'format', type=click.Choice(['jsonl', 'csv']),
+              default=None, help='File format (default: from the extension)')
+@click.option('--chunk-size', default=5000, help='Rows per transaction')
+@click.option('--no-finalize', is_flag=True,
+              help='Skip rebuilding derived data (run `flask data finalize`)')
+def import_data(format, chunk_size, no_finalize, **files):
+    """Bulk import JSONL or CSV files."""
+    from app.data_import import KINDS, read_rows, import_rows
+    for kind in KINDS:
+        if not files[kind]:
+            continue
+        start = time.perf_counter()
+        count = import_rows(
+            kind, read_rows(files[kind], format), chunk_size=chunk_size,
+            progress=lambda n, kind=kind: click.echo(
+                f'\r{kind}: {n} rows', nl=False))
+        elapsed = time.perf_counter() - start
+        click.echo(f'\r{kind}: {count} rows in {elapsed:.1f}s '
+                   f'({count / max(elapsed, 1e-6):.0f} rows/s)')
+    if not no_finalize:
+        _finalize_import()
+
+
+@data.command()
+def finalize():
+    """Rebuild aggregates, counters, timelines, ingredients, facets,
+    search and languages."""
+    _finalize_import()
+
+
+def _finalize_import():
+    from app.data_import import finalize
+    finalize(progress=lambda step, elapsed: click.echo(
+        f'Rebuilt {step} in {elapsed:.1f}s'))
+
+
+@bp.cli.group()
+def recipes():
+    """Recipe maintenance commands."""
+    pass
+
+
+@recipes.command('rebuild-ratings')
+@click.option('--chunk-size', default=1000, help='Recipes per transaction')
+def rebuild_ratings(chunk_size):
+    """Recompute the denormalized rating aggregates of every recipe."""
+    count = Recipe.rebuild_rating_stats(chunk_size=chunk_size)
+    click.echo(f'Rebuilt rating aggregates for {count} recipes.')
+
+
+@recipes.command()
+@click.option('--chunk-size', default=500, help='Recipes per transaction')
+def reindex(chunk_size):
+    """Rebuild the full-text search index for all recipes."""
+    count = Recipe.reindex(chunk_size=chunk_size)
+    click.echo(f'Indexed {count} recipes.')
+
+
+@recipes.command('rebuild-facets')
+def rebuild_facets():
+    """Recompute time buckets and the facet count cube."""
+    RecipeFacet.rebuild()
+    click.echo('Rebuilt facet counts.')
+
+
+@recipes.command('detect-language')
+@click.option('--chunk-size', default=500, help='Recipes per batch')
+@click.option('--processes', '-p', default=os.cpu_count() or 1,
+              help='Detection processes (default: one per CPU)')
+@click.option('--all', 'redetect', is_flag=True,
+              help='Detect again for recipes that have a language')
+def detect_language(chunk_size, processes, redetect):
+    """Detect the language of recipes that have none."""
+    from app.language import backfill_languages
+    start = time.perf_counter()
+    count = backfill_languages(
+        chunk_size=chunk_size, processes=processes, redetect=redetect,
+        progress=lambda n: click.echo(f'\r{n} recipes', nl=False))
+    click.echo(f'\rDetected the language of {count} recipes in '
+               f'{time.perf_counter() - start:.1f}s.')
+
+
+@recipes.command('backfill-ingredients')
+@click.option('--chunk-size', default=500, help='Recipes per transaction')
+def backfill_ingredients(chunk_size):
+    """Create normalized ingredient rows for recipes that have none."""
+    count = Recipe.backfill_ingredients(chunk_size=chunk_size)
+    click.echo(f'Backfilled ingredients of {count} recipes.')
+
+
+@recipes.command()
+@click.option('--output', '-o', type=click.File('w'), default='-',
+              help='Output file (default: standard output)')
+@click.option('--since', default=None,
+              help='Only recipes created after this ISO 8601 timestamp')
+@click.option('--fields', default=None,
+              help='Comma separated list of fields to export')
+@click.option('--chunk-size', default=500, help='Rows fetched per round trip')
+def export(output, since, fields, chunk_size):
+    """Export recipes as newline-delimited JSON."""
+    from app.export import export_recipes, parse_fields, parse_since
+    try:
+        since = parse_since(since)
+        fields = parse_fields(fields)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+    for lines in export_recipes(since, fields, chunk_size=chunk_size):
+        output.write(lines)
+
+
+@bp.cli.command()
+@click.option('--processes', '-p', type=int, default=None,
+              help='Worker processes (default: WORKER_PROCESSES)')
+@click.option('--burst', is_flag=True,
+              help='Exit once the queue is empty')
+def worker(processes, burst):
+    """Run queued background tasks."""
+    from app.worker import Worker, run_worker_process
+    processes = processes or current_app.config['WORKER_PROCESSES']
+    click.echo(f'Starting {processes} worker process(es).')
+    if processes == 1:
+        Worker().work(burst=burst)
+        return
+    context = multiprocessing.get_context('spawn')
+    pool = [context.Process(target=run_worker_process, args=(burst,))
+            for _ in range(processes)]
+    for process in pool:
+        process.start()
+
+    def shutdown(signum, frame):
+        for process in pool:
+            if process.is_alive():
+                process.terminate()
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+    for process in pool:
+        process.join()
@@ -0,0 +1,158 @@
+"""Bulk import of users, recipes, follows and ratings.
+
+Rows are read from JSONL or CSV files and written in chunks with
+executemany INSERTs on the tables, bypassing the ORM unit of work and its
+per-object events. Everything those events would otherwise maintain (rating
+aggregates, user counters, timelines, normalized ingredients, facet counts,
+the search index and recipe languages) is rebuilt once by finalize() after
+all files are loaded.
+
+Rows reference each other by id, so files that are imported together
+should carry explicit ``id`` columns for users and recipes.
+"""
+from datetime import datetime, timezone
+import csv
+import json
+import time
+import sqlalchemy as sa
+from flask import current_app
+from werkzeug.security import generate_password_hash
+from app import db
+from app.language import backfill_languages
+from app.models import User, Recipe, RecipeFacet, Rating, followers, \
+    timeline
+
+# import order that satisfies the foreign keys
+KINDS = ('users', 'recipes', 'follows', 'ratings')
+
+TABLES = {
+    'users': User.__table__,
+    'recipes': Recipe.__table__,
+    'follows': followers,
+    'ratings': Rating.__table__,
+}
+
+
+def read_rows(path, format=None):
+    """Yield rows of a JSONL or CSV file as dictionaries."""
+    format = format or ('csv' if path.lower().endswith('.csv') else 'jsonl')
+    with open(path, newline='', encoding='utf-8') as f:
+        if format == 'csv':
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def _parse_datetime(value):
+    value = datetime.fromisoformat(value)
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _coerce(table, row):
+    """Convert a row read from a file to column values of ``table``."""
+    values = {}
+    for key, value in row.items():
+        if key not in table.c:
+            raise ValueError(f'{table.name} has no column {key!r}')
+        column = table.c[key]
+        if value == '' and column.nullable:
+            value = None
+        elif isinstance(value, str):
+            if isinstance(column.type, sa.DateTime):
+                value = _parse_datetime(value)
+            elif isinstance(column.type, sa.Boolean):
+                value = value.lower() in ('1', 'true', 'yes')
+            elif isinstance(column.type, sa.Integer):
+                value = int(value)
+            elif isinstance(column.type, sa.Float):
+                value = float(value)
+        values[key] = value
+    return values
+
+
+def _prepare(kind, row):
+    row = dict(row)
+    if kind == 'users' and 'password' in row:
+        # hashing is deliberately slow; prefer exporting password_hash
+        password = row.pop('password')
+        if password:
+            row['password_hash'] = generate_password_hash(password)
+    if kind == 'recipes' and isinstance(row.get('ingredients'), list):
+        row['ingredients'] = json.dumps(row['ingredients'])
+    return _coerce(TABLES[kind], row)
+
+
+def _insert(table, rows):
+    # executemany needs the same keys in every row of a statement
+    groups = {}
+    for row in rows:
+        groups.setdefault(tuple(sorted(row)), []).append(row)
+    for group in groups.values():
+        db.session.execute(table.insert(), group)
+
+
+def import_rows(kind, rows, chunk_size=5000, progress=None):
+    """Insert rows of one kind in chunks, one transaction per chunk.
+
+    ``progress`` is called with the running row count after each chunk.
+    Returns the number of rows inserted.
+    """
+    table = TABLES[kind]
+    count = 0
+    chunk = []
+    for row in rows:
+        chunk.append(_prepare(kind, row))
+        if len(chunk) >= chunk_size:
+            _insert(table, chunk)
+            db.session.commit()
+            count += len(chunk)
+            chunk = []
+            if progress:
+                progress(count)
+    if chunk:
+        _insert(table, chunk)
+        db.session.commit()
+        count += len(chunk)
+        if progress:
+            progress(count)
+    return count
+
+
+def rebuild_timelines():
+    """Recreate every timeline from the recipe and followers tables."""
+    limit = current_app.config['TIMELINE_BACKFILL_LIMIT']
+    db.session.execute(timeline.delete())
+    db.session.execute(sa.update(User).values(
+        timeline_pull=User.recipe_total > limit))
+    columns = ['user_id', 'recipe_id', 'author_id', 'timestamp']
+    db.session.execute(timeline.insert().from_select(columns, sa.select(
+        Recipe.user_id, Recipe.id, Recipe.user_id, Recipe.timestamp)))
+    db.session.execute(timeline.insert().from_select(columns, sa.select(
+        followers.c.follower_id, Recipe.id, Recipe.user_id, Recipe.timestamp)
+        .join(followers, followers.c.followed_id == Recipe.user_id)
+        .join(User, User.id == Recipe.user_id)
+        .where(followers.c.follower_id != Recipe.user_id,
+               User.timeline_pull == sa.false())))
+    db.session.commit()
+
+
+def finalize(progress=None):
+    """Rebuild all derived data after a bulk import."""
+    steps = [
+        ('rating aggregates', Recipe.rebuild_rating_stats),
+        ('user counters', User.reconcile_counters),
+        ('timelines', rebuild_timelines),
+        ('ingredients', Recipe.backfill_ingredients),
+        ('facet counts', RecipeFacet.rebuild),
+        ('search index', Recipe.reindex),
+        ('recipe languages', backfill_languages),
+    ]
+    for name, step in steps:
+        start = time.perf_counter()
+        step()
+        if progress:
+            progress(name, time.perf_counter() - start)
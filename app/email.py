@@ -1,24 +1,221 @@
-from threading import Thread
+from datetime import datetime, timezone, timedelta
+import json
+import queue
+import threading
+import time
+from uuid import uuid4
 from flask import current_app
 from flask_mail import Message
-from app import mail
-
-
-def send_async_email(app, msg):
-    with app.app_context():
-        mail.send(msg)
+import sqlalchemy as sa
+from app import db, mail
+from app.models import OutgoingEmail
 
 
 def send_email(subject, sender, recipients, text_body, html_body,
                attachments=None, sync=False):
-    msg = Message(subject, sender=sender, recipients=recipients)
-    msg.body = text_body
-    msg.html = html_body
-    if attachments:
-        for attachment in attachments:
-            msg.attach(*attachment)
+    """Send an email, by default through the persistent outbox.
+
+    Queued messages are added to the current session and written by the
+    caller's commit, together with the change they are about, or not at
+    all if it rolls back. `flask email drain` delivers them, so they
+    survive worker restarts. Pass sync=True to send immediately over a
+    fresh SMTP connection.
+    """
     if sync:
+        msg = Message(subject, sender=sender, recipients=recipients)
+        msg.body = text_body
+        msg.html = html_body
+        for attachment in attachments or []:
+            msg.attach(*attachment)
         mail.send(msg)
-    else:
-        Thread(target=send_async_email,
-               args=(current_app._get_current_object(), msg)).start()
+        return None
+    email = OutgoingEmail(subject=subject, sender=sender,
+                          recipients_json=json.dumps(recipients),
+                          text_body=text_body, html_body=html_body)
+    email.set_attachments(attachments)
+    db.session.add(email)
+    return email
+
+
+def outbox_depth():
+    """Return the number of outbox messages per status."""
+    return dict(db.session.execute(
+        sa.select(OutgoingEmail.status, sa.func.count())
+        .group_by(OutgoingEmail.status)).all())
+
+
+class RateLimiter:
+    """Token bucket shared by the sender threads."""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.lock = threading.Lock()
+        self.next_slot = time.monotonic()
+
+    def wait(self):
+        if not self.rate:
+            return
+        with self.lock:
+            now = time.monotonic()
+            slot = max(self.next_slot, now)
+            self.next_slot = slot + 1.0 / self.rate
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class OutboxDrainer:
+    """Deliver queued outbox messages over a pool of SMTP connections.
+
+    Each sender thread keeps one SMTP connection open for as long as the
+    drainer runs and reconnects only after an error. Only the main thread
+    talks to the database: it claims a batch, hands the messages to the
+    senders and records all outcomes in a single transaction.
+    """
+
+    def __init__(self, connections=None, batch_size=None, rate=None):
+        config = current_app.config
+        self.app = current_app._get_current_object()
+        self.connections = connections or config['MAIL_DRAIN_CONNECTIONS']
+        self.batch_size = batch_size or config['MAIL_DRAIN_BATCH_SIZE']
+        self.limiter = RateLimiter(config['MAIL_RATE_LIMIT']
+                                   if rate is None else rate)
+        self.jobs = queue.Queue()
+        self.results = queue.Queue()
+        self.threads = []
+        self.running = True
+
+    def start(self):
+        for _ in range(self.connections):
+            thread = threading.Thread(target=self._sender, daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self, *args):
+        self.running = False
+
+    def close(self):
+        for _ in self.threads:
+            self.jobs.put(None)
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+
+    def _sender(self):
+        with self.app.app_context():
+            connection = None
+            while True:
+                job = self.jobs.get()
+                if job is None:
+                    break
+                email_id, msg = job
+                self.limiter.wait()
+                try:
+                    if connection is None:
+                        connection = mail.connect()
+                        connection.__enter__()
+                    connection.send(msg)
+                except Exception as e:
+                    self.results.put((email_id, str(e) or repr(e)))
+                    if connection is not None:
+                        try:
+                            connection.__exit__(None, None, None)
+                        except Exception:
+                            pass
+                    connection = None
+                else:
+                    self.results.put((email_id, None))
+            if connection is not None:
+                connection.__exit__(None, None, None)
+
+    def claim(self):
+        now = datetime.now(timezone.utc)
+        token = uuid4().hex
+        max_attempts = current_app.config['MAIL_MAX_ATTEMPTS']
+        # a message whose sender died mid-send is retried like a failed
+        # one, and given up once its attempts are used, so one that
+        # crashes the drainer is not claimed forever
+        stuck = sa.and_(OutgoingEmail.status == 'sending',
+                        OutgoingEmail.locked_until < now)
+        db.session.execute(
+            sa.update(OutgoingEmail)
+            .where(stuck, OutgoingEmail.attempts >= max_attempts)
+            .values(status='failed', locked_until=None,
+                    error='sending did not finish')
+            .execution_options(synchronize_session=False))
+        runnable = sa.or_(
+            sa.and_(OutgoingEmail.status == 'queued',
+                    OutgoingEmail.next_attempt_at <= now),
+            sa.and_(stuck, OutgoingEmail.attempts < max_attempts))
+        ids = db.session.scalars(
+            sa.select(OutgoingEmail.id).where(runnable)
+            .order_by(OutgoingEmail.id).limit(self.batch_size)).all()
+        if not ids:
+            db.session.commit()
+            return []
+        db.session.execute(
+            sa.update(OutgoingEmail)
+            .where(OutgoingEmail.id.in_(ids), runnable)
+            .values(status='sending', locked_by=token,
+                    locked_until=now + timedelta(minutes=5),
+                    attempts=OutgoingEmail.attempts + 1)
+            .execution_options(synchronize_session=False))
+        db.session.commit()
+        return db.session.scalars(sa.select(OutgoingEmail).where(
+            OutgoingEmail.id.in_(ids), OutgoingEmail.locked_by == token))
+
+    @staticmethod
+    def build_message(email):
+        msg = Message(email.subject, sender=email.sender,
+                      recipients=email.get_recipients())
+        msg.body = email.text_body
+        msg.html = email.html_body
+        for attachment in email.get_attachments():
+            msg.attach(*attachment)
+        return msg
+
+    def drain_once(self):
+        """Send one batch. Returns ``(sent, failed)`` counts."""
+        emails = {email.id: email for email in self.claim()}
+        for email in emails.values():
+            self.jobs.put((email.id, self.build_message(email)))
+        sent = failed = 0
+        now = datetime.now(timezone.utc)
+        config = current_app.config
+        for _ in range(len(emails)):
+            email_id, error = self.results.get()
+            email = emails[email_id]
+            email.locked_until = None
+            if error is None:
+                email.status = 'sent'
+                email.sent_at = now
+                email.error = None
+                sent += 1
+                continue
+            failed += 1
+            email.error = error[-1000:]
+            if email.attempts >= config['MAIL_MAX_ATTEMPTS']:
+                email.status = 'failed'
+            else:
+                email.status = 'queued'
+                email.next_attempt_at = now + timedelta(
+                    seconds=config['MAIL_RETRY_BACKOFF'] *
+                    2 ** (email.attempts - 1))
+        db.session.commit()
+        return sent, failed
+
+    def drain(self, once=False, poll_interval=1.0):
+        self.start()
+        try:
+            while self.running:
+                sent, failed = self.drain_once()
+                if sent or failed:
+                    current_app.logger.info(
+                        'Outbox: %d sent, %d failed, depth %s', sent, failed,
+                        outbox_depth())
+                    continue
+                db.session.remove()
+                if once:
+                    break
+                time.sleep(poll_interval)
+        finally:
+            self.close()
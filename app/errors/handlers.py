@@ -2,6 +2,7 @@ from flask import render_template, request
 from app import db
 from app.errors import bp
 from app.api.errors import error_response as api_error_response
+from app.passwords import PasswordHasherBusy
 
 
 def wants_json_response():
@@ -22,3 +23,13 @@ def internal_error(error):
     if wants_json_response():
         return api_error_response(500)
     return render_template('errors/500.html'), 500
+
+
+@bp.app_errorhandler(PasswordHasherBusy)
+def password_hasher_busy(error):
+    db.session.rollback()
+    if wants_json_response():
+        response = api_error_response(503, 'too many sign-ins, try again')
+    else:
+        response = render_template('errors/503.html'), 503
+    return response + ({'Retry-After': '1'},)
@@ -0,0 +1,86 @@
+"""Streaming NDJSON export of the recipe catalogue.
+
+Rows are read in keyset chunks of ``chunk_size`` (one buffered query per
+chunk, continuing after the last (timestamp, id) seen), serialized one
+JSON document per line and detached from the session before the next
+chunk is fetched, so memory use does not grow with the size of the
+catalogue. A server-side cursor (``yield_per``) would not do: the
+selectin loads of each chunk run on the same connection, and unbuffered
+drivers such as PyMySQL discard the rest of a streamed result when the
+connection is used for another statement.
+"""
+from datetime import datetime, timezone
+import json
+import sqlalchemy as sa
+import sqlalchemy.orm as so
+from app import db
+from app.models import Recipe
+
+EXPORT_FIELDS = ('id', 'title', 'description', 'ingredients', 'instructions',
+                 'prep_time', 'cook_time', 'total_time', 'servings',
+                 'difficulty', 'category', 'image_url', 'timestamp',
+                 'language', 'average_rating', 'rating_count', 'author')
+
+
+def parse_fields(value):
+    """Parse a comma separated field list; raises ValueError if unknown."""
+    if not value:
+        return None
+    fields = [field.strip() for field in value.split(',') if field.strip()]
+    unknown = set(fields) - set(EXPORT_FIELDS)
+    if unknown:
+        raise ValueError('unknown fields: ' + ', '.join(sorted(unknown)))
+    return fields
+
+
+def parse_since(value):
+    """Parse an ISO 8601 timestamp; raises ValueError if invalid."""
+    if not value:
+        return None
+    since = datetime.fromisoformat(value)
+    if since.tzinfo is not None:
+        since = since.astimezone(timezone.utc).replace(tzinfo=None)
+    return since
+
+
+EXPORT_KEYS = (Recipe.timestamp, Recipe.id)
+
+
+def export_query(since=None, include_author=False):
+    query = sa.select(Recipe).order_by(*EXPORT_KEYS).options(
+        so.selectinload(Recipe.ingredient_items))
+    if since is not None:
+        query = query.where(Recipe.timestamp > since)
+    if include_author:
+        query = query.options(so.selectinload(Recipe.author))
+    return query
+
+
+def export_recipes(since=None, fields=None, chunk_size=500):
+    """Yield the selected recipes as newline-terminated JSON documents."""
+    include_author = fields is not None and 'author' in fields
+    query = export_query(since, include_author).limit(chunk_size)
+    last = None
+    while True:
+        chunk_query = query
+        if last is not None:
+            chunk_query = query.where(
+                Recipe._keyset_after(EXPORT_KEYS, last, False))
+        chunk = db.session.scalars(chunk_query).all()
+        if not chunk:
+            break
+        last = (chunk[-1].timestamp, chunk[-1].id)
+        lines = []
+        for recipe in chunk:
+            data = recipe.to_dict(include_author=include_author)
+            if fields is not None:
+                data = {field: data[field] for field in fields}
+            lines.append(json.dumps(data) + '\n')
+            db.session.expunge(recipe)
+        if include_author:
+            for recipe in chunk:
+                if recipe.author in db.session:
+                    db.session.expunge(recipe.author)
+        yield ''.join(lines)
+        if len(chunk) < chunk_size:
+            break
@@ -0,0 +1,141 @@
+"""Parsing and normalization of recipe ingredient lines.
+
+Ingredients are shown to users exactly as they were entered (amount, unit
+and text), and additionally stored in normalized form: a lowercase,
+singular ingredient name without preparation notes, a numeric quantity
+and a canonical unit. Metric quantities are converted to grams and
+millilitres.
+"""
+import re
+from fractions import Fraction
+from app.search import stem
+
+MAX_NAME_LENGTH = 100
+
+# canonical unit -> (spellings, factor to the canonical unit)
+UNITS = {
+    'g': (('g', 'gr', 'gram', 'grams', 'gramo', 'gramos'), 1),
+    'kg': (('kg', 'kgs', 'kilogram', 'kilograms', 'kilo', 'kilos'), 1000),
+    'mg': (('mg', 'milligram', 'milligrams'), 0.001),
+    'ml': (('ml', 'milliliter', 'milliliters', 'millilitre', 'millilitres'),
+           1),
+    'cl': (('cl', 'centiliter', 'centiliters'), 10),
+    'dl': (('dl', 'deciliter', 'deciliters'), 100),
+    'l': (('l', 'liter', 'liters', 'litre', 'litres', 'litro', 'litros'),
+          1000),
+    'cup': (('c', 'cup', 'cups', 'taza', 'tazas'), 1),
+    'tbsp': (('tbsp', 'tbs', 'tbl', 'tablespoon', 'tablespoons', 'cucharada',
+              'cucharadas'), 1),
+    'tsp': (('tsp', 'teaspoon', 'teaspoons', 'cucharadita', 'cucharaditas'),
+            1),
+    'oz': (('oz', 'ounce', 'ounces'), 1),
+    'lb': (('lb', 'lbs', 'pound', 'pounds'), 1),
+    'pinch': (('pinch', 'pinches', 'pizca', 'pizcas'), 1),
+    'dash': (('dash', 'dashes'), 1),
+    'clove': (('clove', 'cloves', 'diente', 'dientes'), 1),
+    'can': (('can', 'cans', 'tin', 'tins', 'lata', 'latas'), 1),
+    'slice': (('slice', 'slices', 'rebanada', 'rebanadas'), 1),
+    'piece': (('piece', 'pieces', 'pc', 'pcs'), 1),
+    'stick': (('stick', 'sticks'), 1),
+    'sprig': (('sprig', 'sprigs'), 1),
+    'bunch': (('bunch', 'bunches'), 1),
+    'handful': (('handful', 'handfuls'), 1),
+    'package': (('package', 'packages', 'pkg', 'pack', 'packs'), 1),
+}
+
+# metric units are stored in their base unit
+BASE_UNITS = {'kg': 'g', 'mg': 'g', 'cl': 'ml', 'dl': 'ml', 'l': 'ml'}
+
+_SPELLINGS = {spelling: (unit, factor)
+              for unit, (spellings, factor) in UNITS.items()
+              for spelling in spellings}
+
+_VULGAR_FRACTIONS = {'½': '1/2', '⅓': '1/3', '⅔': '2/3', '¼': '1/4',
+                     '¾': '3/4', '⅛': '1/8'}
+
+_QUANTITY = re.compile(r'^\d+([.,]\d+)?$|^\d+/\d+$')
+
+
+def _is_quantity(token):
+    for char, fraction in _VULGAR_FRACTIONS.items():
+        token = token.replace(char, fraction)
+    return bool(_QUANTITY.match(token))
+
+
+def parse_quantity(amount):
+    """Convert an amount such as "2", "1.5", "1 1/2" or "½" to a float."""
+    if not amount:
+        return None
+    for char, fraction in _VULGAR_FRACTIONS.items():
+        amount = amount.replace(char, ' ' + fraction)
+    # ranges such as "2-3" use the lower bound
+    amount = re.split(r'\s*(?:-|–|to)\s*', amount.strip())[0]
+    total = Fraction(0)
+    try:
+        for part in amount.split():
+            total += Fraction(part.replace(',', '.'))
+    except (ValueError, ZeroDivisionError):
+        return None
+    return float(total) if amount.split() else None
+
+
+def canonical_unit(unit):
+    """Return the canonical spelling of a unit, or None if unknown."""
+    if not unit:
+        return None
+    match = _SPELLINGS.get(unit.lower().rstrip('.'))
+    return match[0] if match else None
+
+
+def normalize_name(text):
+    """Reduce ingredient text to a name such as "tomato" or "olive oil"."""
+    text = (text or '').lower()
+    text = re.sub(r'\(.*?\)', ' ', text)
+    # drop preparation notes: "onion, finely chopped"
+    text = text.split(',')[0]
+    words = re.findall(r'[^\W\d_]+', text)
+    return ' '.join(stem(word) for word in words)[:MAX_NAME_LENGTH]
+
+
+def parse_line(line):
+    """Split a free-text line into amount, unit and ingredient.
+
+    "2 cups flour" -> {'amount': '2', 'unit': 'cups', 'ingredient': 'flour'};
+    the unit is only split off when it is a known unit, so "2 large eggs"
+    keeps "large eggs" as the ingredient.
+    """
+    tokens = line.strip().split()
+    amount = []
+    while tokens and _is_quantity(tokens[0]) and len(amount) < 2:
+        amount.append(tokens.pop(0))
+    unit = ''
+    if amount and len(tokens) > 1 and canonical_unit(tokens[0]):
+        unit = tokens.pop(0)
+    return {'amount': ' '.join(amount), 'unit': unit,
+            'ingredient': ' '.join(tokens)}
+
+
+def parse_lines(text):
+    return [parse_line(line) for line in (text or '').splitlines()
+            if line.strip()]
+
+
+def format_line(item):
+    """Inverse of parse_line(), used to fill the edit form."""
+    return ' '.join(part for part in (item.get('amount'), item.get('unit'),
+                                      item.get('ingredient')) if part)
+
+
+def normalize(item):
+    """Return the normalized columns of one ``{'amount', 'unit',
+    'ingredient'}`` dictionary (plain strings are accepted too)."""
+    if not isinstance(item, dict):
+        item = {'amount': '', 'unit': '', 'ingredient': str(item)}
+    quantity = parse_quantity(str(item.get('amount') or ''))
+    unit = canonical_unit(str(item.get('unit') or ''))
+    if unit in BASE_UNITS:
+        if quantity is not None:
+            quantity *= _SPELLINGS[unit][1]
+        unit = BASE_UNITS[unit]
+    return {'name': normalize_name(item.get('ingredient')),
+            'quantity': quantity, 'canonical_unit': unit}
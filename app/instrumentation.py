@@ -0,0 +1,114 @@
+"""Per-request SQL and template timing.
+
+With REQUEST_TIMING set, every request counts the SQL statements it runs
+and the time spent in them and in rendering templates. The totals are sent
+in a Server-Timing header, which browser developer tools show next to the
+request, and logged as one JSON line per request. Requests running more
+statements than their endpoint's budget (QUERY_BUDGETS, else QUERY_BUDGET)
+are logged as warnings, which points at N+1 queries without profiling
+each view.
+
+Statements run by background threads, the CLI or after the response has
+been started (streamed bodies) are not counted.
+"""
+import json
+import time
+from flask import current_app, g, request, has_app_context, \
+    before_render_template, template_rendered
+import sqlalchemy as sa
+from app import db
+
+
+class RequestTiming:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.templates = []  # start times of the templates being rendered
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def server_timing(self):
+        return 'db;dur={:.1f};desc="{} queries", tpl;dur={:.1f}, ' \
+            'total;dur={:.1f}'.format(
+                self.db_time * 1000, self.queries,
+                self.template_time * 1000, self.elapsed() * 1000)
+
+
+def _timing():
+    return g.get('request_timing') if has_app_context() else None
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    if context is not None:
+        context._timing_start = time.perf_counter()
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context,
+                         executemany):
+    timing = _timing()
+    start = getattr(context, '_timing_start', None)
+    if timing is not None and start is not None:
+        timing.queries += 1
+        timing.db_time += time.perf_counter() - start
+
+
+def start_template(sender, template, context, **extra):
+    timing = _timing()
+    if timing is not None:
+        timing.templates.append(time.perf_counter())
+
+
+def end_template(sender, template, context, **extra):
+    timing = _timing()
+    if timing is not None and timing.templates:
+        start = timing.templates.pop()
+        if not timing.templates:  # nested renders are part of the outer one
+            timing.template_time += time.perf_counter() - start
+
+
+def start_request():
+    g.request_timing = RequestTiming()
+
+
+def finish_request(response):
+    timing = _timing()
+    if timing is None:
+        return response
+    response.headers['Server-Timing'] = timing.server_timing()
+    config = current_app.config
+    budget = config['QUERY_BUDGETS'].get(request.endpoint,
+                                         config['QUERY_BUDGET'])
+    line = {
+        'method': request.method,
+        'path': request.path,
+        'endpoint': request.endpoint,
+        'status': response.status_code,
+        'queries': timing.queries,
+        'db_ms': round(timing.db_time * 1000, 1),
+        'template_ms': round(timing.template_time * 1000, 1),
+        'total_ms': round(timing.elapsed() * 1000, 1),
+    }
+    if timing.queries > budget:
+        line['query_budget'] = budget
+        current_app.logger.warning('request over query budget %s',
+                                   json.dumps(line))
+    else:
+        current_app.logger.info('request %s', json.dumps(line))
+    return response
+
+
+def init_request_timing(app):
+    with app.app_context():
+        for engine in db.engines.values():
+            sa.event.listen(engine, 'before_cursor_execute',
+                            before_cursor_execute)
+            sa.event.listen(engine, 'after_cursor_execute',
+                            after_cursor_execute)
+    before_render_template.connect(start_template, app)
+    template_rendered.connect(end_template, app)
+    app.before_request(start_request)
+    app.after_request(finish_request)
@@ -0,0 +1,171 @@
+"""Language detection of recipes, kept off the request path.
+
+langdetect loads about 50 language profiles the first time it is used,
+which takes a noticeable fraction of a second. warm_up() loads them once;
+under gunicorn it runs in the master process before the workers are
+forked (see gunicorn.conf.py), so every worker shares the warm profiles.
+
+Views hand new or edited recipes to a per-worker LanguageDetector, whose
+single background thread detects the language and stores it after the
+response has been sent. Recipes without a language are backfilled with
+`flask recipes detect-language`, which detects in parallel processes.
+"""
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait
+import threading
+from langdetect import DetectorFactory, detect, LangDetectException
+from langdetect.detector_factory import init_factory
+import sqlalchemy as sa
+from flask import current_app
+from app import db
+from app.models import Recipe
+
+_warm_lock = threading.Lock()
+
+
+def warm_up():
+    """Load the language profiles, if not loaded yet."""
+    with _warm_lock:
+        DetectorFactory.seed = 0  # the same text always gets the same result
+        init_factory()
+
+
+def recipe_text(title, description):
+    return (title or '') + ' ' + (description or '')
+
+
+def detect_language(text):
+    """Return the language code of a text, or '' if it cannot be told."""
+    warm_up()
+    try:
+        return detect(text)[:5]
+    except LangDetectException:
+        return ''
+
+
+def detect_batch(rows):
+    """Detect the languages of ``(id, text)`` pairs; runs in pool processes."""
+    return [(id, detect_language(text)) for id, text in rows]
+
+
+class LanguageDetector:
+    """Per-worker background thread that stores detected recipe languages."""
+
+    def __init__(self, app):
+        self.app = app
+        self.executor = ThreadPoolExecutor(max_workers=1,
+                                           thread_name_prefix='language')
+        self.pending = set()
+        self._lock = threading.Lock()
+        self.executor.submit(warm_up)
+
+    def submit(self, recipe_id, text):
+        future = self.executor.submit(self.run, recipe_id, text)
+        with self._lock:
+            self.pending.add(future)
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future):
+        with self._lock:
+            self.pending.discard(future)
+
+    def run(self, recipe_id, text):
+        language = detect_language(text)
+        with self.app.app_context():
+            try:
+                # an edit made meanwhile reset the language and queued its
+                # own detection, which runs after this one
+                db.session.execute(sa.update(Recipe).where(
+                    Recipe.id == recipe_id, Recipe.language.is_(None))
+                    .values(language=language))
+                db.session.commit()
+            except sa.exc.SQLAlchemyError:
+                db.session.rollback()
+                current_app.logger.warning(
+                    'Could not store the language of recipe %s', recipe_id,
+                    exc_info=True)
+            finally:
+                db.session.remove()
+        return language
+
+    def wait(self, timeout=None):
+        """Block until the queued detections are done."""
+        with self._lock:
+            pending = list(self.pending)
+        wait(pending, timeout)
+
+
+def get_language_detector(app=None):
+    app = app or current_app._get_current_object()
+    detector = app.extensions.get('language_detector')
+    if detector is None:
+        detector = app.extensions.setdefault('language_detector',
+                                             LanguageDetector(app))
+    return detector
+
+
+def detect_recipe_language(recipe):
+    """Queue detection for a committed recipe whose language is None."""
+    if current_app.config['LANGUAGE_DETECTION_ASYNC']:
+        get_language_detector().submit(
+            recipe.id, recipe_text(recipe.title, recipe.description))
+    else:
+        recipe.language = detect_language(
+            recipe_text(recipe.title, recipe.description))
+        db.session.commit()
+
+
+def backfill_languages(chunk_size=500, processes=1, redetect=False,
+                       progress=None):
+    """Detect the language of recipes that have none, in batches.
+
+    With ``processes`` > 1 the batches are detected in that many worker
+    processes while the results of earlier batches are written. With
+    ``redetect`` every recipe is processed. Returns the number of recipes
+    processed.
+    """
+    def batches():
+        last_id = 0
+        while True:
+            query = sa.select(Recipe.id, Recipe.title, Recipe.description) \
+                .where(Recipe.id > last_id).order_by(Recipe.id) \
+                .limit(chunk_size)
+            if not redetect:
+                query = query.where(Recipe.language.is_(None))
+            rows = db.session.execute(query).all()
+            if not rows:
+                return
+            last_id = rows[-1].id
+            yield [(row.id, recipe_text(row.title, row.description))
+                   for row in rows]
+
+    def store(results):
+        db.session.execute(sa.update(Recipe), [
+            {'id': id, 'language': language} for id, language in results])
+        db.session.commit()
+        return len(results)
+
+    count = 0
+    if processes <= 1:
+        for rows in batches():
+            count += store(detect_batch(rows))
+            if progress:
+                progress(count)
+        return count
+    warm_up()  # forked pool processes inherit the profiles
+    with ProcessPoolExecutor(processes) as pool:
+        # keep a couple of batches per process in flight; the reader
+        # pages by id, so it does not wait for earlier batches to be stored
+        in_flight = deque()
+        for rows in batches():
+            in_flight.append(pool.submit(detect_batch, rows))
+            if len(in_flight) >= 2 * processes:
+                count += store(in_flight.popleft().result())
+                if progress:
+                    progress(count)
+        while in_flight:
+            count += store(in_flight.popleft().result())
+            if progress:
+                progress(count)
+    return count
@@ -40,8 +40,7 @@ class ChangePasswordForm(FlaskForm):
         self.user = user
 
     def validate_current_password(self, current_password):
-        from werkzeug.security import check_password_hash
-        if not check_password_hash(self.user.password_hash, current_password.data):
+        if not self.user.check_password(current_password.data):
             raise ValidationError(_('Current password is incorrect.'))
 
 
@@ -55,8 +54,7 @@ class ChangeEmailForm(FlaskForm):
         self.user = user
 
     def validate_password(self, password):
-        from werkzeug.security import check_password_hash
-        if not check_password_hash(self.user.password_hash, password.data):
+        if not self.user.check_password(password.data):
             raise ValidationError(_('Password is incorrect.'))
 
     def validate_new_email(self, new_email):
@@ -0,0 +1,79 @@
+import hashlib
+import sqlalchemy as sa
+from flask import g, render_template
+from markupsafe import Markup
+from app import db
+from app.cache import get_fragment_cache
+from app.models import User
+
+
+class RecipeCard:
+    """Template-ready view of a recipe on a listing page.
+
+    Everything _recipe.html needs is computed up front, so rendering a card
+    never touches the database. The viewer-independent part of the card is
+    rendered once per version and served from the fragment cache.
+    """
+    DESCRIPTION_LENGTH = 120
+
+    def __init__(self, recipe, author):
+        self.id = recipe.id
+        self.title = recipe.title
+        self.category = recipe.category
+        self.image_url = recipe.image_url
+        self.timestamp = recipe.timestamp
+        self.updated_at = recipe.updated_at
+        self.servings = recipe.servings
+        self.difficulty = recipe.difficulty
+        self.prep_time = recipe.formatted_time(recipe.prep_time) \
+            if recipe.prep_time else None
+        self.cook_time = recipe.formatted_time(recipe.cook_time) \
+            if recipe.cook_time else None
+        description = recipe.description or ''
+        if len(description) > self.DESCRIPTION_LENGTH:
+            description = description[:self.DESCRIPTION_LENGTH] + '...'
+        self.description = description
+        self.average_rating = recipe.get_average_rating()
+        self.rating_count = recipe.get_rating_count()
+        self.author_id = author.id
+        self.author_username = author.username
+        self.author_avatar = author.avatar(40)
+
+    def __repr__(self):
+        return '<RecipeCard {}>'.format(self.title)
+
+    def cache_key(self):
+        # updated_at changes on every edit and rating; the author's fields
+        # are part of the key because they are shown on the card too
+        version = '\0'.join([str(self.updated_at), self.author_username,
+                             self.author_avatar, g.get('locale') or ''])
+        return 'card:{}:{}'.format(
+            self.id, hashlib.sha1(version.encode('utf-8')).hexdigest())
+
+    def fragment(self):
+        """Return the cached HTML of the shared part of the card."""
+        cache = get_fragment_cache()
+        key = self.cache_key()
+        html = cache.get(key)
+        if html is None:
+            html = render_template('_recipe_card.html', recipe=self)
+            cache.set(key, html)
+        return Markup(html)
+
+
+def recipe_cards(recipes):
+    """Build cards for a list of recipes with a single query for authors."""
+    recipes = list(recipes)
+    author_ids = {recipe.user_id for recipe in recipes}
+    authors = {}
+    if author_ids:
+        authors = {user.id: user for user in db.session.scalars(
+            sa.select(User).where(User.id.in_(author_ids)))}
+    return [RecipeCard(recipe, authors[recipe.user_id]) for recipe in recipes]
+
+
+def paginate_recipe_cards(query, page, per_page):
+    """Paginate a recipe query and return ``(cards, pagination)``."""
+    recipes = db.paginate(query, page=page, per_page=per_page,
+                          error_out=False)
+    return recipe_cards(recipes.items), recipes
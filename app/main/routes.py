@@ -1,24 +1,33 @@
 from datetime import datetime, timezone
 from flask import render_template, flash, redirect, url_for, request, g, \
-    current_app
+    current_app, abort, Response
 from flask_login import current_user, login_required
 from flask_babel import _, get_locale
 import sqlalchemy as sa
 import json
-from langdetect import detect, LangDetectException
 from app import db
 from app.main.forms import EditProfileForm, EmptyForm, PostForm, RecipeForm, SearchForm, \
     MessageForm, CommentForm, ChangePasswordForm, ChangeEmailForm
 from app.models import User, Post, Recipe, Message, Notification, Rating, Comment
-from app.translate import translate
+from app.translate import translate, translate_batch, TranslationError, \
+    get_translation_cache
+from app.email import outbox_depth
+from app.activity import record_activity
+from app.cache import get_fragment_cache
+from app.passwords import get_password_hasher
+from app.pool import pool_stats
+from app.ingredients import parse_lines, format_line
+from app.pantry import find_by_ingredients, parse_terms
+from app.notifications import stream_notifications, TooManyStreams
+from app.language import detect_recipe_language
 from app.main import bp
+from app.main.listing import recipe_cards, paginate_recipe_cards
 
 
 @bp.before_app_request
 def before_request():
     if current_user.is_authenticated:
-        current_user.last_seen = datetime.now(timezone.utc)
-        db.session.commit()
+        record_activity(current_user.id)
         g.search_form = SearchForm()
     g.locale = str(get_locale())
 
@@ -29,15 +38,14 @@ def before_request():
 def index():
     page = request.args.get('page', 1, type=int)
     query = sa.select(Recipe).order_by(Recipe.timestamp.desc())
-    recipes = db.paginate(query, page=page,
-                         per_page=current_app.config['POSTS_PER_PAGE'],
-                         error_out=False)
+    cards, recipes = paginate_recipe_cards(
+        query, page, current_app.config['POSTS_PER_PAGE'])
     next_url = url_for('main.index', page=recipes.next_num) \
         if recipes.has_next else None
     prev_url = url_for('main.index', page=recipes.prev_num) \
         if recipes.has_prev else None
     return render_template('index.html', title=_('All Recipes'),
-                           recipes=recipes.items, next_url=next_url,
+                           recipes=cards, next_url=next_url,
                            prev_url=prev_url)
 
 
@@ -45,15 +53,15 @@ def index():
 @login_required
 def following():
     page = request.args.get('page', 1, type=int)
-    recipes = db.paginate(current_user.following_recipes(), page=page,
-                         per_page=current_app.config['POSTS_PER_PAGE'],
-                         error_out=False)
+    cards, recipes = paginate_recipe_cards(
+        current_user.following_recipes(), page,
+        current_app.config['POSTS_PER_PAGE'])
     next_url = url_for('main.following', page=recipes.next_num) \
         if recipes.has_next else None
     prev_url = url_for('main.following', page=recipes.prev_num) \
         if recipes.has_prev else None
     return render_template('index.html', title=_('Following'),
-                           recipes=recipes.items, next_url=next_url,
+                           recipes=cards, next_url=next_url,
                            prev_url=prev_url)
 
 
@@ -64,35 +72,7 @@ def following():
 def share_recipe():
     form = RecipeForm()
     if form.validate_on_submit():
-        try:
-            language = detect(form.title.data + ' ' + form.description.data)
-        except LangDetectException:
-            language = ''
-        # Parse ingredients text into structured format
-        ingredients_list = []
-        for line in form.ingredients.data.strip().split('\n'):
-            line = line.strip()
-            if line:
-                # Try to parse "amount unit ingredient" format
-                parts = line.split(' ', 2)
-                if len(parts) >= 3:
-                    ingredients_list.append({
-                        'amount': parts[0],
-                        'unit': parts[1],
-                        'ingredient': parts[2]
-                    })
-                elif len(parts) == 2:
-                    ingredients_list.append({
-                        'amount': parts[0],
-                        'unit': '',
-                        'ingredient': parts[1]
-                    })
-                else:
-                    ingredients_list.append({
-                        'amount': '',
-                        'unit': '',
-                        'ingredient': line
-                    })
+        ingredients_list = parse_lines(form.ingredients.data)
         
         recipe = Recipe(
             title=form.title.data,
@@ -105,11 +85,11 @@ def share_recipe():
             difficulty=form.difficulty.data,
             category=form.category.data,
             image_url=form.image_url.data,
-            author=current_user,
-            language=language
+            author=current_user
         )
         db.session.add(recipe)
         db.session.commit()
+        detect_recipe_language(recipe)
         flash(_('Your recipe has been shared!'))
         return redirect(url_for('main.index'))
     return render_template('share_recipe.html', title=_('Share Recipe'), form=form)
@@ -157,6 +137,7 @@ def rate_recipe(id):
     
     if existing_rating:
         # Update existing rating
+        recipe.update_rating_stats(existing_rating.rating, rating_value)
         existing_rating.rating = rating_value
         existing_rating.timestamp = datetime.now(timezone.utc)
         flash(_('Your rating has been updated!'))
@@ -164,6 +145,7 @@ def rate_recipe(id):
         # Create new rating
         rating = Rating(rating=rating_value, user=current_user, recipe=recipe)
         db.session.add(rating)
+        recipe.update_rating_stats(new_rating=rating_value)
         flash(_('Thank you for rating this recipe!'))
     
     db.session.commit()
@@ -181,36 +163,10 @@ def edit_recipe(id):
     
     form = RecipeForm()
     if form.validate_on_submit():
-        try:
-            language = detect(form.title.data + ' ' + form.description.data)
-        except LangDetectException:
-            language = ''
-        
-        # Parse ingredients text into structured format
-        ingredients_list = []
-        for line in form.ingredients.data.strip().split('\n'):
-            line = line.strip()
-            if line:
-                # Try to parse "amount unit ingredient" format
-                parts = line.split(' ', 2)
-                if len(parts) >= 3:
-                    ingredients_list.append({
-                        'amount': parts[0],
-                        'unit': parts[1],
-                        'ingredient': parts[2]
-                    })
-                elif len(parts) == 2:
-                    ingredients_list.append({
-                        'amount': parts[0],
-                        'unit': '',
-                        'ingredient': parts[1]
-                    })
-                else:
-                    ingredients_list.append({
-                        'amount': '',
-                        'unit': '',
-                        'ingredient': line
-                    })
+        ingredients_list = parse_lines(form.ingredients.data)
+        # the language only depends on the title and description
+        redetect = (recipe.title, recipe.description) != \
+            (form.title.data, form.description.data)
         
         # Update recipe fields
         recipe.title = form.title.data
@@ -223,25 +179,20 @@ def edit_recipe(id):
         recipe.difficulty = form.difficulty.data
         recipe.category = form.category.data
         recipe.image_url = form.image_url.data
-        recipe.language = language
+        if redetect:
+            recipe.language = None
         
         db.session.commit()
+        if redetect:
+            detect_recipe_language(recipe)
         flash(_('Your recipe has been updated!'))
         return redirect(url_for('main.recipe_detail', id=id))
     elif request.method == 'GET':
         # Pre-populate form with existing recipe data
         form.title.data = recipe.title
         form.description.data = recipe.description
-        # Convert ingredients back to text format for editing
-        ingredients_text = []
-        for ingredient in recipe.get_ingredients_list():
-            if ingredient.get('amount') and ingredient.get('unit'):
-                ingredients_text.append(f"{ingredient['amount']} {ingredient['unit']} {ingredient.get('ingredient', '')}")
-            elif ingredient.get('amount'):
-                ingredients_text.append(f"{ingredient['amount']} {ingredient.get('ingredient', '')}")
-            else:
-                ingredients_text.append(ingredient.get('ingredient', ''))
-        form.ingredients.data = '\n'.join(ingredients_text)
+        form.ingredients.data = '\n'.join(
+            format_line(item) for item in recipe.get_ingredients_list())
         form.instructions.data = recipe.instructions
         form.prep_time.data = recipe.prep_time
         form.cook_time.data = recipe.cook_time
@@ -275,15 +226,14 @@ def user(username):
     user = db.first_or_404(sa.select(User).where(User.username == username))
     page = request.args.get('page', 1, type=int)
     query = user.recipes.select().order_by(Recipe.timestamp.desc())
-    recipes = db.paginate(query, page=page,
-                         per_page=current_app.config['POSTS_PER_PAGE'],
-                         error_out=False)
+    cards, recipes = paginate_recipe_cards(
+        query, page, current_app.config['POSTS_PER_PAGE'])
     next_url = url_for('main.user', username=user.username,
                        page=recipes.next_num) if recipes.has_next else None
     prev_url = url_for('main.user', username=user.username,
                        page=recipes.prev_num) if recipes.has_prev else None
     form = EmptyForm()
-    return render_template('user.html', user=user, recipes=recipes.items,
+    return render_template('user.html', user=user, recipes=cards,
                            next_url=next_url, prev_url=prev_url, form=form)
 
 
@@ -312,7 +262,6 @@ def edit_profile():
     
     # Handle password change
     if password_form.validate_on_submit():
-        from werkzeug.security import generate_password_hash
         current_user.set_password(password_form.new_password.data)
         db.session.commit()
         flash(_('Your password has been changed.'))
@@ -377,10 +326,32 @@ def unfollow(username):
         return redirect(url_for('main.index'))
 
 
+@bp.route('/export_recipes')
+@login_required
+def export_recipes():
+    if current_user.get_task_in_progress('export_recipes'):
+        flash(_('An export task is currently in progress'))
+    else:
+        current_user.launch_task('export_recipes', _('Exporting recipes...'))
+        db.session.commit()
+    return redirect(url_for('main.user', username=current_user.username))
+
+
 @bp.route('/translate', methods=['POST'])
 @login_required
 def translate_text():
     data = request.get_json()
+    if 'texts' in data:
+        texts = data['texts']
+        if not isinstance(texts, list) or len(texts) > \
+                current_app.config['MS_TRANSLATOR_BATCH_SIZE'] or \
+                not all(isinstance(text, str) for text in texts):
+            abort(400)
+        try:
+            return {'texts': translate_batch(texts, data['source_language'],
+                                             data['dest_language'])}
+        except TranslationError as e:
+            return {'error': str(e)}, 503
     return {'text': translate(data['text'],
                               data['source_language'],
                               data['dest_language'])}
@@ -394,34 +365,41 @@ def search():
     page = request.args.get('page', 1, type=int)
     search_query = g.search_form.q.data
     
-    # Try Elasticsearch search first
-    recipes, total = Recipe.search(search_query, page, current_app.config['POSTS_PER_PAGE'])
-    
-    # If no results from Elasticsearch (likely not configured), fall back to database search
-    if total == 0:
-        # Simple database search across recipe fields (case-insensitive)
-        search_filter = sa.or_(
-            Recipe.title.ilike(f'%{search_query}%'),
-            Recipe.description.ilike(f'%{search_query}%'),
-            Recipe.instructions.ilike(f'%{search_query}%'),
-            Recipe.ingredients.ilike(f'%{search_query}%'),
-            Recipe.category.ilike(f'%{search_query}%')
-        )
-        query = sa.select(Recipe).where(search_filter).order_by(Recipe.timestamp.desc())
-        recipes_paginated = db.paginate(query, page=page,
-                                       per_page=current_app.config['POSTS_PER_PAGE'],
-                                       error_out=False)
-        recipes = recipes_paginated.items
-        total = recipes_paginated.total
-    
+    recipes, total = Recipe.search(search_query, page,
+                                   current_app.config['POSTS_PER_PAGE'])
     next_url = url_for('main.search', q=search_query, page=page + 1) \
         if total > page * current_app.config['POSTS_PER_PAGE'] else None
     prev_url = url_for('main.search', q=search_query, page=page - 1) \
         if page > 1 else None
-    return render_template('search.html', title=_('Search Results'), recipes=recipes,
+    return render_template('search.html', title=_('Search Results'),
+                           recipes=recipe_cards(recipes),
                            next_url=next_url, prev_url=prev_url)
 
 
+@bp.route('/cook')
+@login_required
+def cook():
+    """What can I cook? Recipes ranked by the ingredients the user has"""
+    have = request.args.get('have', '')
+    exclude = request.args.get('exclude', '')
+    page = request.args.get('page', 1, type=int)
+    per_page = current_app.config['POSTS_PER_PAGE']
+    results, total = [], 0
+    if parse_terms(have):
+        results, total = find_by_ingredients(
+            parse_terms(have), parse_terms(exclude), page, per_page)
+    cards = recipe_cards([recipe for recipe, _match, _missing in results])
+    matches = [(card, match, missing) for card, (_recipe, match, missing)
+               in zip(cards, results)]
+    next_url = url_for('main.cook', have=have, exclude=exclude,
+                       page=page + 1) if total > page * per_page else None
+    prev_url = url_for('main.cook', have=have, exclude=exclude,
+                       page=page - 1) if page > 1 else None
+    return render_template('cook.html', title=_('What can I cook?'),
+                           have=have, exclude=exclude, matches=matches,
+                           total=total, next_url=next_url, prev_url=prev_url)
+
+
 
 
 
@@ -445,6 +423,11 @@ def health_check():
             'status': 'healthy',
             'database': 'connected',
             'redis': redis_status,
+            'email_outbox': outbox_depth().get('queued', 0),
+            'translation_cache': get_translation_cache().stats(),
+            'fragment_cache': get_fragment_cache().stats(),
+            'password_hasher': get_password_hasher().stats(),
+            'db_pool': pool_stats(),
             'timestamp': datetime.now(timezone.utc).isoformat()
         }, 200
     except Exception as e:
@@ -467,3 +450,23 @@ def notifications():
         'data': n.get_data(),
         'timestamp': n.timestamp
     } for n in notifications]
+
+
+@bp.route('/notifications/stream')
+@login_required
+def notification_stream():
+    """Push new notifications as Server-Sent Events"""
+    last_event_id = request.headers.get('Last-Event-ID', type=int) or \
+        request.args.get('last_event_id', 0, type=int)
+    try:
+        events, close = stream_notifications(current_user.id, last_event_id)
+    except TooManyStreams:
+        # EventSource gives up on an error status; the page polls instead
+        return Response(status=503, headers={'Retry-After': '60'})
+    # the generator runs after the request; give the connection back now
+    db.session.remove()
+    response = Response(events, mimetype='text/event-stream')
+    response.call_on_close(close)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # nginx
+    return response
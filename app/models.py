@@ -1,45 +1,160 @@
+import base64
+import binascii
 from datetime import datetime, timezone, timedelta
 from hashlib import md5
 import json
 import secrets
 from time import time
 from typing import Optional
+from uuid import uuid4
 import sqlalchemy as sa
 import sqlalchemy.orm as so
+from sqlalchemy.dialects import mysql
 from flask import current_app, url_for
 from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
 import jwt
 # Redis and RQ disabled for local deployment (removed from original tutorial)
 from app import db, login
-# Search functions disabled for local deployment - using database LIKE queries instead
+from app.search import index_documents, remove_ids_from_index, \
+    remove_stale_from_index, recount_index, query_index
+from app.ingredients import normalize, normalize_name, parse_lines
+from app.passwords import get_password_hasher
+
+# Microsecond precision on MySQL, so that two changes within one second
+# still produce different HTTP validators
+PreciseDateTime = sa.DateTime().with_variant(mysql.DATETIME(fsp=6), 'mysql',
+                                             'mariadb')
+
+# Total time (prep + cook) buckets for browsing: (upper bound in minutes,
+# exclusive, or None for the last bucket; name)
+TIME_BUCKETS = ((15, 'under-15'), (30, '15-30'), (60, '30-60'),
+                (120, '60-120'), (None, 'over-120'))
+
+
+def time_bucket(minutes):
+    """Return the bucket name for a total time, or None if unknown"""
+    if not minutes:
+        return None
+    for limit, name in TIME_BUCKETS:
+        if limit is None or minutes < limit:
+            return name
 
 
 class SearchableMixin:
     @classmethod
     def search(cls, expression, page, per_page):
-        # Search disabled for local deployment - use database LIKE queries instead
-        # This is handled in the routes directly (replaces Elasticsearch from original tutorial)
-        return [], 0
+        ids, total = query_index(cls.__tablename__, expression, page,
+                                 per_page)
+        if not ids:
+            return [], total
+        when = {id: i for i, id in enumerate(ids)}
+        query = sa.select(cls).where(cls.id.in_(ids)).order_by(
+            db.case(when, value=cls.id)).options(*cls.search_load_options())
+        return db.session.scalars(query).all(), total
+
+    @classmethod
+    def search_load_options(cls):
+        """Loader options for the relationships search_document() reads."""
+        return []
+
+    def search_document(self):
+        """Text that is tokenized into the search index for this object."""
+        return ' '.join(str(getattr(self, field) or '')
+                        for field in self.__searchable__)
+
+    def _search_fields_changed(self):
+        state = sa.inspect(self)
+        return any(state.attrs[field].history.has_changes()
+                   for field in self.__searchable__)
+
+    @classmethod
+    def before_flush(cls, session, flush_context, instances):
+        # Record changes before the flush resets attribute history; the
+        # index itself is written in before_commit once ids are assigned.
+        changes = session.info.setdefault('_search_changes',
+                                          {'add': [], 'remove': []})
+        for obj in session.new:
+            if isinstance(obj, SearchableMixin):
+                changes['add'].append(obj)
+        for obj in session.dirty:
+            if isinstance(obj, SearchableMixin) and \
+                    obj._search_fields_changed():
+                changes['add'].append(obj)
+        for obj in session.deleted:
+            if isinstance(obj, SearchableMixin):
+                changes['remove'].append((obj.__tablename__, obj.id))
 
     @classmethod
     def before_commit(cls, session):
-        # Search indexing disabled for local deployment
-        pass
+        session.flush()
+        changes = session.info.pop('_search_changes', None)
+        if not changes:
+            return
+        removed = set(changes['remove'])
+        for index, ids in cls._group(removed).items():
+            remove_ids_from_index(index, ids)
+        added = {}
+        for obj in changes['add']:
+            key = (obj.__tablename__, obj.id)
+            if key not in removed:
+                added[key] = obj
+        for index, models in cls._group(added, values=True).items():
+            index_documents(index, models)
 
     @classmethod
     def after_commit(cls, session):
-        # Search indexing disabled for local deployment
-        pass
+        session.info.pop('_search_changes', None)
 
     @classmethod
-    def reindex(cls):
-        # Search indexing disabled for local deployment
-        pass
+    def after_rollback(cls, session, previous_transaction):
+        session.info.pop('_search_changes', None)
 
+    @staticmethod
+    def _group(keys, values=False):
+        groups = {}
+        for key in keys:
+            groups.setdefault(key[0], []).append(
+                keys[key] if values else key[1])
+        return groups
 
+    @classmethod
+    def reindex(cls, chunk_size=500):
+        """Rebuild the search index for this model.
+
+        Each transaction replaces the documents of one range of ids, so
+        searches keep finding the other objects while the rebuild runs.
+        """
+        index = cls.__tablename__
+        last_id = 0
+        count = 0
+        while True:
+            held = set(db.session.identity_map.keys())
+            models = db.session.scalars(
+                sa.select(cls).where(cls.id > last_id).order_by(cls.id)
+                .limit(chunk_size).options(*cls.search_load_options())).all()
+            high = models[-1].id if models else None
+            remove_stale_from_index(index, last_id, high,
+                                    [model.id for model in models])
+            index_documents(index, models)
+            count += len(models)
+            db.session.commit()
+            # release the chunk, but not the objects the caller holds
+            for model in models:
+                if sa.inspect(model).key not in held:
+                    db.session.expunge(model)
+            if not models:
+                break
+            last_id = high
+        recount_index(index)
+        db.session.commit()
+        return count
+
+
+db.event.listen(db.session, 'before_flush', SearchableMixin.before_flush)
 db.event.listen(db.session, 'before_commit', SearchableMixin.before_commit)
 db.event.listen(db.session, 'after_commit', SearchableMixin.after_commit)
+db.event.listen(db.session, 'after_soft_rollback',
+                SearchableMixin.after_rollback)
 
 
 class PaginatedAPIMixin(object):
@@ -66,6 +181,109 @@ class PaginatedAPIMixin(object):
         }
         return data
 
+    # total_items in cursor mode: 'none' skips counting, 'estimate' counts
+    # at most ESTIMATE_LIMIT rows, 'exact' runs a full COUNT(*)
+    ESTIMATE_LIMIT = 10000
+
+    @staticmethod
+    def encode_cursor(values, direction='next'):
+        values = [value.isoformat() if isinstance(value, datetime) else value
+                  for value in values]
+        raw = json.dumps({'k': values, 'd': direction}).encode('utf-8')
+        return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+    @staticmethod
+    def decode_cursor(cursor, keys):
+        """Return ``(values, direction)`` or ``(None, 'next')`` for an
+        empty cursor. Raises ValueError for a malformed cursor."""
+        if not cursor:
+            return None, 'next'
+        try:
+            raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            data = json.loads(raw)
+            values, direction = data['k'], data['d']
+        except (binascii.Error, ValueError, KeyError, TypeError):
+            raise ValueError('invalid cursor')
+        if len(values) != len(keys) or direction not in ('next', 'prev'):
+            raise ValueError('invalid cursor')
+        decoded = []
+        for key, value in zip(keys, values):
+            try:
+                if isinstance(key.type, sa.DateTime):
+                    value = datetime.fromisoformat(value)
+                elif isinstance(key.type, sa.Integer):
+                    value = int(value)
+            except (ValueError, TypeError):
+                raise ValueError('invalid cursor')
+            decoded.append(value)
+        return decoded, direction
+
+    @staticmethod
+    def _keyset_after(keys, values, descending):
+        # (k1, k2, ...) > (v1, v2, ...) spelled out so every database can
+        # use the index on the leading key
+        clauses = []
+        for i, (key, value) in enumerate(zip(keys, values)):
+            step = key < value if descending else key > value
+            clauses.append(sa.and_(*[k == v for k, v in
+                                     zip(keys[:i], values[:i])], step))
+        return sa.or_(*clauses)
+
+    @classmethod
+    def to_cursor_collection_dict(cls, query, keys, cursor, per_page,
+                                  endpoint, descending=True, total='none',
+                                  **kwargs):
+        """Keyset-paginated variant of to_collection_dict().
+
+        ``keys`` are the columns that uniquely order the collection, for
+        example ``(Recipe.timestamp, Recipe.id)``. Pages are addressed by
+        opaque cursors, so no OFFSET scan is needed, and counting the
+        total is optional.
+        """
+        values, direction = cls.decode_cursor(cursor, keys)
+        backwards = direction == 'prev'
+        order_desc = descending != backwards
+        page_query = query.order_by(None).order_by(
+            *[key.desc() if order_desc else key.asc() for key in keys])
+        if values is not None:
+            page_query = page_query.where(
+                cls._keyset_after(keys, values, order_desc))
+        items = db.session.scalars(page_query.limit(per_page + 1)).all()
+        has_more = len(items) > per_page
+        items = items[:per_page]
+        if backwards:
+            items.reverse()
+        has_next = has_more if not backwards else values is not None
+        has_prev = has_more if backwards else values is not None
+
+        def link(item, link_direction):
+            key_values = [getattr(item, key.key) for key in keys]
+            return url_for(endpoint, cursor=cls.encode_cursor(
+                key_values, link_direction), per_page=per_page, total=total,
+                **kwargs)
+
+        meta = {'per_page': per_page}
+        if total == 'exact':
+            meta['total_items'] = db.session.scalar(sa.select(
+                sa.func.count()).select_from(query.order_by(None).subquery()))
+        elif total == 'estimate':
+            counted = db.session.scalar(sa.select(sa.func.count()).select_from(
+                query.order_by(None).limit(cls.ESTIMATE_LIMIT).subquery()))
+            meta['total_items'] = counted
+            meta['total_items_is_estimate'] = counted >= cls.ESTIMATE_LIMIT
+        return {
+            'items': [item.to_dict() for item in items],
+            '_meta': meta,
+            '_links': {
+                'self': url_for(endpoint, cursor=cursor, per_page=per_page,
+                                total=total, **kwargs),
+                'next': link(items[-1], 'next')
+                if items and has_next else None,
+                'prev': link(items[0], 'prev')
+                if items and has_prev else None
+            }
+        }
+
 
 followers = sa.Table(
     'followers',
@@ -77,6 +295,22 @@ followers = sa.Table(
 )
 
 
+# Materialized home timeline: one row per (reader, recipe), written when a
+# recipe is published (fan-out on write) and when a reader follows someone
+timeline = sa.Table(
+    'timeline',
+    db.metadata,
+    sa.Column('user_id', sa.Integer, sa.ForeignKey('user.id'),
+              primary_key=True),
+    sa.Column('recipe_id', sa.Integer, sa.ForeignKey('recipe.id'),
+              primary_key=True, index=True),
+    sa.Column('author_id', sa.Integer, sa.ForeignKey('user.id'),
+              nullable=False, index=True),
+    sa.Column('timestamp', sa.DateTime, nullable=False),
+    sa.Index('ix_timeline_user_id_timestamp', 'user_id', 'timestamp')
+)
+
+
 class User(PaginatedAPIMixin, UserMixin, db.Model):
     id: so.Mapped[int] = so.mapped_column(primary_key=True)
     username: so.Mapped[str] = so.mapped_column(sa.String(64), index=True,
@@ -90,6 +324,23 @@ class User(PaginatedAPIMixin, UserMixin, db.Model):
     token: so.Mapped[Optional[str]] = so.mapped_column(
         sa.String(32), index=True, unique=True)
     token_expiration: so.Mapped[Optional[datetime]]
+    # Recipes of authors in pull mode are not fanned out to followers'
+    # timelines but merged in when the Following feed is read
+    timeline_pull: so.Mapped[bool] = so.mapped_column(
+        default=False, server_default=sa.false())
+    # Bumped by every UPDATE of the row; used for HTTP validators
+    updated_at: so.Mapped[datetime] = so.mapped_column(
+        PreciseDateTime, index=True,
+        default=lambda: datetime.now(timezone.utc),
+        onupdate=lambda: datetime.now(timezone.utc))
+    # Denormalized counters, kept in step by follow(), unfollow() and the
+    # Recipe mapper events; `flask users reconcile-counters` repairs drift
+    recipe_total: so.Mapped[int] = so.mapped_column(
+        default=0, server_default='0')
+    follower_total: so.Mapped[int] = so.mapped_column(
+        default=0, server_default='0')
+    following_total: so.Mapped[int] = so.mapped_column(
+        default=0, server_default='0')
 
     recipes: so.WriteOnlyMapped['Recipe'] = so.relationship(
         back_populates='author')
@@ -120,10 +371,20 @@ class User(PaginatedAPIMixin, UserMixin, db.Model):
         return '<User {}>'.format(self.username)
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = get_password_hasher().hash(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        """Verify a password, upgrading its hash if the cost has changed.
+
+        A replaced hash is left in the session for the caller to commit.
+        Raises PasswordHasherBusy if the worker's hashing queue is full.
+        """
+        hasher = get_password_hasher()
+        if not hasher.verify(self.password_hash, password):
+            return False
+        if hasher.needs_rehash(self.password_hash):
+            self.password_hash = hasher.hash(password)
+        return True
 
     def avatar(self, size):
         digest = md5(self.email.lower().encode('utf-8')).hexdigest()
@@ -132,38 +393,75 @@ class User(PaginatedAPIMixin, UserMixin, db.Model):
     def follow(self, user):
         if not self.is_following(user):
             self.following.add(user)
+            self._update_follow_counters(user, 1)
+            self.backfill_timeline(user)
 
     def unfollow(self, user):
         if self.is_following(user):
             self.following.remove(user)
+            self._update_follow_counters(user, -1)
+            db.session.execute(timeline.delete().where(
+                timeline.c.user_id == self.id,
+                timeline.c.author_id == user.id))
+
+    def _update_follow_counters(self, user, delta):
+        db.session.execute(sa.update(User).where(User.id == self.id).values(
+            following_total=User.following_total + delta))
+        db.session.execute(sa.update(User).where(User.id == user.id).values(
+            follower_total=User.follower_total + delta))
+
+    def backfill_timeline(self, user):
+        """Copy the recipes of a newly followed user into our timeline.
+
+        Authors with more recipes than TIMELINE_BACKFILL_LIMIT are switched
+        to pull mode instead: their entries are removed from every timeline
+        and their recipes are merged in at read time.
+        """
+        if user.timeline_pull:
+            return
+        if user.recipes_count() > current_app.config['TIMELINE_BACKFILL_LIMIT']:
+            user.timeline_pull = True
+            db.session.execute(timeline.delete().where(
+                timeline.c.author_id == user.id,
+                timeline.c.user_id != user.id))
+            return
+        db.session.execute(timeline.insert().from_select(
+            ['user_id', 'recipe_id', 'author_id', 'timestamp'],
+            sa.select(sa.literal(self.id), Recipe.id, Recipe.user_id,
+                      Recipe.timestamp).where(Recipe.user_id == user.id)))
 
     def is_following(self, user):
         query = self.following.select().where(User.id == user.id)
         return db.session.scalar(query) is not None
 
     def followers_count(self):
-        query = sa.select(sa.func.count()).select_from(
-            self.followers.select().subquery())
-        return db.session.scalar(query)
+        return self.follower_total or 0
 
     def following_count(self):
-        query = sa.select(sa.func.count()).select_from(
-            self.following.select().subquery())
-        return db.session.scalar(query)
+        return self.following_total or 0
 
     def following_recipes(self):
-        Author = so.aliased(User)
-        Follower = so.aliased(User)
+        pull_authors = (
+            sa.select(followers.c.followed_id)
+            .join(User, User.id == followers.c.followed_id)
+            .where(followers.c.follower_id == self.id, User.timeline_pull)
+        )
+        pushed = sa.select(timeline.c.recipe_id).where(
+            timeline.c.user_id == self.id)
+        if db.session.scalar(sa.select(pull_authors.exists())):
+            return (
+                sa.select(Recipe)
+                .where(sa.or_(
+                    Recipe.id.in_(pushed),
+                    Recipe.user_id.in_(pull_authors),
+                ))
+                .order_by(Recipe.timestamp.desc())
+            )
         return (
             sa.select(Recipe)
-            .join(Recipe.author.of_type(Author))
-            .join(Author.followers.of_type(Follower), isouter=True)
-            .where(sa.or_(
-                Follower.id == self.id,
-                Author.id == self.id,
-            ))
-            .group_by(Recipe)
-            .order_by(Recipe.timestamp.desc())
+            .join(timeline, timeline.c.recipe_id == Recipe.id)
+            .where(timeline.c.user_id == self.id)
+            .order_by(timeline.c.timestamp.desc())
         )
 
     def following_posts(self):
@@ -193,10 +491,11 @@ class User(PaginatedAPIMixin, UserMixin, db.Model):
         return n
 
     def launch_task(self, name, description, *args, **kwargs):
-        # Task system disabled for local deployment
-        # Return a dummy task for compatibility
-        task = Task(id=f"local-{name}-{self.id}", name=name, description=description,
-                    user=self, complete=True)
+        # Queued in the database and picked up by `flask worker`
+        task = Task(id=str(uuid4()), name=name, description=description,
+                    user=self, args_json=json.dumps({'args': args,
+                                                     'kwargs': kwargs}),
+                    max_attempts=current_app.config['TASK_MAX_ATTEMPTS'])
         db.session.add(task)
         return task
 
@@ -210,9 +509,7 @@ class User(PaginatedAPIMixin, UserMixin, db.Model):
         return db.session.scalar(query)
 
     def recipes_count(self):
-        query = sa.select(sa.func.count()).select_from(
-            self.recipes.select().subquery())
-        return db.session.scalar(query)
+        return self.recipe_total or 0
 
     def posts_count(self):
         """Backward compatibility - returns recipe count"""
@@ -248,6 +545,8 @@ class User(PaginatedAPIMixin, UserMixin, db.Model):
             self.set_password(data['password'])
 
     def get_token(self, expires_in=3600):
+        if current_app.config['API_TOKEN_FORMAT'] == 'signed':
+            return self.get_signed_token(expires_in)
         now = datetime.now(timezone.utc)
         if self.token and self.token_expiration.replace(
                 tzinfo=timezone.utc) > now + timedelta(seconds=60):
@@ -261,6 +560,59 @@ class User(PaginatedAPIMixin, UserMixin, db.Model):
         self.token_expiration = datetime.now(timezone.utc) - timedelta(
             seconds=1)
 
+    @staticmethod
+    def reconcile_counters(chunk_size=1000):
+        """Recount the denormalized counters of all users.
+
+        Users are processed in chunks of ``chunk_size`` ids, each chunk in
+        its own transaction, and only rows that drifted are written.
+        Returns the number of users that were corrected.
+        """
+        corrected = 0
+        last_id = 0
+        while True:
+            rows = db.session.execute(
+                sa.select(User.id, User.recipe_total, User.follower_total,
+                          User.following_total)
+                .where(User.id > last_id)
+                .order_by(User.id).limit(chunk_size)).all()
+            if not rows:
+                break
+            ids = [row.id for row in rows]
+            recipes = dict(db.session.execute(
+                sa.select(Recipe.user_id, sa.func.count())
+                .where(Recipe.user_id.in_(ids))
+                .group_by(Recipe.user_id)).all())
+            follower_counts = dict(db.session.execute(
+                sa.select(followers.c.followed_id, sa.func.count())
+                .where(followers.c.followed_id.in_(ids))
+                .group_by(followers.c.followed_id)).all())
+            following_counts = dict(db.session.execute(
+                sa.select(followers.c.follower_id, sa.func.count())
+                .where(followers.c.follower_id.in_(ids))
+                .group_by(followers.c.follower_id)).all())
+            params = []
+            for row in rows:
+                values = {'recipe_total': recipes.get(row.id, 0),
+                          'follower_total': follower_counts.get(row.id, 0),
+                          'following_total': following_counts.get(row.id, 0)}
+                if any(getattr(row, key) != value
+                       for key, value in values.items()):
+                    params.append(dict(values, id=row.id))
+            if params:
+                db.session.execute(sa.update(User), params)
+            db.session.commit()
+            corrected += len(params)
+            last_id = ids[-1]
+        return corrected
+
+    def get_signed_token(self, expires_in=3600):
+        """Return an API token that can be verified without a query."""
+        return jwt.encode(
+            {'api_token': self.id, 'jti': secrets.token_hex(8),
+             'exp': int(time()) + expires_in},
+            current_app.config['SECRET_KEY'], algorithm='HS256')
+
     @staticmethod
     def check_token(token):
         user = db.session.scalar(sa.select(User).where(User.token == token))
@@ -276,29 +628,63 @@ def load_user(id):
 
 
 class Recipe(SearchableMixin, PaginatedAPIMixin, db.Model):
-    __searchable__ = ['title', 'description', 'ingredients', 'instructions']
+    __searchable__ = ['title', 'description', 'ingredients', 'instructions',
+                      'category']
     id: so.Mapped[int] = so.mapped_column(primary_key=True)
     title: so.Mapped[str] = so.mapped_column(sa.String(100), index=True)
     description: so.Mapped[Optional[str]] = so.mapped_column(sa.Text)
-    ingredients: so.Mapped[str] = so.mapped_column(sa.Text)  # JSON string for structured ingredients
+    ingredients: so.Mapped[str] = so.mapped_column(sa.Text)  # JSON string for structured ingredients, mirrored in ingredient_items
     instructions: so.Mapped[str] = so.mapped_column(sa.Text)
     prep_time: so.Mapped[Optional[int]] = so.mapped_column(sa.Integer)  # in minutes
     cook_time: so.Mapped[Optional[int]] = so.mapped_column(sa.Integer)  # in minutes
     servings: so.Mapped[Optional[int]] = so.mapped_column(sa.Integer)
-    difficulty: so.Mapped[Optional[str]] = so.mapped_column(sa.String(20))  # Easy, Medium, Hard
-    category: so.Mapped[Optional[str]] = so.mapped_column(sa.String(50))  # Breakfast, Lunch, Dinner, Dessert, etc.
+    difficulty: so.Mapped[Optional[str]] = so.mapped_column(sa.String(20), active_history=True)  # Easy, Medium, Hard
+    category: so.Mapped[Optional[str]] = so.mapped_column(sa.String(50), active_history=True)  # Breakfast, Lunch, Dinner, Dessert, etc.
+    # derived from prep_time + cook_time by set_time_bucket()
+    time_bucket: so.Mapped[Optional[str]] = so.mapped_column(sa.String(10), active_history=True)
     image_url: so.Mapped[Optional[str]] = so.mapped_column(sa.String(200))
     timestamp: so.Mapped[datetime] = so.mapped_column(
         index=True, default=lambda: datetime.now(timezone.utc))
     user_id: so.Mapped[int] = so.mapped_column(sa.ForeignKey(User.id),
                                                index=True)
     language: so.Mapped[Optional[str]] = so.mapped_column(sa.String(5))
+    # Bumped by every UPDATE of the row, rating changes included; used for
+    # HTTP validators
+    updated_at: so.Mapped[datetime] = so.mapped_column(
+        PreciseDateTime, index=True,
+        default=lambda: datetime.now(timezone.utc),
+        onupdate=lambda: datetime.now(timezone.utc))
+    # Denormalized rating aggregates, kept in step with the rating table by
+    # update_rating_stats() and rebuilt by rebuild_rating_stats()
+    rating_sum: so.Mapped[int] = so.mapped_column(default=0, server_default='0')
+    rating_count: so.Mapped[int] = so.mapped_column(default=0, server_default='0')
+    rating_1: so.Mapped[int] = so.mapped_column(default=0, server_default='0')
+    rating_2: so.Mapped[int] = so.mapped_column(default=0, server_default='0')
+    rating_3: so.Mapped[int] = so.mapped_column(default=0, server_default='0')
+    rating_4: so.Mapped[int] = so.mapped_column(default=0, server_default='0')
+    rating_5: so.Mapped[int] = so.mapped_column(default=0, server_default='0')
+
+    # composite indexes for the filtered, newest-first listings of the API
+    __table_args__ = (
+        sa.Index('ix_recipe_category_timestamp', 'category', 'timestamp'),
+        sa.Index('ix_recipe_difficulty_timestamp', 'difficulty', 'timestamp'),
+        sa.Index('ix_recipe_time_bucket_timestamp', 'time_bucket',
+                 'timestamp'),
+        sa.Index('ix_recipe_user_id_timestamp', 'user_id', 'timestamp'),
+    )
 
     author: so.Mapped[User] = so.relationship(back_populates='recipes')
+    # rebuilt by sync_ingredient_items() whenever ingredients is assigned
+    ingredient_items: so.Mapped[list['RecipeIngredient']] = so.relationship(
+        back_populates='recipe', cascade='all, delete-orphan',
+        order_by='RecipeIngredient.position', passive_deletes=True)
+    # rows are removed by delete_recipe_children() before the recipe
     ratings: so.WriteOnlyMapped['Rating'] = so.relationship(
-        back_populates='recipe', cascade='all, delete-orphan')
+        back_populates='recipe', cascade='all, delete-orphan',
+        passive_deletes=True)
     comments: so.WriteOnlyMapped['Comment'] = so.relationship(
-        back_populates='recipe', cascade='all, delete-orphan')
+        back_populates='recipe', cascade='all, delete-orphan',
+        passive_deletes=True)
 
     def __repr__(self):
         return '<Recipe {}>'.format(self.title)
@@ -309,6 +695,12 @@ class Recipe(SearchableMixin, PaginatedAPIMixin, db.Model):
         cook = self.cook_time or 0
         return prep + cook
 
+    @staticmethod
+    def total_minutes_expression():
+        """SQL version of total_time()"""
+        return sa.func.coalesce(Recipe.prep_time, 0) + \
+            sa.func.coalesce(Recipe.cook_time, 0)
+
     def formatted_time(self, minutes):
         """Format time in minutes to human readable format"""
         if not minutes:
@@ -319,13 +711,27 @@ class Recipe(SearchableMixin, PaginatedAPIMixin, db.Model):
             return f"{hours}h {mins}m" if mins > 0 else f"{hours}h"
         return f"{mins}m"
 
-    def get_ingredients_list(self):
-        """Parse ingredients JSON and return list of ingredient dictionaries"""
+    @staticmethod
+    def parse_ingredients(value):
+        """Parse the ingredients column into a list of ingredient dictionaries"""
         try:
-            return json.loads(self.ingredients) if self.ingredients else []
+            items = json.loads(value) if value else []
         except (json.JSONDecodeError, TypeError):
-            # Fallback for old format (plain text)
-            return [{"amount": "", "unit": "", "ingredient": self.ingredients}] if self.ingredients else []
+            # Fallback for old format (plain text, one ingredient per line)
+            return parse_lines(value)
+        if not isinstance(items, list):
+            return parse_lines(str(items))
+        return items
+
+    def get_ingredients_list(self):
+        """Return the ingredients as a list of dictionaries
+
+        Read from the recipe_ingredient rows; recipes whose rows have not
+        been backfilled yet fall back to the JSON column.
+        """
+        if self.ingredient_items:
+            return [item.to_dict() for item in self.ingredient_items]
+        return self.parse_ingredients(self.ingredients)
 
     def set_ingredients_list(self, ingredients_list):
         """Set ingredients from list of ingredient dictionaries"""
@@ -337,16 +743,133 @@ class Recipe(SearchableMixin, PaginatedAPIMixin, db.Model):
         return " ".join([f"{ing.get('amount', '')} {ing.get('unit', '')} {ing.get('ingredient', '')}".strip()
                         for ing in ingredients_list])
 
+    @classmethod
+    def search_load_options(cls):
+        # search results are serialized with their ingredients as well
+        return [so.selectinload(cls.ingredient_items)]
+
+    def search_document(self):
+        """Index ingredient names rather than the raw ingredients JSON"""
+        names = ' '.join((ing.get('ingredient') or '') if isinstance(
+            ing, dict) else str(ing) for ing in self.get_ingredients_list())
+        return ' '.join([self.title or '', self.description or '', names,
+                         self.instructions or '', self.category or ''])
+
     def get_average_rating(self):
         """Calculate average rating for this recipe"""
-        ratings = db.session.scalars(sa.select(Rating.rating).where(Rating.recipe_id == self.id)).all()
-        if not ratings:
+        if not self.rating_count:
             return 0
-        return round(sum(ratings) / len(ratings), 1)
+        return round(self.rating_sum / self.rating_count, 1)
 
     def get_rating_count(self):
         """Get total number of ratings for this recipe"""
-        return db.session.scalar(sa.select(sa.func.count(Rating.id)).where(Rating.recipe_id == self.id))
+        return self.rating_count or 0
+
+    def get_rating_histogram(self):
+        """Get number of ratings per star value (1-5)"""
+        return {stars: getattr(self, f'rating_{stars}') or 0
+                for stars in range(1, 6)}
+
+    def update_rating_stats(self, old_rating=None, new_rating=None):
+        """Apply a rating change to the aggregates in the current transaction.
+
+        Pass only new_rating for a new rating, only old_rating for a removed
+        one and both when a user changes their rating. The update is issued
+        as ``col = col + delta`` so concurrent raters do not overwrite each
+        other.
+        """
+        values = {}
+        if old_rating is not None:
+            values['rating_sum'] = -old_rating
+            values['rating_count'] = -1
+            values[f'rating_{int(old_rating)}'] = -1
+        if new_rating is not None:
+            values['rating_sum'] = values.get('rating_sum', 0) + new_rating
+            values['rating_count'] = values.get('rating_count', 0) + 1
+            key = f'rating_{int(new_rating)}'
+            values[key] = values.get(key, 0) + 1
+        values = {key: getattr(Recipe, key) + delta
+                  for key, delta in values.items() if delta}
+        if values:
+            db.session.execute(sa.update(Recipe).where(
+                Recipe.id == self.id).values(**values))
+
+    @staticmethod
+    def rebuild_rating_stats(chunk_size=1000):
+        """Recompute rating aggregates for all recipes from the rating table.
+
+        Recipes are processed in chunks of ``chunk_size`` ids, each chunk in
+        its own transaction. Returns the number of recipes processed.
+        """
+        stars = {f'rating_{i}': sa.func.sum(sa.case((Rating.rating == i, 1),
+                                                     else_=0))
+                 for i in range(1, 6)}
+        processed = 0
+        last_id = 0
+        while True:
+            ids = db.session.scalars(
+                sa.select(Recipe.id).where(Recipe.id > last_id)
+                .order_by(Recipe.id).limit(chunk_size)).all()
+            if not ids:
+                break
+            rows = db.session.execute(
+                sa.select(Rating.recipe_id,
+                          sa.func.sum(Rating.rating).label('rating_sum'),
+                          sa.func.count(Rating.id).label('rating_count'),
+                          *[expr.label(key) for key, expr in stars.items()])
+                .where(Rating.recipe_id.in_(ids))
+                .group_by(Rating.recipe_id)).all()
+            stats = {row.recipe_id: row._asdict() for row in rows}
+            empty = dict(rating_sum=0, rating_count=0,
+                         **{key: 0 for key in stars})
+            params = []
+            for recipe_id in ids:
+                values = dict(empty)
+                values.update({key: int(value or 0) for key, value
+                               in stats.get(recipe_id, {}).items()
+                               if key != 'recipe_id'})
+                values['id'] = recipe_id
+                params.append(values)
+            db.session.execute(sa.update(Recipe), params)
+            db.session.commit()
+            processed += len(ids)
+            last_id = ids[-1]
+        return processed
+
+    @staticmethod
+    def has_ingredient(name):
+        """Filter for recipes using an ingredient, served by the name index"""
+        return Recipe.id.in_(sa.select(RecipeIngredient.recipe_id).where(
+            RecipeIngredient.name == normalize_name(name)))
+
+    @staticmethod
+    def backfill_ingredients(chunk_size=500):
+        """Create recipe_ingredient rows for recipes that have none.
+
+        Used after bulk imports, which only write the JSON column. Returns
+        the number of recipes processed.
+        """
+        processed = 0
+        last_id = 0
+        missing = ~sa.select(RecipeIngredient.id).where(
+            RecipeIngredient.recipe_id == Recipe.id).exists()
+        while True:
+            rows = db.session.execute(
+                sa.select(Recipe.id, Recipe.ingredients)
+                .where(Recipe.id > last_id, missing)
+                .order_by(Recipe.id).limit(chunk_size)).all()
+            if not rows:
+                break
+            params = [RecipeIngredient.values(row.id, position, item)
+                      for row in rows for position, item in
+                      enumerate(Recipe.parse_ingredients(row.ingredients))]
+            if params:
+                db.session.execute(sa.insert(RecipeIngredient.__table__),
+                                   params)
+            db.session.commit()
+            processed += len(rows)
+            last_id = rows[-1].id
+        return processed
 
     def get_user_rating(self, user):
         """Get rating given by a specific user for this recipe"""
@@ -367,6 +890,7 @@ class Recipe(SearchableMixin, PaginatedAPIMixin, db.Model):
             'prep_time': self.prep_time,
             'cook_time': self.cook_time,
             'total_time': self.total_time(),
+            'time_bucket': self.time_bucket,
             'servings': self.servings,
             'difficulty': self.difficulty,
             'category': self.category,
@@ -403,6 +927,261 @@ class Recipe(SearchableMixin, PaginatedAPIMixin, db.Model):
             self.user_id = data['user_id']
 
 
+class RecipeIngredient(db.Model):
+    """One ingredient line of a recipe, as entered and normalized."""
+    __tablename__ = 'recipe_ingredient'
+    id: so.Mapped[int] = so.mapped_column(primary_key=True)
+    recipe_id: so.Mapped[int] = so.mapped_column(sa.ForeignKey(Recipe.id),
+                                                 index=True)
+    position: so.Mapped[int] = so.mapped_column(default=0)
+    # as entered
+    amount: so.Mapped[str] = so.mapped_column(sa.String(32), default='')
+    unit: so.Mapped[str] = so.mapped_column(sa.String(32), default='')
+    ingredient: so.Mapped[str] = so.mapped_column(sa.String(200))
+    # normalized, see app/ingredients.py
+    name: so.Mapped[str] = so.mapped_column(sa.String(100))
+    quantity: so.Mapped[Optional[float]]
+    canonical_unit: so.Mapped[Optional[str]] = so.mapped_column(sa.String(16))
+
+    recipe: so.Mapped[Recipe] = so.relationship(
+        back_populates='ingredient_items')
+
+    __table_args__ = (sa.Index('ix_recipe_ingredient_name_recipe_id',
+                               'name', 'recipe_id'),)
+
+    def __repr__(self):
+        return '<RecipeIngredient {}>'.format(self.name)
+
+    @staticmethod
+    def values(recipe_id, position, item):
+        """Column values for one ingredient dictionary (or plain string)"""
+        if not isinstance(item, dict):
+            item = {'ingredient': str(item)}
+        values = {
+            'recipe_id': recipe_id,
+            'position': position,
+            'amount': str(item.get('amount') or '')[:32],
+            'unit': str(item.get('unit') or '')[:32],
+            'ingredient': str(item.get('ingredient') or '')[:200],
+        }
+        values.update(normalize(item))
+        return values
+
+    def to_dict(self):
+        return {'amount': self.amount, 'unit': self.unit,
+                'ingredient': self.ingredient}
+
+
+class RecipeFacet(db.Model):
+    """Number of recipes per (category, difficulty, time_bucket).
+
+    A small cube kept in step with the recipe table by the recipe mapper
+    events, so facet counts for any combination of these filters are a sum
+    over a handful of rows. Missing values are stored as empty strings.
+    """
+    __tablename__ = 'recipe_facet'
+    FACETS = ('category', 'difficulty', 'time_bucket')
+
+    category: so.Mapped[str] = so.mapped_column(sa.String(50),
+                                                primary_key=True)
+    difficulty: so.Mapped[str] = so.mapped_column(sa.String(20),
+                                                  primary_key=True)
+    time_bucket: so.Mapped[str] = so.mapped_column(sa.String(10),
+                                                   primary_key=True)
+    count: so.Mapped[int] = so.mapped_column(default=0)
+
+    def __repr__(self):
+        return '<RecipeFacet {} {} {}: {}>'.format(
+            self.category, self.difficulty, self.time_bucket, self.count)
+
+    @staticmethod
+    def adjust(connection, key, delta):
+        """Add ``delta`` to the count of one (category, difficulty,
+        time_bucket) tuple, creating its row on first use."""
+        key = dict(zip(RecipeFacet.FACETS, (value or '' for value in key)))
+        table = RecipeFacet.__table__
+        where = [table.c[name] == value for name, value in key.items()]
+        result = connection.execute(table.update().where(*where).values(
+            count=table.c.count + delta))
+        if result.rowcount:
+            return
+        try:
+            with connection.begin_nested():
+                connection.execute(table.insert().values(count=delta, **key))
+        except sa.exc.IntegrityError:
+            # created concurrently
+            connection.execute(table.update().where(*where).values(
+                count=table.c.count + delta))
+
+    @staticmethod
+    def rebuild():
+        """Recompute time buckets and the whole cube from the recipe table."""
+        bucket = sa.case(else_=sa.literal(TIME_BUCKETS[-1][1]), *[
+            (Recipe.total_minutes_expression() < limit, name)
+            for limit, name in TIME_BUCKETS[:-1]])
+        db.session.execute(sa.update(Recipe).values(time_bucket=sa.case(
+            (Recipe.total_minutes_expression() > 0, bucket), else_=None)))
+        db.session.execute(sa.delete(RecipeFacet))
+        columns = [sa.func.coalesce(getattr(Recipe, name), '')
+                   for name in RecipeFacet.FACETS]
+        db.session.execute(sa.insert(RecipeFacet).from_select(
+            [*RecipeFacet.FACETS, 'count'],
+            sa.select(*columns, sa.func.count()).group_by(*columns)))
+        db.session.commit()
+
+    @staticmethod
+    def counts(filters, author_id=None):
+        """Return recipe counts per category, difficulty and time bucket.
+
+        ``filters`` maps facet names to selected values. The counts of each
+        facet apply the filters of the other facets only, so they show what
+        selecting another value of that facet would return; ``total``
+        applies all of them. With ``author_id`` the counts are computed
+        from the recipe table through the (user_id, timestamp) index
+        instead of the cube.
+        """
+        if author_id is None:
+            def column(name):
+                return getattr(RecipeFacet, name)
+            number = sa.func.sum(RecipeFacet.count)
+            base = [RecipeFacet.count > 0]
+        else:
+            def column(name):
+                return getattr(Recipe, name)
+            number = sa.func.count()
+            base = [Recipe.user_id == author_id]
+
+        def where(skip=None):
+            return base + [column(name) == value
+                           for name, value in filters.items()
+                           if name != skip]
+
+        result = {}
+        for name in RecipeFacet.FACETS:
+            rows = db.session.execute(
+                sa.select(column(name), number).where(*where(name))
+                .group_by(column(name))).all()
+            result[name] = {value: int(count) for value, count in
+                            sorted(rows, key=lambda row: row[0] or '')
+                            if value and count}
+        query = sa.select(number).where(*where())
+        if author_id is not None:
+            query = query.select_from(Recipe)
+        result['total'] = int(db.session.scalar(query) or 0)
+        return result
+
+
+def sync_ingredient_items(target, value, oldvalue, initiator):
+    """Rebuild the ingredient rows when the ingredients column is set."""
+    items = []
+    for position, item in enumerate(Recipe.parse_ingredients(value)):
+        values = RecipeIngredient.values(None, position, item)
+        del values['recipe_id']
+        items.append(RecipeIngredient(**values))
+    target.ingredient_items = items
+
+
+db.event.listen(Recipe.ingredients, 'set', sync_ingredient_items)
+
+
+def fan_out_recipe(mapper, connection, target):
+    """Push a new recipe into its author's and followers' timelines."""
+    pull = connection.scalar(sa.select(User.timeline_pull).where(
+        User.id == target.user_id))
+    readers = sa.select(sa.literal(target.user_id))
+    if not pull:
+        readers = sa.union(readers, sa.select(followers.c.follower_id).where(
+            followers.c.followed_id == target.user_id))
+    readers = readers.subquery()
+    connection.execute(timeline.insert().from_select(
+        ['user_id', 'recipe_id', 'author_id', 'timestamp'],
+        sa.select(readers.c[0], sa.literal(target.id),
+                  sa.literal(target.user_id),
+                  sa.literal(target.timestamp, sa.DateTime))))
+
+
+def remove_from_timelines(mapper, connection, target):
+    connection.execute(timeline.delete().where(
+        timeline.c.recipe_id == target.id))
+
+
+def delete_recipe_children(mapper, connection, target):
+    connection.execute(sa.delete(Rating).where(Rating.recipe_id == target.id))
+    connection.execute(sa.delete(RecipeIngredient).where(
+        RecipeIngredient.recipe_id == target.id))
+    connection.execute(sa.delete(Comment).where(
+        Comment.recipe_id == target.id))
+
+
+def _update_recipe_total(connection, target, delta):
+    connection.execute(sa.update(User).where(User.id == target.user_id).values(
+        recipe_total=User.recipe_total + delta))
+    session = so.object_session(target)
+    if session is not None:
+        session.info.setdefault('_stale_recipe_totals', set()).add(
+            target.user_id)
+
+
+def count_new_recipe(mapper, connection, target):
+    _update_recipe_total(connection, target, 1)
+
+
+def count_deleted_recipe(mapper, connection, target):
+    _update_recipe_total(connection, target, -1)
+
+
+def set_time_bucket(mapper, connection, target):
+    target.time_bucket = time_bucket(target.total_time())
+
+
+def _facet_key(target, committed=False):
+    state = sa.inspect(target)
+    key = []
+    for name in RecipeFacet.FACETS:
+        history = state.attrs[name].history
+        if committed and history.deleted:
+            key.append(history.deleted[0])
+        else:
+            key.append(getattr(target, name))
+    return tuple(key)
+
+
+def count_facets_insert(mapper, connection, target):
+    RecipeFacet.adjust(connection, _facet_key(target), 1)
+
+
+def count_facets_update(mapper, connection, target):
+    old, new = _facet_key(target, committed=True), _facet_key(target)
+    if old != new:
+        RecipeFacet.adjust(connection, old, -1)
+        RecipeFacet.adjust(connection, new, 1)
+
+
+def count_facets_delete(mapper, connection, target):
+    RecipeFacet.adjust(connection, _facet_key(target, committed=True), -1)
+
+
+def expire_recipe_totals(session, flush_context):
+    """Reload recipe_total of authors whose count changed in the flush."""
+    for user_id in session.info.pop('_stale_recipe_totals', ()):
+        user = session.identity_map.get(so.util.identity_key(User, user_id))
+        if user is not None:
+            session.expire(user, ['recipe_total'])
+
+
+db.event.listen(Recipe, 'after_insert', fan_out_recipe)
+db.event.listen(Recipe, 'after_insert', count_new_recipe)
+db.event.listen(Recipe, 'before_delete', remove_from_timelines)
+db.event.listen(Recipe, 'before_delete', delete_recipe_children)
+db.event.listen(Recipe, 'after_delete', count_deleted_recipe)
+db.event.listen(Recipe, 'before_insert', set_time_bucket)
+db.event.listen(Recipe, 'before_update', set_time_bucket)
+db.event.listen(Recipe, 'after_insert', count_facets_insert)
+db.event.listen(Recipe, 'after_update', count_facets_update)
+db.event.listen(Recipe, 'before_delete', count_facets_delete)
+db.event.listen(db.session, 'after_flush_postexec', expire_recipe_totals)
+
+
 class Message(db.Model):
     id: so.Mapped[int] = so.mapped_column(primary_key=True)
     sender_id: so.Mapped[int] = so.mapped_column(sa.ForeignKey(User.id),
@@ -495,19 +1274,99 @@ class Notification(db.Model):
         return json.loads(str(self.payload_json))
 
 
+class RevokedToken(db.Model):
+    """Signed API token revoked before its expiration."""
+    __tablename__ = 'revoked_token'
+    id: so.Mapped[int] = so.mapped_column(primary_key=True)
+    jti: so.Mapped[str] = so.mapped_column(sa.String(32), unique=True)
+    user_id: so.Mapped[int] = so.mapped_column(sa.ForeignKey(User.id),
+                                               index=True)
+    expires_at: so.Mapped[datetime] = so.mapped_column(index=True)
+
+
+class OutgoingEmail(db.Model):
+    """Outbox row written by send_email() and delivered by the drainer."""
+    __tablename__ = 'outgoing_email'
+    id: so.Mapped[int] = so.mapped_column(primary_key=True)
+    subject: so.Mapped[str] = so.mapped_column(sa.String(255))
+    sender: so.Mapped[str] = so.mapped_column(sa.String(120))
+    recipients_json: so.Mapped[str] = so.mapped_column(sa.Text)
+    text_body: so.Mapped[Optional[str]] = so.mapped_column(sa.Text)
+    html_body: so.Mapped[Optional[str]] = so.mapped_column(sa.Text)
+    attachments_json: so.Mapped[Optional[str]] = so.mapped_column(sa.Text)
+    # queued -> sending -> sent | failed
+    status: so.Mapped[str] = so.mapped_column(
+        sa.String(16), default='queued', server_default='queued')
+    attempts: so.Mapped[int] = so.mapped_column(default=0, server_default='0')
+    next_attempt_at: so.Mapped[datetime] = so.mapped_column(
+        default=lambda: datetime.now(timezone.utc))
+    locked_until: so.Mapped[Optional[datetime]]
+    locked_by: so.Mapped[Optional[str]] = so.mapped_column(sa.String(32))
+    error: so.Mapped[Optional[str]] = so.mapped_column(sa.Text)
+    timestamp: so.Mapped[datetime] = so.mapped_column(
+        default=lambda: datetime.now(timezone.utc))
+    sent_at: so.Mapped[Optional[datetime]]
+
+    __table_args__ = (sa.Index('ix_outgoing_email_status_next_attempt_at',
+                               'status', 'next_attempt_at'),)
+
+    def __repr__(self):
+        return '<OutgoingEmail {} {}>'.format(self.subject, self.status)
+
+    def get_recipients(self):
+        return json.loads(self.recipients_json)
+
+    def get_attachments(self):
+        """Return attachments as (filename, content_type, data) tuples."""
+        if not self.attachments_json:
+            return []
+        return [(filename, content_type, base64.b64decode(data))
+                for filename, content_type, data
+                in json.loads(self.attachments_json)]
+
+    def set_attachments(self, attachments):
+        encoded = []
+        for filename, content_type, data in attachments or []:
+            if isinstance(data, str):
+                data = data.encode('utf-8')
+            encoded.append([filename, content_type,
+                            base64.b64encode(data).decode('ascii')])
+        self.attachments_json = json.dumps(encoded) if encoded else None
+
+
 class Task(db.Model):
     id: so.Mapped[str] = so.mapped_column(sa.String(36), primary_key=True)
     name: so.Mapped[str] = so.mapped_column(sa.String(128), index=True)
     description: so.Mapped[Optional[str]] = so.mapped_column(sa.String(128))
     user_id: so.Mapped[int] = so.mapped_column(sa.ForeignKey(User.id))
     complete: so.Mapped[bool] = so.mapped_column(default=False)
+    # queued -> running -> finished | failed; a failed attempt goes back to
+    # queued with a later run_at until max_attempts is reached
+    status: so.Mapped[str] = so.mapped_column(
+        sa.String(16), default='queued', server_default='queued')
+    args_json: so.Mapped[Optional[str]] = so.mapped_column(sa.Text)
+    progress: so.Mapped[int] = so.mapped_column(default=0, server_default='0')
+    attempts: so.Mapped[int] = so.mapped_column(default=0, server_default='0')
+    max_attempts: so.Mapped[int] = so.mapped_column(
+        default=3, server_default='3')
+    run_at: so.Mapped[datetime] = so.mapped_column(
+        default=lambda: datetime.now(timezone.utc))
+    locked_until: so.Mapped[Optional[datetime]]
+    locked_by: so.Mapped[Optional[str]] = so.mapped_column(sa.String(64))
+    error: so.Mapped[Optional[str]] = so.mapped_column(sa.Text)
+    timestamp: so.Mapped[datetime] = so.mapped_column(
+        default=lambda: datetime.now(timezone.utc))
 
     user: so.Mapped[User] = so.relationship(back_populates='tasks')
 
-    def get_rq_job(self):
-        # Task system disabled for local deployment
-        return None
+    __table_args__ = (sa.Index('ix_task_status_run_at', 'status', 'run_at'),)
+
+    def __repr__(self):
+        return '<Task {} {}>'.format(self.name, self.status)
+
+    def get_args(self):
+        data = json.loads(self.args_json) if self.args_json else {}
+        return data.get('args', []), data.get('kwargs', {})
 
     def get_progress(self):
-        # Task system disabled for local deployment
-        return 100
+        return 100 if self.status == 'finished' else self.progress or 0
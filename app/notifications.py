@@ -0,0 +1,186 @@
+"""Server-Sent Events delivery of user notifications.
+
+Each worker process runs one NotificationHub thread that reads new rows
+of the notification table (a range scan on the primary key, at most every
+NOTIFICATION_POLL_INTERVAL seconds) and hands them to the open streams of
+their users. Notifications committed by the same process wake the hub
+immediately; those written by `flask worker` or other web workers arrive
+with the next poll. A stream costs a queue and a waiting thread or
+greenlet, and no database work of its own.
+
+Under threaded workers every open stream holds one of the worker's
+threads, so a worker serves at most NOTIFICATION_MAX_STREAMS streams and
+answers further ones with a 503; browsers then fall back to polling
+/notifications. With 0 pages do not open streams at all.
+"""
+import json
+import queue
+import threading
+import time
+import sqlalchemy as sa
+from flask import current_app, has_app_context
+from app import db
+from app.models import Notification
+
+
+def format_event(notification):
+    return 'id: {}\ndata: {}\n\n'.format(notification['id'], json.dumps(
+        {key: notification[key] for key in ('name', 'data', 'timestamp')}))
+
+
+class TooManyStreams(Exception):
+    """This worker already serves NOTIFICATION_MAX_STREAMS streams."""
+
+
+def _as_event(n):
+    return {'id': n.id, 'user_id': n.user_id, 'name': n.name,
+            'data': n.get_data(), 'timestamp': n.timestamp}
+
+
+class NotificationHub:
+    def __init__(self, app):
+        self.app = app
+        self.subscribers = {}  # user id -> set of queues
+        self.streams = 0
+        self.last_id = None
+        self.wakeup = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_id):
+        """Return a queue receiving the user's new notifications."""
+        q = queue.Queue()
+        if self.last_id is None:
+            self.last_id = db.session.scalar(
+                sa.select(sa.func.max(Notification.id))) or 0
+        with self._lock:
+            if self.streams >= self.app.config['NOTIFICATION_MAX_STREAMS']:
+                raise TooManyStreams()
+            self.streams += 1
+            self.subscribers.setdefault(user_id, set()).add(q)
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self.run, name='notification-hub', daemon=True)
+                self._thread.start()
+        return q
+
+    def unsubscribe(self, user_id, q):
+        with self._lock:
+            queues = self.subscribers.get(user_id)
+            if queues is not None and q in queues:
+                self.streams -= 1
+                queues.discard(q)
+                if not queues:
+                    del self.subscribers[user_id]
+
+    def run(self):
+        interval = self.app.config['NOTIFICATION_POLL_INTERVAL']
+        with self.app.app_context():
+            while True:
+                self.wakeup.wait(interval)
+                self.wakeup.clear()
+                with self._lock:
+                    if not self.subscribers:
+                        # the next subscriber starts a new thread
+                        self._thread = None
+                        return
+                try:
+                    self.poll()
+                except Exception:
+                    current_app.logger.warning('Could not read notifications',
+                                               exc_info=True)
+                finally:
+                    db.session.remove()
+
+    def poll(self):
+        """Deliver the notifications written since the last poll."""
+        notifications = db.session.scalars(
+            sa.select(Notification).where(Notification.id > self.last_id)
+            .order_by(Notification.id)).all()
+        for n in notifications:
+            with self._lock:
+                queues = list(self.subscribers.get(n.user_id, ()))
+            if queues:
+                event = _as_event(n)
+                for q in queues:
+                    q.put(event)
+            self.last_id = n.id
+        return len(notifications)
+
+
+def get_notification_hub(app=None):
+    app = app or current_app._get_current_object()
+    hub = app.extensions.get('notification_hub')
+    if hub is None:
+        hub = app.extensions.setdefault('notification_hub',
+                                        NotificationHub(app))
+    return hub
+
+
+def stream_notifications(user_id, last_event_id=0):
+    """Return a generator of SSE messages for one user and a close function.
+
+    The notifications the client has not seen yet (all of them on a first
+    connection) are read here, within the request. The generator itself
+    only waits on the hub, sends a comment line every NOTIFICATION_HEARTBEAT
+    seconds and ends after NOTIFICATION_STREAM_TIMEOUT seconds, after which
+    the browser reconnects with Last-Event-ID. Raises TooManyStreams when
+    the worker serves as many streams as it may.
+    """
+    config = current_app.config
+    heartbeat = config['NOTIFICATION_HEARTBEAT']
+    timeout = config['NOTIFICATION_STREAM_TIMEOUT']
+    hub = get_notification_hub()
+    # subscribe first, so nothing committed meanwhile is missed
+    q = hub.subscribe(user_id)
+    backlog = [_as_event(n) for n in db.session.scalars(
+        sa.select(Notification).where(Notification.user_id == user_id,
+                                      Notification.id > last_event_id)
+        .order_by(Notification.id))]
+
+    def close():
+        hub.unsubscribe(user_id, q)
+
+    def generate():
+        sent = last_event_id
+        try:
+            yield 'retry: {}\n\n'.format(
+                int(config['NOTIFICATION_RETRY'] * 1000))
+            for event in backlog:
+                sent = event['id']
+                yield format_event(event)
+            deadline = time.monotonic() + timeout
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                try:
+                    event = q.get(timeout=min(heartbeat, remaining))
+                except queue.Empty:
+                    yield ': keepalive\n\n'
+                    continue
+                if event['id'] > sent:
+                    sent = event['id']
+                    yield format_event(event)
+        finally:
+            close()
+
+    # close() also runs when the response is closed before the first read
+    return generate(), close
+
+
+def note_new_notifications(session, flush_context, instances):
+    if any(isinstance(obj, Notification) for obj in session.new):
+        session.info['_new_notifications'] = True
+
+
+def wake_hub(session):
+    """Deliver notifications committed by this process without waiting."""
+    if session.info.pop('_new_notifications', False) and has_app_context():
+        hub = current_app.extensions.get('notification_hub')
+        if hub is not None:
+            hub.wakeup.set()
+
+
+db.event.listen(db.session, 'before_flush', note_new_notifications)
+db.event.listen(db.session, 'after_commit', wake_hub)
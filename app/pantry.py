@@ -0,0 +1,219 @@
+""""What can I cook?" search over recipe ingredients.
+
+Each worker keeps an inverted index from normalized ingredient name to the
+sorted ids of the recipes using it, built from the recipe_ingredient table
+and kept as compact arrays. A query expands the ingredients the user has
+to the matching names, merges their posting lists counting how many of
+each recipe's ingredients are covered, drops recipes on the excluded
+postings and ranks the rest by missing ingredients, so no recipe rows are
+read until the page to show is known.
+"""
+from array import array
+from collections import Counter, namedtuple
+import heapq
+from itertools import chain
+import threading
+import time
+import sqlalchemy as sa
+import sqlalchemy.orm as so
+from flask import current_app
+from app import db
+from app.ingredients import normalize_name
+from app.models import Recipe, RecipeIngredient
+
+Match = namedtuple('Match', ['recipe_id', 'matched', 'missing'])
+
+
+class IngredientIndex:
+    """Per-worker posting lists of the recipe_ingredient table.
+
+    The index is rebuilt when the table has changed, checked at most every
+    INGREDIENT_INDEX_REFRESH seconds, so recipes saved through another
+    worker are found after that delay. Only the first build runs on a
+    request thread; later ones run in a background thread while searches
+    keep reading the previous snapshot.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        # (postings, sizes, words), replaced as a whole by build():
+        # name -> array of recipe ids in ascending order,
+        # recipe id -> number of distinct names, word -> names containing it
+        self.snapshot = ({}, {}, {})
+        self.version = None
+        self.checked_at = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def current_version():
+        # ingredient rows are replaced, never updated, when a recipe's
+        # ingredients change, so new ids and the row count catch every
+        # change; other recipe updates (ratings, edits) do not rebuild
+        return db.session.execute(sa.select(
+            sa.func.max(RecipeIngredient.id), sa.func.count(RecipeIngredient.id)
+        )).one()
+
+    def due(self):
+        interval = self.app.config['INGREDIENT_INDEX_REFRESH']
+        return self.checked_at is None or \
+            time.monotonic() - self.checked_at >= interval
+
+    def refresh(self, wait=False):
+        """Check for changes if due, rebuilding in the background.
+
+        ``wait`` blocks until a rebuild started by this call is done.
+        """
+        if not self.due():
+            return
+        with self._lock:
+            if not self.due():
+                return
+            if self.version is None:
+                # nothing to serve yet, so the first build is waited for
+                self.update()
+                return
+            self.checked_at = time.monotonic()
+            thread = self._thread
+            if thread is None:
+                thread = self._thread = threading.Thread(
+                    target=self.run, name='ingredient-index', daemon=True)
+                thread.start()
+        if wait:
+            thread.join()
+
+    def update(self):
+        version = self.current_version()
+        if version != self.version:
+            self.build()
+            self.version = version
+        self.checked_at = time.monotonic()
+
+    def run(self):
+        with self.app.app_context():
+            try:
+                self.update()
+            except Exception:
+                current_app.logger.warning(
+                    'Could not rebuild the ingredient index', exc_info=True)
+            finally:
+                db.session.remove()
+                with self._lock:
+                    self._thread = None
+
+    def build(self, chunk_size=10000):
+        """Load every (name, recipe) pair, in the order of the name index.
+
+        The new snapshot replaces the old one in a single assignment, so a
+        search reads either of them whole.
+        """
+        postings = {}
+        sizes = Counter()
+        result = db.session.execute(
+            sa.select(RecipeIngredient.name, RecipeIngredient.recipe_id)
+            .distinct().order_by(RecipeIngredient.name,
+                                 RecipeIngredient.recipe_id)
+            .execution_options(yield_per=chunk_size))
+        for name, recipe_id in result:
+            ids = postings.get(name)
+            if ids is None:
+                ids = postings[name] = array('I')
+            ids.append(recipe_id)
+            sizes[recipe_id] += 1
+        words = {}
+        for name in postings:
+            for word in name.split():
+                words.setdefault(word, set()).add(name)
+        self.snapshot = (postings, dict(sizes), words)
+
+    @staticmethod
+    def expand(words, terms):
+        """Return the indexed names matching any of the given ingredients.
+
+        A term matches every name that contains all of its words, so "oil"
+        matches "olive oil" and "olive oil" does not match "oil".
+        """
+        names = set()
+        for term in terms:
+            term_words = normalize_name(term).split()
+            if not term_words:
+                continue
+            found = set(words.get(term_words[0], ()))
+            for word in term_words[1:]:
+                found &= words.get(word, set())
+            names |= found
+        return names
+
+    def search(self, have, exclude=(), max_missing=None):
+        """Rank the recipes that use at least one of ``have``.
+
+        Returns ``(matches, names)``: the unordered Match tuples (see
+        top()) and the set of ingredient names the user has.
+        """
+        self.refresh()
+        postings, sizes, words = self.snapshot
+        names = self.expand(words, have)
+        counts = Counter(chain.from_iterable(postings[name]
+                                             for name in names))
+        excluded = set(chain.from_iterable(
+            postings[name] for name in self.expand(words, exclude)))
+        matches = []
+        for recipe_id, matched in counts.items():
+            if recipe_id in excluded:
+                continue
+            missing = sizes[recipe_id] - matched
+            if max_missing is None or missing <= max_missing:
+                matches.append(Match(recipe_id, matched, missing))
+        return matches, names
+
+    @staticmethod
+    def top(matches, offset, limit):
+        """Fewest missing ingredients first, then most matched, then newest"""
+        return heapq.nsmallest(offset + limit, matches, key=lambda m: (
+            m.missing, -m.matched, -m.recipe_id))[offset:]
+
+
+def get_ingredient_index(app=None):
+    app = app or current_app._get_current_object()
+    index = app.extensions.get('ingredient_index')
+    if index is None:
+        index = app.extensions.setdefault('ingredient_index',
+                                          IngredientIndex(app))
+    return index
+
+
+def parse_terms(value):
+    """Split a comma separated list of ingredients."""
+    return [term.strip() for term in (value or '').split(',')
+            if term.strip()]
+
+
+def find_by_ingredients(have, exclude=(), page=1, per_page=10,
+                        max_missing=None):
+    """Return ``(results, total)`` for one page of a pantry search.
+
+    ``results`` holds ``(recipe, match, missing)`` tuples, where
+    ``missing`` lists the recipe's ingredients the user does not have.
+    """
+    index = get_ingredient_index()
+    matches, names = index.search(have, exclude, max_missing)
+    page_matches = index.top(matches, (page - 1) * per_page, per_page)
+    if not page_matches:
+        return [], len(matches)
+    recipes = {recipe.id: recipe for recipe in db.session.scalars(
+        sa.select(Recipe).where(Recipe.id.in_(
+            [m.recipe_id for m in page_matches]))
+        .options(so.selectinload(Recipe.ingredient_items)))}
+    results = []
+    for match in page_matches:
+        recipe = recipes.get(match.recipe_id)
+        if recipe is None:  # deleted since the index was built
+            continue
+        missing = []
+        seen = set(names)
+        for item in recipe.ingredient_items:
+            if item.name not in seen:
+                seen.add(item.name)
+                missing.append(item.ingredient)
+        results.append((recipe, match, missing))
+    return results, len(matches)
@@ -0,0 +1,107 @@
+"""Password hashing in a bounded process pool.
+
+Hashing and verifying passwords is deliberately slow. Running it in the
+request thread would stall a worker's other requests for the duration of
+every login, so each worker hands it to a small pool of processes
+(PASSWORD_HASH_PROCESSES; 0 hashes inline). At most PASSWORD_QUEUE_LIMIT
+operations may be queued or running per worker; beyond that
+PasswordHasherBusy is raised and the request fails fast with a 503 and a
+Retry-After header instead of queueing behind a login burst.
+
+The cost is set by PASSWORD_HASH_METHOD in werkzeug's method syntax.
+Hashes made with another method are replaced after the next successful
+check, see User.check_password(). Methods are compared with werkzeug's
+defaults filled in, as hashes record them in full ("scrypt" hashes start
+with "scrypt:32768:8:1").
+"""
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import threading
+from flask import current_app
+from werkzeug.security import generate_password_hash, \
+    check_password_hash, DEFAULT_PBKDF2_ITERATIONS
+
+# werkzeug's parameters for methods given without them
+METHOD_DEFAULTS = {
+    'scrypt': ('32768', '8', '1'),
+    'pbkdf2': ('sha256', str(DEFAULT_PBKDF2_ITERATIONS)),
+}
+
+
+class PasswordHasherBusy(Exception):
+    """Too many password operations are queued in this worker."""
+
+
+def parse_method(method):
+    """Split a method into its algorithm and parameters, defaults added."""
+    name, *args = method.split(':')
+    return (name, *args, *METHOD_DEFAULTS.get(name, ())[len(args):])
+
+
+class PasswordHasher:
+    def __init__(self, method, processes=0, queue_limit=8):
+        self.method = method
+        self.processes = processes
+        self.queue_limit = queue_limit
+        self.in_flight = 0
+        self.rejected = 0
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    # spawned processes do not inherit the worker's threads
+                    # and locks the way forked ones would
+                    self._executor = ProcessPoolExecutor(
+                        self.processes,
+                        mp_context=multiprocessing.get_context('spawn'))
+        return self._executor
+
+    def _run(self, func, *args):
+        with self._lock:
+            if self.in_flight >= self.queue_limit:
+                self.rejected += 1
+                raise PasswordHasherBusy()
+            self.in_flight += 1
+        try:
+            if not self.processes:
+                return func(*args)
+            return self.executor.submit(func, *args).result()
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, pwhash, password):
+        if not pwhash:
+            return False
+        return self._run(check_password_hash, pwhash, password)
+
+    def needs_rehash(self, pwhash):
+        return bool(pwhash) and \
+            parse_method(pwhash.split('$', 1)[0]) != parse_method(self.method)
+
+    def stats(self):
+        return {'processes': self.processes, 'queue_limit': self.queue_limit,
+                'in_flight': self.in_flight, 'rejected': self.rejected}
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+def get_password_hasher():
+    app = current_app._get_current_object()
+    hasher = app.extensions.get('password_hasher')
+    if hasher is None:
+        hasher = app.extensions.setdefault('password_hasher', PasswordHasher(
+            app.config['PASSWORD_HASH_METHOD'],
+            app.config['PASSWORD_HASH_PROCESSES'],
+            app.config['PASSWORD_QUEUE_LIMIT']))
+    return hasher
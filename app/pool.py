@@ -0,0 +1,75 @@
+"""Connection pool with checkout metrics.
+
+Each worker process has its own pool of database connections, sized by
+config.engine_options() to the number of requests the worker serves at a
+time. InstrumentedQueuePool records how often and how long requests wait
+for a connection, which /health reports, so an undersized pool (or a
+profile serving more requests than the database can take) shows up as
+waits and timeouts rather than as unexplained latency.
+"""
+import threading
+import time
+import sqlalchemy as sa
+from sqlalchemy.pool import QueuePool
+from flask import current_app
+
+
+class PoolMetrics:
+    def __init__(self):
+        self.checkouts = 0
+        self.waits = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.timeouts = 0
+        self._lock = threading.Lock()
+
+    def record(self, waited, timed_out=False):
+        with self._lock:
+            self.checkouts += not timed_out
+            self.timeouts += timed_out
+            # connections handed out immediately take microseconds
+            if waited >= 0.001:
+                self.waits += 1
+                self.wait_total += waited
+                self.wait_max = max(self.wait_max, waited)
+
+    def stats(self):
+        return {'checkouts': self.checkouts, 'waits': self.waits,
+                'wait_total': round(self.wait_total, 3),
+                'wait_max': round(self.wait_max, 3),
+                'timeouts': self.timeouts}
+
+
+class InstrumentedQueuePool(QueuePool):
+    def __init__(self, *args, metrics=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = metrics or PoolMetrics()
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except sa.exc.TimeoutError:
+            self.metrics.record(time.perf_counter() - start, timed_out=True)
+            raise
+        self.metrics.record(time.perf_counter() - start)
+        return connection
+
+    def recreate(self):
+        # pool_recycle and dispose() build a new pool; keep the counters
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+
+def pool_stats():
+    """Size and usage of this worker's connection pool."""
+    pool = current_app.extensions['sqlalchemy'].engine.pool
+    stats = {'class': type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        stats.update(size=pool.size(), checked_out=pool.checkedout(),
+                     overflow=pool.overflow(), max_overflow=pool._max_overflow,
+                     timeout=pool.timeout())
+    if isinstance(pool, InstrumentedQueuePool):
+        stats.update(pool.metrics.stats())
+    return stats
@@ -1,45 +1,208 @@
-from flask import current_app
+"""Local full-text search engine.
+
+Documents are tokenized into an inverted index stored in three tables of
+the application database, so every worker shares the same index and no
+external search service is needed. Queries are ranked with BM25 and
+paginated inside the index, so only the ids of the requested page are
+returned to the caller.
+"""
+from collections import Counter
+import math
+import re
 import sqlalchemy as sa
+from app import db
+
+# BM25 tuning constants
+K1 = 1.2
+B = 0.75
+
+MAX_TERM_LENGTH = 64
+
+STOPWORDS = frozenset("""
+a an and are as at be but by for from has have in into is it its of on or
+the then to with your you this that add until about over
+""".split())
+
+search_document = sa.Table(
+    'search_document',
+    db.metadata,
+    sa.Column('doctype', sa.String(32), primary_key=True),
+    sa.Column('doc_id', sa.Integer, primary_key=True),
+    sa.Column('length', sa.Integer, nullable=False)
+)
+
+search_posting = sa.Table(
+    'search_posting',
+    db.metadata,
+    sa.Column('doctype', sa.String(32), primary_key=True),
+    sa.Column('term', sa.String(MAX_TERM_LENGTH), primary_key=True),
+    sa.Column('doc_id', sa.Integer, primary_key=True),
+    sa.Column('tf', sa.Integer, nullable=False),
+    sa.Index('ix_search_posting_doctype_doc_id', 'doctype', 'doc_id')
+)
+
+search_stats = sa.Table(
+    'search_stats',
+    db.metadata,
+    sa.Column('doctype', sa.String(32), primary_key=True),
+    sa.Column('doc_count', sa.Integer, nullable=False, default=0),
+    sa.Column('total_length', sa.BigInteger, nullable=False, default=0)
+)
+
+
+def stem(word):
+    """Very light English plural folding ("eggs" -> "egg")."""
+    if len(word) <= 3 or not word.isalpha():
+        return word
+    if word.endswith('ies'):
+        return word[:-3] + 'y'
+    if word.endswith(('oes', 'sses', 'xes', 'ches', 'shes')):
+        return word[:-2]
+    if word.endswith('s') and not word.endswith(('ss', 'us', 'is')):
+        return word[:-1]
+    return word
+
+
+def tokenize(text):
+    """Split text into normalized index terms."""
+    if not text:
+        return []
+    terms = []
+    for word in re.findall(r'\w+', text.lower()):
+        if len(word) < 2 or word in STOPWORDS:
+            continue
+        terms.append(stem(word)[:MAX_TERM_LENGTH])
+    return terms
+
+
+def _remove(index, ids):
+    lengths = db.session.execute(
+        sa.select(sa.func.count(), sa.func.sum(search_document.c.length))
+        .where(search_document.c.doctype == index,
+               search_document.c.doc_id.in_(ids))).one()
+    if not lengths[0]:
+        return
+    db.session.execute(search_posting.delete().where(
+        search_posting.c.doctype == index, search_posting.c.doc_id.in_(ids)))
+    db.session.execute(search_document.delete().where(
+        search_document.c.doctype == index,
+        search_document.c.doc_id.in_(ids)))
+    _update_stats(index, -lengths[0], -(lengths[1] or 0))
+
+
+def _update_stats(index, doc_delta, length_delta):
+    result = db.session.execute(
+        search_stats.update().where(search_stats.c.doctype == index).values(
+            doc_count=search_stats.c.doc_count + doc_delta,
+            total_length=search_stats.c.total_length + length_delta))
+    if result.rowcount == 0:
+        db.session.execute(search_stats.insert().values(
+            doctype=index, doc_count=doc_delta, total_length=length_delta))
+
+
+def index_documents(index, models):
+    """Add or replace a batch of objects in the index.
+
+    Writes go through the current session, so they commit or roll back
+    together with the change that triggered them.
+    """
+    models = [model for model in models if model.id is not None]
+    if not models:
+        return
+    _remove(index, [model.id for model in models])
+    documents = []
+    postings = []
+    for model in models:
+        terms = tokenize(model.search_document())
+        documents.append({'doctype': index, 'doc_id': model.id,
+                          'length': len(terms)})
+        postings.extend({'doctype': index, 'term': term, 'doc_id': model.id,
+                         'tf': tf} for term, tf in Counter(terms).items())
+    db.session.execute(search_document.insert(), documents)
+    if postings:
+        db.session.execute(search_posting.insert(), postings)
+    _update_stats(index, len(documents),
+                  sum(document['length'] for document in documents))
 
 
 def add_to_index(index, model):
-    # Elasticsearch disabled - no-op for local deployment (removed from original tutorial)
-    pass
+    index_documents(index, [model])
 
 
 def remove_from_index(index, model):
-    # Elasticsearch disabled - no-op for local deployment (removed from original tutorial)
-    pass
+    _remove(index, [model.id])
+
+
+def remove_ids_from_index(index, ids):
+    if ids:
+        _remove(index, list(ids))
+
+
+def remove_stale_from_index(index, low, high, ids):
+    """Remove the documents with ``low < doc_id <= high`` not in ``ids``.
+
+    ``high`` None leaves the range open. Used by a rebuild to drop the
+    documents of deleted objects one id range at a time.
+    """
+    stale = sa.select(search_document.c.doc_id).where(
+        search_document.c.doctype == index, search_document.c.doc_id > low)
+    if high is not None:
+        stale = stale.where(search_document.c.doc_id <= high)
+    stale = set(db.session.scalars(stale)) - set(ids)
+    if stale:
+        _remove(index, list(stale))
+
+
+def recount_index(index):
+    """Recompute the document count and total length of an index."""
+    doc_count, total_length = db.session.execute(
+        sa.select(sa.func.count(),
+                  sa.func.coalesce(sa.func.sum(search_document.c.length), 0))
+        .where(search_document.c.doctype == index)).one()
+    db.session.execute(search_stats.delete().where(
+        search_stats.c.doctype == index))
+    db.session.execute(search_stats.insert().values(
+        doctype=index, doc_count=doc_count, total_length=total_length))
 
 
 def query_index(index, query, page, per_page):
-    # Fallback to database search when Elasticsearch is not available (replaces Elasticsearch from original tutorial)
-    if index == 'recipe':
-        # Import here to avoid circular import
-        from app import db
-        from app.models import Recipe
-        
-        # Use database LIKE search as fallback
-        search_query = f"%{query}%"
-        recipes = db.session.scalars(
-            sa.select(Recipe).where(
-                sa.or_(
-                    Recipe.title.like(search_query),
-                    Recipe.description.like(search_query),
-                    Recipe.ingredients.like(search_query),
-                    Recipe.instructions.like(search_query)
-                )
-            ).order_by(Recipe.timestamp.desc())
-        ).all()
-        
-        # Simple pagination
-        start = (page - 1) * per_page
-        end = start + per_page
-        paginated_recipes = recipes[start:end]
-        
-        ids = [recipe.id for recipe in paginated_recipes]
-        total = len(recipes)
-        
-        return ids, total
-    
-    return [], 0
+    """Rank documents matching any query term with BM25.
+
+    Returns ``(ids, total)`` where ``ids`` holds the requested page only.
+    """
+    terms = sorted(set(tokenize(query)))
+    if not terms:
+        return [], 0
+    stats = db.session.execute(
+        sa.select(search_stats.c.doc_count, search_stats.c.total_length)
+        .where(search_stats.c.doctype == index)).first()
+    if stats is None or not stats.doc_count:
+        return [], 0
+    doc_count = stats.doc_count
+    avgdl = (stats.total_length / doc_count) or 1.0
+
+    p = search_posting.alias('p')
+    d = search_document.alias('d')
+    matches = sa.and_(p.c.doctype == index, p.c.term.in_(terms))
+    df = dict(db.session.execute(
+        sa.select(p.c.term, sa.func.count()).where(matches)
+        .group_by(p.c.term)).all())
+    if not df:
+        return [], 0
+    idf = {term: math.log(1 + (doc_count - n + 0.5) / (n + 0.5))
+           for term, n in df.items()}
+
+    total = db.session.scalar(
+        sa.select(sa.func.count(sa.distinct(p.c.doc_id))).where(matches))
+    weight = sa.case(idf, value=p.c.term, else_=0.0)
+    norm = K1 * (1 - B + B * d.c.length / avgdl)
+    score = sa.func.sum(weight * p.c.tf * (K1 + 1) / (p.c.tf + norm))
+    ids = db.session.scalars(
+        sa.select(p.c.doc_id)
+        .join(d, sa.and_(d.c.doctype == p.c.doctype,
+                         d.c.doc_id == p.c.doc_id))
+        .where(matches)
+        .group_by(p.c.doc_id)
+        .order_by(score.desc(), p.c.doc_id.desc())
+        .limit(per_page).offset((page - 1) * per_page)).all()
+    return ids, total
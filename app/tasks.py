@@ -1,22 +1,77 @@
-# Task system disabled for local deployment (removed Redis/RQ from original tutorial)
-# This file is kept for compatibility but tasks are handled synchronously
+"""Background tasks, executed by the `flask worker` process pool.
 
+Tasks are queued with User.launch_task(name, ...) and looked up by name in
+TASKS. Each task receives the id of the user that launched it followed by
+the arguments given to launch_task().
+"""
 import json
-import sys
-import time
-import sqlalchemy as sa
-from flask import render_template
-from app import create_app, db
-from app.models import User, Post, Task
+from datetime import datetime, timezone, timedelta
+import threading
+import sqlalchemy.orm as so
+from flask import current_app, render_template
+from app import db
+from app.models import User, Recipe, Task
 from app.email import send_email
 
-app = create_app()
-app.app_context().push()
+TASKS = {}
+
+_current = threading.local()
+
+
+def task(f):
+    """Register a function so the worker can run it by name."""
+    TASKS[f.__name__] = f
+    return f
+
+
+def get_current_task_id():
+    return getattr(_current, 'task_id', None)
+
+
+def set_current_task_id(task_id):
+    _current.task_id = task_id
 
 
 def _set_task_progress(progress):
-    # Task system disabled for local deployment (removed Redis/RQ from original tutorial)
-    # Tasks are handled synchronously using Python threading
-    pass
+    task_id = get_current_task_id()
+    if task_id is None:
+        return
+    task = db.session.get(Task, task_id)
+    task.progress = progress
+    # progress doubles as a heartbeat that keeps the task claimed
+    task.locked_until = datetime.now(timezone.utc) + timedelta(
+        seconds=current_app.config['TASK_VISIBILITY_TIMEOUT'])
+    task.user.add_notification('task_progress', {'task_id': task_id,
+                                                 'progress': progress})
+    db.session.commit()
+
+
+@task
+def export_recipes(user_id):
+    user = db.session.get(User, user_id)
+    _set_task_progress(0)
+    data = []
+    total = max(user.recipes_count(), 1)
+    reported = 0
+    for i, recipe in enumerate(db.session.scalars(
+            user.recipes.select().order_by(Recipe.timestamp.asc())
+            .options(so.selectinload(Recipe.ingredient_items))), 1):
+        data.append(recipe.to_dict())
+        progress = 100 * i // total
+        if progress - reported >= 10:
+            _set_task_progress(progress)
+            reported = progress
+    send_email(
+        '[Foody] Your recipes',
+        sender=current_app.config['ADMINS'][0], recipients=[user.email],
+        text_body=render_template('email/export_recipes.txt', user=user),
+        html_body=render_template('email/export_recipes.html', user=user),
+        attachments=[('recipes.json', 'application/json',
+                      json.dumps({'recipes': data}, indent=4))],
+        sync=True)
 
 
+@task
+def reindex_recipes(user_id):
+    _set_task_progress(0)
+    Recipe.reindex()
@@ -1,21 +1,209 @@
+"""Text translation through the Microsoft Translator API.
+
+Translations are cached by a hash of (source, destination, text): first in
+a per-process LRU, then in the translation_cache table shared by all
+workers. Both levels expire entries after TRANSLATION_CACHE_TTL seconds.
+Texts that miss both levels are sent upstream in batches, one request per
+MS_TRANSLATOR_BATCH_SIZE texts.
+"""
+from datetime import datetime, timezone, timedelta
+import hashlib
+import threading
 import requests
+import sqlalchemy as sa
 from flask import current_app
 from flask_babel import _
+from app import db
+from app.cache import LRUCache
 
+# limits of a single Translator v3 request
+MAX_REQUEST_CHARACTERS = 50000
 
-def translate(text, source_language, dest_language):
-    if 'MS_TRANSLATOR_KEY' not in current_app.config or \
-            not current_app.config['MS_TRANSLATOR_KEY']:
-        return _('Error: the translation service is not configured.')
+translation_cache = sa.Table(
+    'translation_cache',
+    db.metadata,
+    sa.Column('key', sa.String(64), primary_key=True),
+    sa.Column('source_language', sa.String(10)),
+    sa.Column('dest_language', sa.String(10), nullable=False),
+    sa.Column('text', sa.Text, nullable=False),
+    sa.Column('timestamp', sa.DateTime, nullable=False, index=True)
+)
+
+
+class TranslationError(Exception):
+    pass
+
+
+class TranslationCache:
+    """Per-application cache state and hit/miss counters."""
+
+    def __init__(self, maxsize, ttl):
+        self.memory = LRUCache(maxsize, ttl)
+        self.ttl = ttl
+        self.db_hits = 0
+        self.upstream_texts = 0
+        self.upstream_requests = 0
+        self._lock = threading.Lock()
+
+    def count(self, db_hits=0, upstream_texts=0, upstream_requests=0):
+        with self._lock:
+            self.db_hits += db_hits
+            self.upstream_texts += upstream_texts
+            self.upstream_requests += upstream_requests
+
+    def stats(self):
+        memory = self.memory.stats()
+        return {'memory_hits': memory['hits'], 'db_hits': self.db_hits,
+                'misses': self.upstream_texts,
+                'upstream_requests': self.upstream_requests,
+                'memory_size': memory['size']}
+
+
+def get_translation_cache():
+    app = current_app._get_current_object()
+    cache = app.extensions.get('translation_cache')
+    if cache is None:
+        cache = app.extensions.setdefault('translation_cache', TranslationCache(
+            app.config['TRANSLATION_CACHE_SIZE'],
+            app.config['TRANSLATION_CACHE_TTL']))
+    return cache
+
+
+def cache_key(text, source_language, dest_language):
+    data = '\0'.join([source_language or '', dest_language, text])
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+def _load(keys, ttl):
+    """Return unexpired translations from the database, with their age."""
+    now = datetime.now(timezone.utc)
+    rows = db.session.execute(
+        sa.select(translation_cache.c.key, translation_cache.c.text,
+                  translation_cache.c.timestamp)
+        .where(translation_cache.c.key.in_(keys),
+               translation_cache.c.timestamp >= now - timedelta(seconds=ttl)))
+    return {key: (text, (now.replace(tzinfo=None) -
+                         timestamp.replace(tzinfo=None)).total_seconds())
+            for key, text, timestamp in rows}
+
+
+def _store(translations, source_language, dest_language):
+    now = datetime.now(timezone.utc)
+    keys = list(translations)
+    try:
+        # replaces expired rows for the same keys
+        db.session.execute(translation_cache.delete().where(
+            translation_cache.c.key.in_(keys)))
+        db.session.execute(translation_cache.insert(), [
+            {'key': key, 'source_language': source_language,
+             'dest_language': dest_language, 'text': text, 'timestamp': now}
+            for key, text in translations.items()])
+        db.session.commit()
+    except sa.exc.IntegrityError:
+        # another worker stored the same translations first
+        db.session.rollback()
+
+
+def _chunks(texts, size):
+    chunk = []
+    characters = 0
+    for text in texts:
+        if chunk and (len(chunk) >= size or
+                      characters + len(text) > MAX_REQUEST_CHARACTERS):
+            yield chunk
+            chunk = []
+            characters = 0
+        chunk.append(text)
+        characters += len(text)
+    if chunk:
+        yield chunk
+
+
+def _request(texts, source_language, dest_language):
+    config = current_app.config
+    if not config.get('MS_TRANSLATOR_KEY'):
+        raise TranslationError(
+            _('Error: the translation service is not configured.'))
     auth = {
-        'Ocp-Apim-Subscription-Key': current_app.config['MS_TRANSLATOR_KEY'],
-        'Ocp-Apim-Subscription-Region': 'westus'
+        'Ocp-Apim-Subscription-Key': config['MS_TRANSLATOR_KEY'],
+        'Ocp-Apim-Subscription-Region': config['MS_TRANSLATOR_REGION']
     }
-    r = requests.post(
-        'https://api.cognitive.microsofttranslator.com'
-        '/translate?api-version=3.0&from={}&to={}'.format(
-            source_language, dest_language), headers=auth, json=[
-                {'Text': text}])
-    if r.status_code != 200:
-        return _('Error: the translation service failed.')
-    return r.json()[0]['translations'][0]['text']
+    params = {'api-version': '3.0', 'to': dest_language}
+    if source_language:
+        params['from'] = source_language
+    translated = []
+    requests_made = 0
+    try:
+        for chunk in _chunks(texts, config['MS_TRANSLATOR_BATCH_SIZE']):
+            r = requests.post(config['MS_TRANSLATOR_URL'], params=params,
+                              headers=auth, json=[{'Text': text}
+                                                  for text in chunk],
+                              timeout=config['MS_TRANSLATOR_TIMEOUT'])
+            requests_made += 1
+            if r.status_code != 200:
+                raise TranslationError(
+                    _('Error: the translation service failed.'))
+            translated.extend(item['translations'][0]['text']
+                              for item in r.json())
+    except (requests.RequestException, ValueError, KeyError, IndexError):
+        raise TranslationError(_('Error: the translation service failed.'))
+    finally:
+        get_translation_cache().count(upstream_requests=requests_made)
+    return translated
+
+
+def translate_batch(texts, source_language, dest_language):
+    """Translate a list of texts, returning the translations in order.
+
+    Raises TranslationError if some texts are not cached and the upstream
+    service is not configured or fails. New translations are committed to
+    the cache table.
+    """
+    cache = get_translation_cache()
+    keys = [cache_key(text, source_language, dest_language)
+            for text in texts]
+    results = {}
+    missing = {}
+    for key, text in zip(keys, texts):
+        if key in results or key in missing:
+            continue
+        value = cache.memory.get(key)
+        if value is None:
+            missing[key] = text
+        else:
+            results[key] = value
+
+    if missing:
+        found = _load(list(missing), cache.ttl)
+        for key, (text, age) in found.items():
+            results[key] = text
+            cache.memory.set(key, text, ttl=max(cache.ttl - age, 1))
+            del missing[key]
+        cache.count(db_hits=len(found))
+
+    if missing:
+        translated = dict(zip(missing, _request(
+            list(missing.values()), source_language, dest_language)))
+        cache.count(upstream_texts=len(translated))
+        _store(translated, source_language, dest_language)
+        for key, text in translated.items():
+            cache.memory.set(key, text)
+        results.update(translated)
+    return [results[key] for key in keys]
+
+
+def translate(text, source_language, dest_language):
+    try:
+        return translate_batch([text], source_language, dest_language)[0]
+    except TranslationError as e:
+        return str(e)
+
+
+def purge_translation_cache():
+    """Delete expired cache rows. Returns the number of rows removed."""
+    cutoff = datetime.now(timezone.utc) - timedelta(
+        seconds=current_app.config['TRANSLATION_CACHE_TTL'])
+    result = db.session.execute(translation_cache.delete().where(
+        translation_cache.c.timestamp < cutoff))
+    db.session.commit()
+    return result.rowcount
@@ -0,0 +1,138 @@
+"""Database-backed job queue worker.
+
+Tasks are claimed with a conditional UPDATE, so any number of worker
+processes can poll the same table without double-running a task. A claim
+is only valid until ``locked_until``; if a worker crashes the task becomes
+visible again once that visibility timeout passes. Failed attempts are
+retried with exponential backoff until ``max_attempts`` is reached.
+"""
+from datetime import datetime, timezone, timedelta
+import os
+import signal
+import socket
+import time
+import traceback
+import sqlalchemy as sa
+from flask import current_app
+from app import db
+from app.models import Task
+from app.tasks import TASKS, set_current_task_id
+
+
+class Worker:
+    def __init__(self, name=None):
+        self.name = name or '{}:{}'.format(socket.gethostname(), os.getpid())
+        self.running = True
+
+    def stop(self, *args):
+        self.running = False
+
+    @staticmethod
+    def _runnable(now):
+        return sa.and_(Task.attempts < Task.max_attempts, sa.or_(
+            sa.and_(Task.status == 'queued', Task.run_at <= now),
+            sa.and_(Task.status == 'running', Task.locked_until < now)))
+
+    def reap(self):
+        """Fail tasks whose last attempt died without reporting back."""
+        now = datetime.now(timezone.utc)
+        db.session.execute(
+            sa.update(Task)
+            .where(Task.status == 'running', Task.locked_until < now,
+                   Task.attempts >= Task.max_attempts)
+            .values(status='failed', complete=True, locked_until=None,
+                    error='worker lost while running the task'))
+        db.session.commit()
+
+    def claim(self):
+        """Claim the next runnable task, or return None."""
+        now = datetime.now(timezone.utc)
+        timeout = current_app.config['TASK_VISIBILITY_TIMEOUT']
+        candidates = db.session.scalars(
+            sa.select(Task.id).where(self._runnable(now))
+            .order_by(Task.run_at).limit(10)).all()
+        for task_id in candidates:
+            result = db.session.execute(
+                sa.update(Task)
+                .where(Task.id == task_id, self._runnable(now))
+                .values(status='running', locked_by=self.name,
+                        locked_until=now + timedelta(seconds=timeout),
+                        attempts=Task.attempts + 1)
+                .execution_options(synchronize_session=False))
+            db.session.commit()
+            if result.rowcount == 1:
+                return db.session.get(Task, task_id)
+        return None
+
+    def execute(self, task):
+        task_id = task.id
+        function = TASKS.get(task.name)
+        set_current_task_id(task_id)
+        try:
+            if function is None:
+                raise LookupError('unknown task {}'.format(task.name))
+            args, kwargs = task.get_args()
+            function(task.user_id, *args, **kwargs)
+        except Exception:
+            db.session.rollback()
+            current_app.logger.error('Task %s failed', task_id, exc_info=True)
+            self._failed(db.session.get(Task, task_id),
+                         traceback.format_exc())
+        else:
+            task = db.session.get(Task, task_id)
+            task.status = 'finished'
+            task.complete = True
+            task.progress = 100
+            task.locked_until = None
+            task.user.add_notification('task_progress', {'task_id': task_id,
+                                                         'progress': 100})
+            db.session.commit()
+        finally:
+            set_current_task_id(None)
+
+    def _failed(self, task, error):
+        task.error = error[-4000:]
+        task.locked_until = None
+        if task.attempts >= task.max_attempts:
+            task.status = 'failed'
+            task.complete = True
+        else:
+            backoff = current_app.config['TASK_RETRY_BACKOFF'] * \
+                2 ** (task.attempts - 1)
+            task.status = 'queued'
+            task.run_at = datetime.now(timezone.utc) + timedelta(
+                seconds=backoff)
+        db.session.commit()
+
+    def run_once(self):
+        """Run one task if there is one. Returns True if a task ran."""
+        task = self.claim()
+        if task is None:
+            return False
+        self.execute(task)
+        return True
+
+    def work(self, burst=False):
+        """Process tasks until stopped; with burst, until the queue is empty."""
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        interval = current_app.config['WORKER_POLL_INTERVAL']
+        last_reap = 0
+        while self.running:
+            if time.monotonic() - last_reap > 60:
+                self.reap()
+                last_reap = time.monotonic()
+            if self.run_once():
+                continue
+            db.session.remove()
+            if burst:
+                break
+            time.sleep(interval)
+
+
+def run_worker_process(burst=False):
+    """Entry point of one pool process; builds its own app and engine."""
+    from app import create_app
+    app = create_app()
+    with app.app_context():
+        Worker().work(burst=burst)
@@ -0,0 +1,9 @@
+"""Benchmarks of the hot pages and API endpoints.
+
+Run with ``python -m benchmarks --size 1k`` (or 100k, 1m). The dataset is
+generated once into a SQLite file (or the database given with
+--database) and reused by later runs. ``--save`` writes the results as the
+baseline in benchmarks/baselines/<size>.json; ``--compare`` checks them
+against the baseline and exits with status 1 on a regression. Record
+baselines on the machine the comparisons will run on.
+"""
@@ -0,0 +1,96 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from app import create_app
+from config import Config, engine_options
+from benchmarks import dataset, suite
+
+basedir = os.path.abspath(os.path.dirname(__file__))
+
+
+def make_config(database_url):
+    class BenchmarkConfig(Config):
+        TESTING = True
+        WTF_CSRF_ENABLED = False
+        SQLALCHEMY_DATABASE_URI = database_url
+        SQLALCHEMY_ENGINE_OPTIONS = engine_options(database_url)
+        PASSWORD_HASH_PROCESSES = 0
+        LANGUAGE_DETECTION_ASYNC = False
+    return BenchmarkConfig
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m benchmarks',
+                                     description='Benchmark hot endpoints.')
+    parser.add_argument('--size', default='1k',
+                        help='1k, 100k, 1m or a number of recipes')
+    parser.add_argument('--database',
+                        help='database URL (default: a SQLite file in the '
+                             'temporary directory, one per size)')
+    parser.add_argument('--case', action='append', choices=list(suite.CASES),
+                        help='run only this case; repeatable')
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--output', help='also write the results here')
+    parser.add_argument('--save', action='store_true',
+                        help='write the results as the baseline of the size')
+    parser.add_argument('--compare', nargs='?', const='', metavar='BASELINE',
+                        help='fail on regressions against a baseline file '
+                             '(default: the saved one of the size)')
+    parser.add_argument('--tolerance', type=float, default=0.5,
+                        help='allowed latency growth, as a fraction')
+    parser.add_argument('--memory-tolerance', type=float, default=0.25)
+    args = parser.parse_args()
+
+    recipes = dataset.parse_size(args.size)
+    database = args.database or 'sqlite:///' + os.path.join(
+        tempfile.gettempdir(), f'foody-benchmark-{args.size}.db')
+    baseline_path = os.path.join(basedir, 'baselines', f'{args.size}.json')
+    compare_path = args.compare or baseline_path
+    # checked before the dataset is built and the cases run
+    if args.compare is not None and not os.path.exists(compare_path):
+        sys.exit(f'No baseline recorded at {compare_path}; run with --save '
+                 f'first (baselines are only comparable on the machine that '
+                 f'recorded them).')
+
+    app = create_app(make_config(database))
+    with app.app_context():
+        start = time.perf_counter()
+        if dataset.ensure(recipes, progress=lambda message: print(
+                '  ' + message, flush=True)):
+            print(f'Built the {args.size} dataset in '
+                  f'{time.perf_counter() - start:.0f}s')
+
+        print(f"{'case':<15} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} "
+              f"{'stmts':>6} {'peak KB':>9}")
+        results = suite.run(
+            app, recipes, args.size, args.case, args.iterations, args.warmup,
+            progress=lambda name, r: print(
+                f"{name:<15} {r['p50_ms']:>9.2f} {r['p95_ms']:>9.2f} "
+                f"{r['p99_ms']:>9.2f} {r['statements']:>6} "
+                f"{r['peak_kb']:>9.1f}"))
+
+    for path in filter(None, [args.output, args.save and baseline_path]):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(results, f, indent=2)
+            f.write('\n')
+        print(f'Wrote {path}')
+
+    if args.compare is not None:
+        with open(compare_path) as f:
+            baseline = json.load(f)
+        regressions = suite.compare(results, baseline, args.tolerance,
+                                    args.memory_tolerance)
+        for regression in regressions:
+            print('REGRESSION', regression)
+        if regressions:
+            sys.exit(1)
+        print('No regressions against', compare_path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+"""Deterministic generated datasets for the benchmarks.
+
+A dataset is loaded through the bulk import (app.data_import), so the
+derived tables (timelines, ingredients, facets, search index, counters) are
+built the same way as for a real import. Recipes get a language up front;
+detecting it for a million generated texts would dominate the build.
+"""
+from datetime import datetime, timedelta
+import random
+import time
+import sqlalchemy as sa
+from app import db
+from app.data_import import import_rows, finalize
+from app.models import Recipe
+from app.passwords import get_password_hasher
+
+SIZES = {'1k': 1000, '100k': 100000, '1m': 1000000}
+
+PASSWORD = 'benchmark'
+CATEGORIES = ['Breakfast', 'Lunch', 'Dinner', 'Dessert', 'Snack', 'Soup',
+              'Salad', None]
+DIFFICULTIES = ['Easy', 'Medium', 'Hard', None]
+INGREDIENTS = [
+    'flour', 'sugar', 'butter', 'egg', 'milk', 'salt', 'black pepper',
+    'olive oil', 'garlic', 'onion', 'tomato', 'basil', 'chicken breast',
+    'beef', 'rice', 'pasta', 'parmesan', 'lemon', 'honey', 'carrot',
+    'potato', 'cream', 'yeast', 'cinnamon', 'chocolate', 'vanilla',
+    'spinach', 'mushroom', 'ginger', 'soy sauce', 'coriander', 'cumin',
+]
+UNITS = ['g', 'ml', 'tbsp', 'tsp', 'cup', '']
+WORDS = ['quick', 'classic', 'spicy', 'creamy', 'rustic', 'easy', 'baked',
+         'roasted', 'grilled', 'fresh', 'homemade', 'crispy', 'summer',
+         'winter', 'family', 'sunday']
+START = datetime(2024, 1, 1)
+
+
+def parse_size(size):
+    """Number of recipes of a size name ('1k', '1m') or number ('250')."""
+    if size in SIZES:
+        return SIZES[size]
+    return int(size)
+
+
+def user_count(recipes):
+    return max(10, recipes // 20)
+
+
+def generate_users(count, password_hash):
+    for id in range(1, count + 1):
+        yield {'id': id, 'username': f'cook{id}',
+               'email': f'cook{id}@example.com',
+               'password_hash': password_hash,
+               'last_seen': START}
+
+
+def generate_follows(rng, users, per_user=10):
+    for follower in range(1, users + 1):
+        for followed in rng.sample(range(1, users + 1),
+                                   min(per_user, users - 1) + 1):
+            if followed != follower:
+                yield {'follower_id': follower, 'followed_id': followed}
+
+
+def generate_recipes(rng, count, users):
+    for id in range(1, count + 1):
+        title = ' '.join(rng.sample(WORDS, 2) + rng.sample(INGREDIENTS, 2))
+        ingredients = [
+            f'{rng.randint(1, 500)} {rng.choice(UNITS)} {name}'.replace(
+                '  ', ' ')
+            for name in rng.sample(INGREDIENTS, rng.randint(3, 10))]
+        yield {
+            'id': id,
+            'title': title.capitalize(),
+            'description': f'A {title} recipe. ' * rng.randint(1, 4),
+            'ingredients': ingredients,
+            'instructions': 'Mix everything. Cook until done. Serve.',
+            'prep_time': rng.choice([5, 10, 15, 20, 30, None]),
+            'cook_time': rng.choice([0, 10, 20, 45, 90, None]),
+            'servings': rng.randint(1, 8),
+            'difficulty': rng.choice(DIFFICULTIES),
+            'category': rng.choice(CATEGORIES),
+            'timestamp': START + timedelta(minutes=id),
+            'user_id': rng.randint(1, users),
+            'language': 'en',
+        }
+
+
+def generate_ratings(rng, recipes, users):
+    seen = set()
+    for _ in range(recipes):
+        key = (rng.randint(1, users), rng.randint(1, recipes))
+        if key not in seen:
+            seen.add(key)
+            yield {'user_id': key[0], 'recipe_id': key[1],
+                   'rating': rng.randint(1, 5), 'timestamp': START}
+
+
+def build(recipes, seed=0, progress=None):
+    """Create the tables and load a dataset of ``recipes`` recipes.
+
+    Every user's password is PASSWORD. ``progress`` is called with a
+    message after each step. Needs an application context.
+    """
+    progress = progress or (lambda message: None)
+    rng = random.Random(seed)
+    users = user_count(recipes)
+    db.create_all()
+    password_hash = get_password_hasher().hash(PASSWORD)
+    for kind, rows in [
+            ('users', generate_users(users, password_hash)),
+            ('recipes', generate_recipes(rng, recipes, users)),
+            ('follows', generate_follows(rng, users)),
+            ('ratings', generate_ratings(rng, recipes, users))]:
+        start = time.perf_counter()
+        count = import_rows(kind, rows)
+        progress(f'{kind}: {count} rows in '
+                 f'{time.perf_counter() - start:.1f}s')
+    finalize(progress=lambda step, elapsed: progress(
+        f'{step} in {elapsed:.1f}s'))
+
+
+def ensure(recipes, seed=0, progress=None):
+    """Build the dataset unless the database already holds it."""
+    inspector = sa.inspect(db.engine)
+    if inspector.has_table(Recipe.__tablename__):
+        count = db.session.scalar(sa.select(sa.func.count(Recipe.id)))
+        if count == recipes:
+            return False
+        if count:
+            raise RuntimeError(f'the database holds {count} recipes, '
+                               f'not {recipes}; use another database')
+    build(recipes, seed, progress)
+    return True
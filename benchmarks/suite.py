@@ -0,0 +1,158 @@
+"""The benchmark cases, their measurement and the comparison of results.
+
+Each case is one request through Flask's test client (or, for to_dict,
+one page loaded and serialized) against a dataset from
+benchmarks.dataset. It runs a few times
+to warm the caches, then ``iterations`` times measuring wall time and the
+SQL statements executed, and once more under tracemalloc for the peak
+memory allocated.
+"""
+from datetime import datetime, timezone
+import platform
+import statistics
+import time
+import tracemalloc
+import sqlalchemy as sa
+from app import db
+from app.models import Recipe
+from benchmarks.dataset import PASSWORD, INGREDIENTS
+
+
+class Context:
+    """What the cases need: a logged in client, an API token and ids."""
+
+    def __init__(self, app, recipes):
+        self.app = app
+        self.client = app.test_client()
+        response = self.client.post('/auth/login', data={
+            'username': 'cook1', 'password': PASSWORD})
+        if response.status_code != 302:
+            raise RuntimeError('could not log in as cook1')
+        token = self.client.post('/api/tokens', auth=('cook1', PASSWORD)) \
+            .get_json()['token']
+        self.headers = {'Authorization': f'Bearer {token}'}
+        self.recipe_id = recipes // 2 or 1
+        self.user_id = 2
+        self.search = INGREDIENTS[0]
+
+    def get(self, url, api=False):
+        response = self.client.get(url, headers=self.headers if api else None)
+        if response.status_code != 200:
+            raise RuntimeError(f'GET {url} returned {response.status_code}')
+        return response
+
+
+def serialize_page(context):
+    # A page loaded as Recipe.search() loads it, in a session of its own
+    # as in a request, so the lazy loads of to_dict() are counted.
+    with context.app.app_context():
+        recipes = db.session.scalars(
+            sa.select(Recipe).order_by(Recipe.timestamp.desc()).limit(25)
+            .options(*Recipe.search_load_options())).all()
+        return [recipe.to_dict(include_author=True) for recipe in recipes]
+
+
+CASES = {
+    'index': lambda c: c.get('/index'),
+    'following': lambda c: c.get('/following'),
+    'recipe_detail': lambda c: c.get(f'/recipe/{c.recipe_id}'),
+    'search': lambda c: c.get(f'/search?q={c.search}'),
+    'api_recipes': lambda c: c.get('/api/recipes', api=True),
+    'api_search': lambda c: c.get(
+        f'/api/recipes/search?q={c.search}&include_author=1', api=True),
+    'api_user': lambda c: c.get(f'/api/users/{c.user_id}', api=True),
+    'to_dict': serialize_page,
+}
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def measure(case, context, iterations=20, warmup=3):
+    for _ in range(warmup):
+        case(context)
+    times = []
+    statements = []
+    count = [0]
+
+    def before_cursor_execute(*args):
+        count[0] += 1
+
+    sa.event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        for _ in range(iterations):
+            count[0] = 0
+            start = time.perf_counter()
+            case(context)
+            times.append(time.perf_counter() - start)
+            statements.append(count[0])
+    finally:
+        sa.event.remove(db.engine, 'before_cursor_execute',
+                        before_cursor_execute)
+    tracemalloc.start()
+    try:
+        case(context)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {
+        'iterations': iterations,
+        'p50_ms': round(percentile(times, 50) * 1000, 3),
+        'p95_ms': round(percentile(times, 95) * 1000, 3),
+        'p99_ms': round(percentile(times, 99) * 1000, 3),
+        # the median, so a periodic cache refresh does not count
+        'statements': int(statistics.median_low(statements)),
+        'peak_kb': round(peak / 1024, 1),
+    }
+
+
+def run(app, recipes, size=None, names=None, iterations=20, warmup=3,
+        progress=None):
+    """Run the cases (all by default) and return the results document."""
+    context = Context(app, recipes)
+    cases = {}
+    for name in names or CASES:
+        cases[name] = measure(CASES[name], context, iterations, warmup)
+        if progress:
+            progress(name, cases[name])
+    return {
+        'size': size or str(recipes),
+        'recipes': recipes,
+        'database': db.engine.dialect.name,
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'created': datetime.now(timezone.utc).isoformat(),
+        'cases': cases,
+    }
+
+
+def compare(results, baseline, tolerance=0.5, memory_tolerance=0.25,
+            min_delta_ms=1.0):
+    """Return the regressions of ``results`` against ``baseline``.
+
+    Any additional statement is a regression. Latencies (p50 and p95) may
+    grow by ``tolerance`` and at least ``min_delta_ms``, peak memory by
+    ``memory_tolerance``, before they count, as timings vary between runs.
+    """
+    if results['recipes'] != baseline['recipes']:
+        raise ValueError(f"the baseline has {baseline['recipes']} recipes, "
+                         f"the results {results['recipes']}")
+    regressions = []
+    for name, base in baseline['cases'].items():
+        current = results['cases'].get(name)
+        if current is None:
+            continue
+        if current['statements'] > base['statements']:
+            regressions.append(f"{name}: {current['statements']} statements, "
+                               f"baseline {base['statements']}")
+        for key in ('p50_ms', 'p95_ms'):
+            if current[key] > base[key] * (1 + tolerance) and \
+                    current[key] - base[key] >= min_delta_ms:
+                regressions.append(f'{name}: {key} {current[key]:.1f}, '
+                                   f'baseline {base[key]:.1f}')
+        if current['peak_kb'] > base['peak_kb'] * (1 + memory_tolerance):
+            regressions.append(f"{name}: peak memory {current['peak_kb']} KB, "
+                               f"baseline {base['peak_kb']} KB")
+    return regressions
@@ -1,13 +1,24 @@
 # Gunicorn configuration file for Foody application
+import os
+from config import concurrency_profile
 
 # Server socket
-bind = "127.0.0.1:5000"
+bind = os.environ.get("GUNICORN_BIND") or "127.0.0.1:5000"
 backlog = 2048
 
-# Worker processes
-workers = 2
-worker_class = "sync"
-worker_connections = 1000
+# Worker processes, from SERVER_PROFILE (see config.concurrency_profile):
+# "gthread" (default) gives each worker threads, and lets a quarter of them
+# serve /notifications/stream connections (one per browser tab); "sync"
+# serves one request per process and no streams, pages poll instead;
+# "gevent" (needs the gevent package) serves up to worker_connections
+# requests per worker with greenlets, and is the profile that can keep a
+# stream open for every tab. The database pool of each worker is sized to
+# match, see config.engine_options().
+profile = concurrency_profile()
+workers = profile["workers"]
+worker_class = profile["worker_class"]
+threads = profile["threads"]
+worker_connections = profile["worker_connections"]
 timeout = 30
 keepalive = 2
 
@@ -27,8 +38,8 @@ proc_name = "foody"
 # Server mechanics
 daemon = False
 pidfile = "/tmp/foody.pid"
-user = "student"
-group = "student"
+user = os.environ.get("GUNICORN_USER") or "student"
+group = os.environ.get("GUNICORN_GROUP") or "student"
 tmp_upload_dir = None
 
 # SSL (if needed in future)
@@ -45,3 +56,15 @@ graceful_timeout = 30
 limit_request_line = 4094
 limit_request_fields = 100
 limit_request_field_size = 8190
+
+
+def when_ready(server):
+    # load the language detection profiles once, before workers are forked
+    from app.language import warm_up
+    warm_up()
+
+
+def worker_exit(server, worker):
+    # write the last_seen updates still buffered in this worker
+    from app.activity import flush_activity
+    flush_activity(worker.wsgi)
@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+"""Compare the throughput of the gunicorn concurrency profiles.
+
+For each profile the script starts gunicorn with gunicorn.conf.py and
+SERVER_PROFILE set, sends requests to the given paths from a number of
+concurrent clients for a fixed time, stops the server and prints the
+request rate, latency percentiles and errors. The database is the one
+configured in .env or DATABASE_URL, so run it against a copy of
+production data on the production hardware:
+
+    python loadtest.py --profiles sync,gthread,gevent --clients 50 \\
+        --duration 30 / /api/recipes /api/recipes/facets
+
+Each client keeps one connection open, like a browser. The db_pool stats
+of /health are printed after each run; waits and timeouts there mean
+requests queued for a database connection.
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import grp
+import http.client
+import json
+import os
+import pwd
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+basedir = os.path.abspath(os.path.dirname(__file__))
+
+
+def start_server(profile, port, workers=None):
+    env = dict(os.environ, SERVER_PROFILE=profile,
+               GUNICORN_BIND='127.0.0.1:{}'.format(port),
+               SERVER_NAME='127.0.0.1:{}'.format(port),
+               GUNICORN_USER=pwd.getpwuid(os.getuid()).pw_name,
+               GUNICORN_GROUP=grp.getgrgid(os.getgid()).gr_name)
+    if workers:
+        env['GUNICORN_WORKERS'] = str(workers)
+    pidfile = os.path.join(tempfile.gettempdir(),
+                           'foody-loadtest-{}.pid'.format(port))
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py',
+         '--pid', pidfile, '--access-logfile', os.devnull, 'foody:app'],
+        cwd=basedir, env=env)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError('gunicorn exited with {}'.format(
+                server.returncode))
+        try:
+            socket.create_connection(('127.0.0.1', port), 1).close()
+            return server
+        except OSError:
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError('gunicorn did not start listening on {}'.format(port))
+
+
+def client(port, paths, deadline):
+    """Request the paths in turn until the deadline; return the latencies."""
+    latencies, errors = [], 0
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    i = 0
+    while time.monotonic() < deadline:
+        start = time.perf_counter()
+        try:
+            connection.request('GET', paths[i % len(paths)])
+            response = connection.getresponse()
+            response.read()
+            if response.status >= 400:
+                errors += 1
+            else:
+                latencies.append(time.perf_counter() - start)
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            connection.close()
+            connection = http.client.HTTPConnection('127.0.0.1', port,
+                                                    timeout=30)
+        i += 1
+    connection.close()
+    return latencies, errors
+
+
+def run_load(port, paths, clients, duration):
+    deadline = time.monotonic() + duration
+    with ThreadPoolExecutor(clients) as pool:
+        results = list(pool.map(lambda _: client(port, paths, deadline),
+                                range(clients)))
+    latencies = sorted(t for result in results for t in result[0])
+    errors = sum(result[1] for result in results)
+    return latencies, errors
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def health(port):
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+    try:
+        connection.request('GET', '/health')
+        return json.loads(connection.getresponse().read())
+    except (OSError, ValueError, http.client.HTTPException):
+        return {}
+    finally:
+        connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('paths', nargs='*', default=['/', '/api/recipes'])
+    parser.add_argument('--profiles', default='sync,gthread',
+                        help='comma separated SERVER_PROFILE values')
+    parser.add_argument('--clients', type=int, default=50)
+    parser.add_argument('--duration', type=float, default=30,
+                        help='seconds of load per profile')
+    parser.add_argument('--warmup', type=float, default=5,
+                        help='seconds of load before measuring')
+    parser.add_argument('--workers', type=int,
+                        help='same worker count for every profile')
+    parser.add_argument('--port', type=int, default=5100)
+    args = parser.parse_args()
+
+    print('{:<10} {:>8} {:>9} {:>8} {:>8} {:>8} {:>7}'.format(
+        'profile', 'requests', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms',
+        'errors'))
+    for profile in args.profiles.split(','):
+        try:
+            server = start_server(profile, args.port, args.workers)
+        except RuntimeError as e:  # e.g. gevent is not installed
+            print('{:<10} {}'.format(profile, e))
+            continue
+        try:
+            if args.warmup:
+                run_load(args.port, args.paths, args.clients, args.warmup)
+            latencies, errors = run_load(args.port, args.paths, args.clients,
+                                         args.duration)
+            pool = health(args.port).get('db_pool', {})
+        finally:
+            server.terminate()
+            server.wait()
+        print('{:<10} {:>8} {:>9.1f} {:>8.1f} {:>8.1f} {:>8.1f} {:>7}'.format(
+            profile, len(latencies), len(latencies) / args.duration,
+            percentile(latencies, 50) * 1000,
+            percentile(latencies, 95) * 1000,
+            percentile(latencies, 99) * 1000, errors))
+        if pool:
+            print('{:<10} db_pool {}'.format('', json.dumps(pool)))
+        if not latencies:
+            print('{:<10} no successful requests'.format(''))
+
+
+if __name__ == '__main__':
+    main()
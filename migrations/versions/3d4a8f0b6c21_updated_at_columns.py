@@ -0,0 +1,55 @@
+"""updated_at columns
+
+Revision ID: 3d4a8f0b6c21
+Revises: 2c9e5a1d7f46
+Create Date: 2026-10-18 15:48:03.215587
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import mysql
+
+
+# revision identifiers, used by Alembic.
+revision = '3d4a8f0b6c21'
+down_revision = '2c9e5a1d7f46'
+branch_labels = None
+depends_on = None
+
+PreciseDateTime = sa.DateTime().with_variant(mysql.DATETIME(fsp=6), 'mysql',
+                                             'mariadb')
+
+
+def upgrade():
+    with op.batch_alter_table('recipe', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('updated_at', PreciseDateTime, nullable=True))
+
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('updated_at', PreciseDateTime, nullable=True))
+
+    recipe = sa.table('recipe', sa.column('updated_at'),
+                      sa.column('timestamp'))
+    user = sa.table('user', sa.column('updated_at'), sa.column('last_seen'))
+    op.execute(recipe.update().values(updated_at=recipe.c.timestamp))
+    op.execute(user.update().values(updated_at=sa.func.coalesce(
+        user.c.last_seen, sa.func.current_timestamp())))
+
+    with op.batch_alter_table('recipe', schema=None) as batch_op:
+        batch_op.alter_column('updated_at', existing_type=PreciseDateTime,
+                              nullable=False)
+        batch_op.create_index(batch_op.f('ix_recipe_updated_at'), ['updated_at'], unique=False)
+
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.alter_column('updated_at', existing_type=PreciseDateTime,
+                              nullable=False)
+        batch_op.create_index(batch_op.f('ix_user_updated_at'), ['updated_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_user_updated_at'))
+        batch_op.drop_column('updated_at')
+
+    with op.batch_alter_table('recipe', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_recipe_updated_at'))
+        batch_op.drop_column('updated_at')
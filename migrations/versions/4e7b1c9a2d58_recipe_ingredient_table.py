@@ -0,0 +1,211 @@
+"""recipe ingredient table
+
+Revision ID: 4e7b1c9a2d58
+Revises: 3d4a8f0b6c21
+Create Date: 2026-10-18 16:32:11.448120
+
+"""
+from fractions import Fraction
+import json
+import re
+from alembic import op
+import sqlalchemy as sa
+
+BATCH_SIZE = 500
+
+
+# revision identifiers, used by Alembic.
+revision = '4e7b1c9a2d58'
+down_revision = '3d4a8f0b6c21'
+branch_labels = None
+depends_on = None
+
+
+# Parsing and normalization of app/ingredients.py as of this revision,
+# copied so the backfill does not change with the application code.
+
+UNITS = {
+    'g': (('g', 'gr', 'gram', 'grams', 'gramo', 'gramos'), 1),
+    'kg': (('kg', 'kgs', 'kilogram', 'kilograms', 'kilo', 'kilos'), 1000),
+    'mg': (('mg', 'milligram', 'milligrams'), 0.001),
+    'ml': (('ml', 'milliliter', 'milliliters', 'millilitre', 'millilitres'),
+           1),
+    'cl': (('cl', 'centiliter', 'centiliters'), 10),
+    'dl': (('dl', 'deciliter', 'deciliters'), 100),
+    'l': (('l', 'liter', 'liters', 'litre', 'litres', 'litro', 'litros'),
+          1000),
+    'cup': (('c', 'cup', 'cups', 'taza', 'tazas'), 1),
+    'tbsp': (('tbsp', 'tbs', 'tbl', 'tablespoon', 'tablespoons', 'cucharada',
+              'cucharadas'), 1),
+    'tsp': (('tsp', 'teaspoon', 'teaspoons', 'cucharadita', 'cucharaditas'),
+            1),
+    'oz': (('oz', 'ounce', 'ounces'), 1),
+    'lb': (('lb', 'lbs', 'pound', 'pounds'), 1),
+    'pinch': (('pinch', 'pinches', 'pizca', 'pizcas'), 1),
+    'dash': (('dash', 'dashes'), 1),
+    'clove': (('clove', 'cloves', 'diente', 'dientes'), 1),
+    'can': (('can', 'cans', 'tin', 'tins', 'lata', 'latas'), 1),
+    'slice': (('slice', 'slices', 'rebanada', 'rebanadas'), 1),
+    'piece': (('piece', 'pieces', 'pc', 'pcs'), 1),
+    'stick': (('stick', 'sticks'), 1),
+    'sprig': (('sprig', 'sprigs'), 1),
+    'bunch': (('bunch', 'bunches'), 1),
+    'handful': (('handful', 'handfuls'), 1),
+    'package': (('package', 'packages', 'pkg', 'pack', 'packs'), 1),
+}
+BASE_UNITS = {'kg': 'g', 'mg': 'g', 'cl': 'ml', 'dl': 'ml', 'l': 'ml'}
+SPELLINGS = {spelling: (unit, factor)
+             for unit, (spellings, factor) in UNITS.items()
+             for spelling in spellings}
+VULGAR_FRACTIONS = {'½': '1/2', '⅓': '1/3', '⅔': '2/3', '¼': '1/4',
+                    '¾': '3/4', '⅛': '1/8'}
+QUANTITY = re.compile(r'^\d+([.,]\d+)?$|^\d+/\d+$')
+
+
+def stem(word):
+    if len(word) <= 3 or not word.isalpha():
+        return word
+    if word.endswith('ies'):
+        return word[:-3] + 'y'
+    if word.endswith(('oes', 'sses', 'xes', 'ches', 'shes')):
+        return word[:-2]
+    if word.endswith('s') and not word.endswith(('ss', 'us', 'is')):
+        return word[:-1]
+    return word
+
+
+def is_quantity(token):
+    for char, fraction in VULGAR_FRACTIONS.items():
+        token = token.replace(char, fraction)
+    return bool(QUANTITY.match(token))
+
+
+def parse_quantity(amount):
+    if not amount:
+        return None
+    for char, fraction in VULGAR_FRACTIONS.items():
+        amount = amount.replace(char, ' ' + fraction)
+    amount = re.split(r'\s*(?:-|–|to)\s*', amount.strip())[0]
+    total = Fraction(0)
+    try:
+        for part in amount.split():
+            total += Fraction(part.replace(',', '.'))
+    except (ValueError, ZeroDivisionError):
+        return None
+    return float(total) if amount.split() else None
+
+
+def canonical_unit(unit):
+    if not unit:
+        return None
+    match = SPELLINGS.get(unit.lower().rstrip('.'))
+    return match[0] if match else None
+
+
+def normalize_name(text):
+    text = (text or '').lower()
+    text = re.sub(r'\(.*?\)', ' ', text)
+    text = text.split(',')[0]
+    words = re.findall(r'[^\W\d_]+', text)
+    return ' '.join(stem(word) for word in words)[:100]
+
+
+def parse_lines(text):
+    items = []
+    for line in (text or '').splitlines():
+        tokens = line.strip().split()
+        if not tokens:
+            continue
+        amount = []
+        while tokens and is_quantity(tokens[0]) and len(amount) < 2:
+            amount.append(tokens.pop(0))
+        unit = ''
+        if amount and len(tokens) > 1 and canonical_unit(tokens[0]):
+            unit = tokens.pop(0)
+        items.append({'amount': ' '.join(amount), 'unit': unit,
+                      'ingredient': ' '.join(tokens)})
+    return items
+
+
+def normalize(item):
+    quantity = parse_quantity(str(item.get('amount') or ''))
+    unit = canonical_unit(str(item.get('unit') or ''))
+    if unit in BASE_UNITS:
+        if quantity is not None:
+            quantity *= SPELLINGS[unit][1]
+        unit = BASE_UNITS[unit]
+    return {'name': normalize_name(item.get('ingredient')),
+            'quantity': quantity, 'canonical_unit': unit}
+
+
+def upgrade():
+    # ### commands auto generated by Alembic - please adjust! ###
+    op.create_table('recipe_ingredient',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('recipe_id', sa.Integer(), nullable=False),
+    sa.Column('position', sa.Integer(), nullable=False),
+    sa.Column('amount', sa.String(length=32), nullable=False),
+    sa.Column('unit', sa.String(length=32), nullable=False),
+    sa.Column('ingredient', sa.String(length=200), nullable=False),
+    sa.Column('name', sa.String(length=100), nullable=False),
+    sa.Column('quantity', sa.Float(), nullable=True),
+    sa.Column('canonical_unit', sa.String(length=16), nullable=True),
+    sa.ForeignKeyConstraint(['recipe_id'], ['recipe.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('recipe_ingredient', schema=None) as batch_op:
+        batch_op.create_index('ix_recipe_ingredient_name_recipe_id', ['name', 'recipe_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_recipe_ingredient_recipe_id'), ['recipe_id'], unique=False)
+
+    # ### end Alembic commands ###
+
+    # Backfill from the JSON column in batches of recipes. Rows written
+    # later without the ORM (bulk imports) are picked up by
+    # `flask recipes backfill-ingredients`.
+    recipe = sa.table('recipe', sa.column('id'), sa.column('ingredients'))
+    recipe_ingredient = sa.table(
+        'recipe_ingredient', sa.column('recipe_id'), sa.column('position'),
+        sa.column('amount'), sa.column('unit'), sa.column('ingredient'),
+        sa.column('name'), sa.column('quantity'), sa.column('canonical_unit'))
+    connection = op.get_bind()
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            sa.select(recipe.c.id, recipe.c.ingredients)
+            .where(recipe.c.id > last_id)
+            .order_by(recipe.c.id).limit(BATCH_SIZE)).all()
+        if not rows:
+            break
+        params = []
+        for row in rows:
+            try:
+                items = json.loads(row.ingredients) if row.ingredients else []
+            except ValueError:
+                items = parse_lines(row.ingredients)
+            if not isinstance(items, list):
+                items = parse_lines(str(items))
+            for position, item in enumerate(items):
+                if not isinstance(item, dict):
+                    item = {'ingredient': str(item)}
+                values = {
+                    'recipe_id': row.id,
+                    'position': position,
+                    'amount': str(item.get('amount') or '')[:32],
+                    'unit': str(item.get('unit') or '')[:32],
+                    'ingredient': str(item.get('ingredient') or '')[:200],
+                }
+                values.update(normalize(item))
+                params.append(values)
+        if params:
+            connection.execute(recipe_ingredient.insert(), params)
+        last_id = rows[-1].id
+
+
+def downgrade():
+    # ### commands auto generated by Alembic - please adjust! ###
+    with op.batch_alter_table('recipe_ingredient', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_recipe_ingredient_recipe_id'))
+        batch_op.drop_index('ix_recipe_ingredient_name_recipe_id')
+
+    op.drop_table('recipe_ingredient')
+    # ### end Alembic commands ###
@@ -1,15 +1,41 @@
 #!/usr/bin/env python
 from datetime import datetime, timezone, timedelta
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import json
+import os
+import tempfile
+import threading
 import unittest
-from app import create_app, db
-from app.models import User, Post
-from config import Config
+import sqlalchemy as sa
+from app import create_app, db, mail
+from app.email import send_email, outbox_depth, OutboxDrainer
+from app.models import User, Post, Recipe, Rating, Task, OutgoingEmail, \
+    RevokedToken, RecipeIngredient, RecipeFacet
+from app.ingredients import normalize, parse_line, parse_lines
+from app.search import search_stats
+from app.export import export_recipes
+from app.api.auth import verify_token
+from app.activity import ActivityTracker
+from app.cache import get_fragment_cache
+from app.pantry import get_ingredient_index
+from app.notifications import get_notification_hub
+from app.language import get_language_detector
+from app.passwords import PasswordHasher, PasswordHasherBusy, \
+    get_password_hasher
+from app.tasks import TASKS, _set_task_progress
+from app.translate import translate, translate_batch, get_translation_cache
+from app.worker import Worker
+from config import Config, concurrency_profile, engine_options
+from benchmarks import dataset, suite
 
 
 class TestConfig(Config):
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite://'
     ELASTICSEARCH_URL = None
+    WTF_CSRF_ENABLED = False
+    PASSWORD_HASH_PROCESSES = 0
+    SQLALCHEMY_ENGINE_OPTIONS = {}
 
 
 class UserModelCase(unittest.TestCase):
@@ -30,6 +56,62 @@ class UserModelCase(unittest.TestCase):
         self.assertFalse(u.check_password('dog'))
         self.assertTrue(u.check_password('cat'))
 
+    def test_password_pool(self):
+        hasher = PasswordHasher('pbkdf2:sha256:1000', processes=1,
+                                queue_limit=1)
+        try:
+            pwhash = hasher.hash('cat')
+            self.assertTrue(pwhash.startswith('pbkdf2:sha256:1000$'))
+            self.assertTrue(hasher.verify(pwhash, 'cat'))
+            self.assertFalse(hasher.verify(pwhash, 'dog'))
+            self.assertEqual(hasher.in_flight, 0)
+        finally:
+            hasher.shutdown()
+        hasher.queue_limit = 0
+        with self.assertRaises(PasswordHasherBusy):
+            hasher.verify(pwhash, 'cat')
+
+    def test_rehash_and_busy_responses(self):
+        u = User(username='susan', email='susan@example.com')
+        self.app.config['PASSWORD_HASH_METHOD'] = 'pbkdf2:sha256:1000'
+        u.set_password('cat')
+        db.session.add(u)
+        db.session.commit()
+
+        # a changed cost is applied at the next login
+        del self.app.extensions['password_hasher']
+        self.app.config['PASSWORD_HASH_METHOD'] = 'pbkdf2:sha256:2000'
+        client = self.app.test_client()
+        response = client.post('/auth/login', data={'username': 'susan',
+                                                    'password': 'cat'})
+        self.assertEqual(response.status_code, 302)
+        db.session.refresh(u)
+        self.assertTrue(u.password_hash.startswith('pbkdf2:sha256:2000$'))
+        client.get('/auth/logout')
+
+        # a method without parameters matches the hashes it made
+        del self.app.extensions['password_hasher']
+        self.app.config['PASSWORD_HASH_METHOD'] = 'scrypt'
+        u.set_password('cat')
+        db.session.commit()
+        pwhash = u.password_hash
+        for _ in range(2):
+            response = client.post('/auth/login', data={'username': 'susan',
+                                                        'password': 'cat'})
+            self.assertEqual(response.status_code, 302)
+            client.get('/auth/logout')
+            db.session.refresh(u)
+            self.assertEqual(u.password_hash, pwhash)
+
+        get_password_hasher().queue_limit = 0
+        response = client.post('/auth/login', data={'username': 'susan',
+                                                    'password': 'cat'})
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers['Retry-After'], '1')
+        response = client.post('/api/tokens', auth=('susan', 'cat'))
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.get_json()['error'], 'Service Unavailable')
+
     def test_avatar(self):
         u = User(username='john', email='john@example.com')
         self.assertEqual(u.avatar(128), ('https://www.gravatar.com/avatar/'
@@ -63,6 +145,37 @@ class UserModelCase(unittest.TestCase):
         self.assertEqual(u1.following_count(), 0)
         self.assertEqual(u2.followers_count(), 0)
 
+    def test_counters(self):
+        u1 = User(username='john', email='john@example.com')
+        u2 = User(username='susan', email='susan@example.com')
+        r1 = Recipe(title='soup', ingredients='[]', instructions='cook',
+                    author=u1)
+        r2 = Recipe(title='stew', ingredients='[]', instructions='cook',
+                    author=u1)
+        db.session.add_all([u1, u2, r1, r2])
+        db.session.commit()
+        self.assertEqual(u1.recipes_count(), 2)
+        u2.follow(u1)
+        db.session.add(Rating(recipe=r1, user=u2, rating=4))
+        db.session.commit()
+        self.assertEqual(u1.to_dict()['follower_count'], 1)
+        self.assertEqual(u2.to_dict()['following_count'], 1)
+
+        # deleting a rated recipe removes its ratings and updates the count
+        db.session.delete(r1)
+        db.session.commit()
+        self.assertEqual(u1.recipes_count(), 1)
+        self.assertEqual(db.session.scalar(
+            sa.select(sa.func.count(Rating.id))), 0)
+
+        db.session.execute(sa.update(User).values(
+            recipe_total=7, follower_total=0))
+        db.session.commit()
+        self.assertEqual(User.reconcile_counters(chunk_size=1), 2)
+        self.assertEqual((u1.recipes_count(), u1.followers_count(),
+                          u2.recipes_count()), (1, 1, 0))
+        self.assertEqual(User.reconcile_counters(), 0)
+
     def test_follow_posts(self):
         # create four users
         u1 = User(username='john', email='john@example.com')
@@ -73,13 +186,17 @@ class UserModelCase(unittest.TestCase):
 
         # create four posts
         now = datetime.now(timezone.utc)
-        p1 = Post(body="post from john", author=u1,
+        p1 = Post(title="post from john", ingredients="[]",
+                  instructions="cook", author=u1,
                   timestamp=now + timedelta(seconds=1))
-        p2 = Post(body="post from susan", author=u2,
+        p2 = Post(title="post from susan", ingredients="[]",
+                  instructions="cook", author=u2,
                   timestamp=now + timedelta(seconds=4))
-        p3 = Post(body="post from mary", author=u3,
+        p3 = Post(title="post from mary", ingredients="[]",
+                  instructions="cook", author=u3,
                   timestamp=now + timedelta(seconds=3))
-        p4 = Post(body="post from david", author=u4,
+        p4 = Post(title="post from david", ingredients="[]",
+                  instructions="cook", author=u4,
                   timestamp=now + timedelta(seconds=2))
         db.session.add_all([p1, p2, p3, p4])
         db.session.commit()
@@ -101,6 +218,1241 @@ class UserModelCase(unittest.TestCase):
         self.assertEqual(f3, [p3, p4])
         self.assertEqual(f4, [p4])
 
+    def test_timeline_fan_out_and_pull_mode(self):
+        self.app.config['TIMELINE_BACKFILL_LIMIT'] = 1
+        u1 = User(username='john', email='john@example.com')
+        u2 = User(username='susan', email='susan@example.com')
+        u3 = User(username='mary', email='mary@example.com')
+        now = datetime.now(timezone.utc)
+
+        def recipe(author, seconds):
+            return Recipe(title='recipe', ingredients='[]', author=author,
+                          instructions='cook',
+                          timestamp=now + timedelta(seconds=seconds))
+
+        p1, p2, p3 = recipe(u2, 1), recipe(u2, 2), recipe(u3, 3)
+        db.session.add_all([u1, u2, u3, p1, p2, p3])
+        db.session.commit()
+
+        # mary has a single recipe and is backfilled into the timeline
+        u1.follow(u3)
+        db.session.commit()
+        self.assertFalse(u3.timeline_pull)
+        self.assertEqual(db.session.scalars(u1.following_posts()).all(),
+                         [p3])
+
+        # susan is over the backfill limit and is read in pull mode
+        u1.follow(u2)
+        db.session.commit()
+        self.assertTrue(u2.timeline_pull)
+        p4, p5 = recipe(u2, 4), recipe(u3, 5)
+        db.session.add_all([p4, p5])
+        db.session.commit()
+        self.assertEqual(db.session.scalars(u1.following_posts()).all(),
+                         [p5, p4, p3, p2, p1])
+        self.assertEqual(db.session.scalars(u2.following_posts()).all(),
+                         [p4, p2, p1])
+
+        u1.unfollow(u3)
+        db.session.commit()
+        self.assertEqual(db.session.scalars(u1.following_posts()).all(),
+                         [p4, p2, p1])
+
+    def test_coalesced_last_seen(self):
+        t0 = datetime(2026, 1, 1, 12, 0)
+        before = t0 - timedelta(days=1)
+        u1 = User(username='john', email='john@example.com', last_seen=before)
+        u2 = User(username='susan', email='susan@example.com',
+                  last_seen=before)
+        db.session.add_all([u1, u2])
+        db.session.commit()
+        tracker = ActivityTracker(self.app)
+        tracker.record(u1.id, t0)
+        tracker.record(u1.id, t0 + timedelta(seconds=30))
+        tracker.record(u2.id, t0)
+        last_seen = sa.select(User.last_seen).order_by(User.id)
+        self.assertEqual(db.session.scalars(last_seen).all(), [before, before])
+
+        self.assertEqual(tracker.flush(), 2)
+        self.assertEqual(db.session.scalars(last_seen).all(),
+                         [t0 + timedelta(seconds=30), t0])
+        # a stale timestamp from another worker does not win
+        tracker.record(u1.id, t0)
+        tracker.flush()
+        self.assertEqual(db.session.scalar(last_seen),
+                         t0 + timedelta(seconds=30))
+
+
+class RecipeModelCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_rating_aggregates(self):
+        u1 = User(username='john', email='john@example.com')
+        u2 = User(username='susan', email='susan@example.com')
+        r = Recipe(title='pancakes', ingredients='[]', instructions='mix',
+                   author=u1)
+        db.session.add_all([u1, u2, r])
+        db.session.commit()
+        self.assertEqual(r.get_average_rating(), 0)
+
+        db.session.add(Rating(rating=5, user=u1, recipe=r))
+        r.update_rating_stats(new_rating=5)
+        rating = Rating(rating=2, user=u2, recipe=r)
+        db.session.add(rating)
+        r.update_rating_stats(new_rating=2)
+        db.session.commit()
+        self.assertEqual(r.get_rating_count(), 2)
+        self.assertEqual(r.get_average_rating(), 3.5)
+
+        r.update_rating_stats(rating.rating, 4)
+        rating.rating = 4
+        db.session.commit()
+        self.assertEqual(r.get_average_rating(), 4.5)
+        self.assertEqual(r.get_rating_histogram(),
+                         {1: 0, 2: 0, 3: 0, 4: 1, 5: 1})
+
+        # drift is repaired by a rebuild from the rating table
+        r.rating_sum = 0
+        r.rating_count = 0
+        db.session.commit()
+        self.assertEqual(Recipe.rebuild_rating_stats(), 1)
+        self.assertEqual(r.get_rating_count(), 2)
+        self.assertEqual(r.get_average_rating(), 4.5)
+
+    def test_search(self):
+        u = User(username='john', email='john@example.com')
+        r1 = Recipe(title='Tomato soup', instructions='simmer', author=u,
+                    ingredients='[{"amount": "4", "unit": "", '
+                                '"ingredient": "tomatoes"}]')
+        r2 = Recipe(title='Pancakes', instructions='fry', author=u,
+                    description='Fluffy pancakes, no tomato in sight',
+                    ingredients='[{"amount": "2", "unit": "", '
+                                '"ingredient": "eggs"}]')
+        db.session.add_all([u, r1, r2])
+        db.session.commit()
+
+        recipes, total = Recipe.search('tomato', 1, 10)
+        self.assertEqual(total, 2)
+        self.assertEqual(recipes, [r1, r2])
+        recipes, total = Recipe.search('egg', 1, 10)
+        self.assertEqual(recipes, [r2])
+        # ingredient JSON keys are not indexed
+        self.assertEqual(Recipe.search('unit', 1, 10), ([], 0))
+
+        r2.title = 'Omelette'
+        db.session.commit()
+        self.assertEqual(Recipe.search('pancakes', 1, 10)[0], [r2])
+        self.assertEqual(Recipe.search('omelette', 1, 10)[0], [r2])
+
+        r2_id = r2.id
+        self.assertEqual(Recipe.reindex(), 2)
+        self.assertEqual(Recipe.search('tomato', 1, 10)[1], 2)
+        self.assertEqual([r.id for r in Recipe.search('tomato', 2, 1)[0]],
+                         [r2_id])
+
+        # a rebuild drops documents of rows deleted behind the index's back
+        # and leaves the caller's objects in the session
+        db.session.execute(sa.delete(Recipe).where(Recipe.id == r2_id))
+        db.session.commit()
+        self.assertEqual(Recipe.reindex(chunk_size=1), 1)
+        self.assertIn(r1, db.session)
+        self.assertEqual(Recipe.search('tomato', 1, 10), ([r1], 1))
+        self.assertEqual(db.session.execute(
+            sa.select(search_stats.c.doc_count)).scalar(), 1)
+
+
+    def test_facets(self):
+        u1 = User(username='john', email='john@example.com')
+        u2 = User(username='susan', email='susan@example.com')
+        recipes = [
+            Recipe(title='eggs', category='Breakfast', difficulty='Easy',
+                   prep_time=5, cook_time=5, author=u1),
+            Recipe(title='porridge', category='Breakfast', difficulty='Easy',
+                   cook_time=20, author=u2),
+            Recipe(title='stew', category='Dinner', difficulty='Hard',
+                   prep_time=30, cook_time=120, author=u1),
+            Recipe(title='toast', author=u1),
+        ]
+        for r in recipes:
+            r.ingredients, r.instructions = '[]', 'cook'
+        db.session.add_all([u1, u2] + recipes)
+        db.session.commit()
+        self.assertEqual([r.time_bucket for r in recipes],
+                         ['under-15', '15-30', 'over-120', None])
+
+        counts = RecipeFacet.counts({'category': 'Breakfast'})
+        self.assertEqual(counts['total'], 2)
+        self.assertEqual(counts['category'], {'Breakfast': 2, 'Dinner': 1})
+        self.assertEqual(counts['time_bucket'], {'15-30': 1, 'under-15': 1})
+        self.assertEqual(RecipeFacet.counts({}, author_id=u1.id)['difficulty'],
+                         {'Easy': 1, 'Hard': 1})
+
+        # counts follow updates and deletes
+        recipes[1].cook_time = 45
+        recipes[2].category = 'Lunch'
+        db.session.delete(recipes[0])
+        db.session.commit()
+        counts = RecipeFacet.counts({})
+        self.assertEqual(counts['category'], {'Breakfast': 1, 'Lunch': 1})
+        self.assertEqual(counts['time_bucket'], {'30-60': 1, 'over-120': 1})
+        self.assertEqual(counts['total'], 3)
+
+        db.session.execute(sa.delete(RecipeFacet))
+        db.session.commit()
+        RecipeFacet.rebuild()
+        self.assertEqual(RecipeFacet.counts({}), counts)
+
+    def test_ingredients(self):
+        self.assertEqual(parse_line('1 1/2 cups flour'), {
+            'amount': '1 1/2', 'unit': 'cups', 'ingredient': 'flour'})
+        self.assertEqual(parse_line('2 large eggs')['ingredient'],
+                         'large eggs')
+        self.assertEqual(normalize({'amount': '0.5', 'unit': 'Kg',
+                                    'ingredient': 'Tomatoes, diced'}),
+                         {'name': 'tomato', 'quantity': 500.0,
+                          'canonical_unit': 'g'})
+
+        u = User(username='john', email='john@example.com')
+        r1 = Recipe(title='Soup', instructions='simmer', author=u,
+                    ingredients=json.dumps(parse_lines('1 kg tomatoes\n'
+                                                       'salt')))
+        r2 = Recipe(title='Salad', instructions='toss', author=u,
+                    ingredients='2 tomatoes\n1 cucumber')
+        db.session.add_all([u, r1, r2])
+        db.session.commit()
+        self.assertEqual([i.name for i in r1.ingredient_items],
+                         ['tomato', 'salt'])
+        self.assertEqual(r2.get_ingredients_list()[1],
+                         {'amount': '1', 'unit': '', 'ingredient': 'cucumber'})
+        self.assertEqual(db.session.scalars(sa.select(Recipe).where(
+            Recipe.has_ingredient('Tomato')).order_by(Recipe.id)).all(),
+            [r1, r2])
+
+        # rows written without the ORM are read from the JSON column
+        # until they are backfilled
+        db.session.execute(sa.insert(Recipe.__table__).values(
+            id=10, user_id=u.id, title='Bread', instructions='bake',
+            ingredients='[{"amount": "500", "unit": "g", '
+                        '"ingredient": "flour"}]',
+            timestamp=datetime.now(timezone.utc)))
+        db.session.commit()
+        bread = db.session.get(Recipe, 10)
+        self.assertEqual(bread.ingredient_items, [])
+        self.assertEqual(bread.get_ingredients_list()[0]['ingredient'],
+                         'flour')
+        self.assertEqual(Recipe.backfill_ingredients(), 1)
+        db.session.expire(bread)
+        self.assertEqual([(i.quantity, i.canonical_unit)
+                          for i in bread.ingredient_items], [(500.0, 'g')])
+
+        r1.set_ingredients_list([{'amount': '', 'unit': '',
+                                  'ingredient': 'water'}])
+        db.session.commit()
+        self.assertEqual(db.session.scalar(sa.select(sa.func.count()).select_from(
+            RecipeIngredient).where(RecipeIngredient.recipe_id == r1.id)), 1)
+        db.session.delete(r2)
+        db.session.commit()
+        self.assertEqual(db.session.scalar(sa.select(sa.func.count()).select_from(
+            RecipeIngredient)), 2)
+
+
+class DataImportCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        self.tmpdir.cleanup()
+
+    def write(self, name, content):
+        path = os.path.join(self.tmpdir.name, name)
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def test_import(self):
+        users = self.write('users.csv', 'id,username,email\n'
+                           '1,john,john@example.com\n'
+                           '2,susan,susan@example.com\n')
+        recipes = self.write('recipes.jsonl', '\n'.join(json.dumps({
+            'id': i, 'user_id': 1, 'title': f'tomato soup {i}',
+            'description': 'a warm soup with tomatoes and basil',
+            'ingredients': [{'amount': '1', 'unit': 'kg',
+                             'ingredient': 'tomatoes'}],
+            'instructions': 'cook', 'timestamp': f'2026-01-0{i}T12:00:00'})
+            for i in range(1, 4)))
+        follows = self.write('follows.csv',
+                             'follower_id,followed_id\n2,1\n')
+        ratings = self.write('ratings.jsonl', '\n'.join(json.dumps(
+            {'user_id': user_id, 'recipe_id': 1, 'rating': rating})
+            for user_id, rating in ((1, 5), (2, 2))))
+        result = self.app.test_cli_runner().invoke(args=[
+            'data', 'import', '--users', users, '--recipes', recipes,
+            '--follows', follows, '--ratings', ratings, '--chunk-size', '2'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn('ratings: 2 rows', result.output)
+
+        john, susan = db.session.get(User, 1), db.session.get(User, 2)
+        self.assertEqual((john.recipes_count(), john.followers_count(),
+                          susan.following_count()), (3, 1, 1))
+        recipe = db.session.get(Recipe, 1)
+        self.assertEqual((recipe.get_rating_count(),
+                          recipe.get_average_rating()), (2, 3.5))
+        self.assertEqual([r.id for r in db.session.scalars(
+            susan.following_recipes())], [3, 2, 1])
+        self.assertEqual(Recipe.search('tomatoes', 1, 10)[1], 3)
+        self.assertEqual(db.session.get(Recipe, 2).language, 'en')
+        self.assertEqual(db.session.get(Recipe, 2).ingredient_items[0].quantity,
+                         1000.0)
+
+
+class RecipeListingCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def count_statements(self, url):
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        sa.event.listen(db.engine, 'before_cursor_execute',
+                        before_cursor_execute)
+        try:
+            response = self.client.get(url)
+        finally:
+            sa.event.remove(db.engine, 'before_cursor_execute',
+                            before_cursor_execute)
+        self.assertEqual(response.status_code, 200)
+        return len(statements)
+
+    def test_index_page_statement_count(self):
+        users = [User(username=f'cook{i}', email=f'cook{i}@example.com')
+                 for i in range(25)]
+        users[0].set_password('cat')
+        db.session.add_all(users)
+        now = datetime.now(timezone.utc)
+        db.session.add_all([
+            Recipe(title=f'recipe {i}', ingredients='[]', instructions='cook',
+                   description='tasty ' * 40, prep_time=10, rating_sum=9,
+                   rating_count=2, author=users[i],
+                   timestamp=now + timedelta(seconds=i))
+            for i in range(25)])
+        db.session.commit()
+        self.client.post('/auth/login', data={'username': 'cook0',
+                                              'password': 'cat'})
+
+        # user load, COUNT, page, authors
+        self.assertLessEqual(self.count_statements('/index'), 4)
+        # plus the pull-mode author check
+        self.assertLessEqual(self.count_statements('/following'), 5)
+        # profile counters come from the user row, no COUNT queries
+        self.assertLessEqual(self.count_statements('/user/cook0'), 6)
+
+
+    def test_card_fragment_cache(self):
+        john = User(username='john', email='john@example.com')
+        susan = User(username='susan', email='susan@example.com')
+        for user in (john, susan):
+            user.set_password('cat')
+        recipe = Recipe(title='pancakes', ingredients='[]',
+                        instructions='fry', author=john)
+        db.session.add_all([john, susan, recipe])
+        db.session.commit()
+        cache = get_fragment_cache()
+
+        self.client.post('/auth/login', data={'username': 'john',
+                                              'password': 'cat'})
+        html = self.client.get('/index').get_data(as_text=True)
+        self.assertIn('pancakes', html)
+        self.assertIn('deleteModal', html)
+        self.assertEqual((cache.local.hits, cache.local.misses), (0, 1))
+
+        # another viewer gets the cached card without the owner buttons
+        self.client.get('/auth/logout')
+        self.client.post('/auth/login', data={'username': 'susan',
+                                              'password': 'cat'})
+        html = self.client.get('/index').get_data(as_text=True)
+        self.assertIn('pancakes', html)
+        self.assertNotIn('deleteModal', html)
+        self.assertEqual((cache.local.hits, cache.local.misses), (1, 1))
+
+        recipe.update_rating_stats(new_rating=4)
+        db.session.commit()
+        html = self.client.get('/index').get_data(as_text=True)
+        self.assertIn('4.0', html)
+        self.assertEqual(cache.local.misses, 2)
+
+
+    def test_language_detection(self):
+        john = User(username='john', email='john@example.com')
+        john.set_password('cat')
+        db.session.add(john)
+        db.session.commit()
+        self.client.post('/auth/login', data={'username': 'john',
+                                              'password': 'cat'})
+        form = {'title': 'Tomato soup', 'ingredients': '4 tomatoes',
+                'description': 'A warm soup with fresh tomatoes and basil',
+                'instructions': 'Simmer for twenty minutes'}
+        self.client.post('/share', data=form)
+        get_language_detector(self.app).wait()
+        recipe = db.session.scalar(sa.select(Recipe))
+        self.assertEqual(recipe.language, 'en')
+
+        # edits that keep the title and description keep the language
+        recipe.language = 'xx'
+        db.session.commit()
+        form['instructions'] = 'Simmer for half an hour'
+        self.client.post(f'/recipe/{recipe.id}/edit', data=form)
+        get_language_detector(self.app).wait()
+        db.session.refresh(recipe)
+        self.assertEqual(recipe.language, 'xx')
+        form['title'] = 'Tomato soup with basil'
+        self.client.post(f'/recipe/{recipe.id}/edit', data=form)
+        get_language_detector(self.app).wait()
+        db.session.refresh(recipe)
+        self.assertEqual(recipe.language, 'en')
+
+        db.session.add_all([Recipe(
+            title=f'Sopa de tomate {i}', author=john, ingredients='[]',
+            description='Una sopa caliente con tomates frescos y albahaca',
+            instructions='cocinar') for i in range(3)])
+        db.session.commit()
+        result = self.app.test_cli_runner().invoke(args=[
+            'recipes', 'detect-language', '--chunk-size', '2', '-p', '2'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn('language of 3 recipes', result.output)
+        self.assertEqual(set(db.session.scalars(sa.select(Recipe.language))),
+                         {'en', 'es'})
+
+
+class APICase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def add_recipes(self, count):
+        u = User(username='john', email='john@example.com')
+        now = datetime.now(timezone.utc)
+        # pairs of recipes share a timestamp so the id tie-break matters
+        recipes = [Recipe(title=f'recipe {i}', ingredients='[]',
+                          instructions='cook', author=u,
+                          timestamp=now + timedelta(seconds=i // 2))
+                   for i in range(count)]
+        db.session.add_all(recipes)
+        db.session.commit()
+        return [r.id for r in recipes]
+
+    def count_statements(self, func):
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        sa.event.listen(db.engine, 'before_cursor_execute',
+                        before_cursor_execute)
+        try:
+            func()
+        finally:
+            sa.event.remove(db.engine, 'before_cursor_execute',
+                            before_cursor_execute)
+        return len(statements)
+
+    def test_search_statement_count(self):
+        self.add_recipes(30)
+        db.session.expunge_all()
+
+        def search(per_page):
+            response = self.client.get(
+                f'/api/recipes/search?q=recipe&per_page={per_page}')
+            self.assertEqual(len(response.get_json()['items']), per_page)
+
+        # ingredients are loaded for the whole page at once
+        self.assertEqual(self.count_statements(lambda: search(5)),
+                         self.count_statements(lambda: search(25)))
+        # a few statements per chunk, none per recipe
+        self.assertLess(self.count_statements(
+            lambda: Recipe.reindex(chunk_size=30)), 30)
+
+    def test_recipes_cursor_pagination(self):
+        ids = self.add_recipes(5)
+        expected = sorted(ids, reverse=True)
+
+        seen = []
+        url = '/api/recipes?cursor=&per_page=2'
+        while url:
+            data = self.client.get(url).get_json()
+            self.assertNotIn('total_items', data['_meta'])
+            seen.extend(item['id'] for item in data['items'])
+            last = data
+            url = data['_links']['next']
+        self.assertEqual(seen, expected)
+
+        data = self.client.get(last['_links']['prev']).get_json()
+        self.assertEqual([item['id'] for item in data['items']],
+                         expected[2:4])
+
+        data = self.client.get(
+            '/api/recipes?cursor=&per_page=2&total=exact').get_json()
+        self.assertEqual(data['_meta']['total_items'], 5)
+        self.assertIsNone(data['_links']['prev'])
+        response = self.client.get('/api/recipes?cursor=bogus')
+        self.assertEqual(response.status_code, 400)
+
+        # page-number mode is unchanged
+        data = self.client.get('/api/recipes?page=2&per_page=2').get_json()
+        self.assertEqual(data['_meta']['total_items'], 5)
+        self.assertEqual(len(data['items']), 2)
+
+    def get_token(self):
+        response = self.client.post('/api/tokens', auth=('susan', 'cat'))
+        self.assertEqual(response.status_code, 200)
+        return response.get_json()['token']
+
+    def test_signed_tokens(self):
+        self.app.config['API_TOKEN_FORMAT'] = 'signed'
+        u = User(username='susan', email='susan@example.com')
+        u.set_password('cat')
+        db.session.add(u)
+        db.session.commit()
+        token = self.get_token()
+        headers = {'Authorization': 'Bearer ' + token}
+        self.assertEqual(self.client.get(f'/api/users/{u.id}',
+                                         headers=headers).status_code, 200)
+
+        # verification does not query the database
+        statements = []
+        def count(*args):
+            statements.append(args)
+        sa.event.listen(db.engine, 'before_cursor_execute', count)
+        with self.app.test_request_context():
+            self.assertEqual(verify_token(token).id, u.id)
+        sa.event.remove(db.engine, 'before_cursor_execute', count)
+        self.assertEqual(statements, [])
+
+        # password reset tokens are not API tokens
+        reset = {'Authorization': 'Bearer ' + u.get_reset_password_token()}
+        self.assertEqual(self.client.get(f'/api/users/{u.id}',
+                                         headers=reset).status_code, 401)
+
+        other = self.get_token()
+        self.assertEqual(self.client.delete('/api/tokens',
+                                            headers=headers).status_code, 204)
+        self.assertEqual(self.client.get(f'/api/users/{u.id}',
+                                         headers=headers).status_code, 401)
+        self.assertEqual(self.client.get(
+            f'/api/users/{u.id}',
+            headers={'Authorization': 'Bearer ' + other}).status_code, 200)
+
+        # other workers pick the revocation up from the database
+        self.app.extensions.pop('api_token_revocations')
+        self.assertEqual(self.client.get(f'/api/users/{u.id}',
+                                         headers=headers).status_code, 401)
+        self.assertEqual(db.session.scalar(
+            sa.select(sa.func.count(RevokedToken.id))), 1)
+
+        # opaque tokens keep working
+        self.app.config['API_TOKEN_FORMAT'] = 'opaque'
+        opaque = {'Authorization': 'Bearer ' + self.get_token()}
+        self.assertEqual(self.client.get(f'/api/users/{u.id}',
+                                         headers=opaque).status_code, 200)
+
+
+    def test_batch_endpoints(self):
+        u = User(username='susan', email='susan@example.com')
+        u.set_password('cat')
+        db.session.add(u)
+        db.session.commit()
+        headers = {'Authorization': 'Bearer ' + self.get_token()}
+        recipe = {'title': 'soup', 'ingredients': [
+                      {'amount': '1', 'unit': 'l', 'ingredient': 'water'}],
+                  'instructions': 'boil'}
+
+        response = self.client.post('/api/recipes/batch', headers=headers,
+                                    json={'recipes': [recipe, {'title': 'x'}]})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.get_json()['errors'][0]['index'], 1)
+        self.assertEqual(u.recipes_count(), 0)
+
+        response = self.client.post('/api/recipes/batch', headers=headers,
+                                    json={'recipes': [recipe, {'title': 'x'}],
+                                          'atomic': False})
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual([item['status'] for item in
+                          response.get_json()['items']], [201, 400])
+        response = self.client.post('/api/recipes/batch', headers=headers,
+                                    json={'recipes': [recipe, recipe]})
+        self.assertEqual(response.status_code, 201)
+        ids = [item['id'] for item in response.get_json()['items']]
+        db.session.expire_all()
+        self.assertEqual(u.recipes_count(), 3)
+
+        data = self.client.get(
+            f'/api/recipes?ids={ids[1]},999,{ids[0]}&include_author=1'
+        ).get_json()
+        self.assertEqual([item['id'] for item in data['items']],
+                         [ids[1], ids[0]])
+        self.assertEqual(data['missing'], [999])
+        self.assertEqual(data['items'][0]['author']['username'], 'susan')
+        self.assertEqual(self.client.get('/api/recipes?ids=a,b').status_code,
+                         400)
+        data = self.client.get(f'/api/users?ids={u.id}',
+                               headers=headers).get_json()
+        self.assertEqual(data['items'][0]['recipe_count'], 3)
+
+        response = self.client.post('/api/recipes/ratings/batch',
+                                    headers=headers, json={'ratings': [
+                                        {'recipe_id': ids[0], 'rating': 5},
+                                        {'recipe_id': 999, 'rating': 5}]})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(db.session.scalar(
+            sa.select(sa.func.count(Rating.id))), 0)
+        for value in (2, 4):
+            response = self.client.post(
+                '/api/recipes/ratings/batch', headers=headers, json={
+                    'ratings': [{'recipe_id': id, 'rating': value}
+                                for id in ids]})
+            self.assertEqual(response.status_code, 201)
+        self.assertEqual([item['average_rating'] for item in
+                          response.get_json()['items']], [4.0, 4.0])
+        self.assertEqual(db.session.scalar(
+            sa.select(sa.func.count(Rating.id))), 2)
+
+
+    def test_ndjson_export(self):
+        ids = self.add_recipes(5)
+        u = db.session.get(User, 1)
+        u.set_password('cat')
+        db.session.commit()
+        u.username = 'susan'
+        db.session.commit()
+        headers = {'Authorization': 'Bearer ' + self.get_token()}
+
+        response = self.client.get('/api/recipes/export?fields=id,author',
+                                   headers=headers)
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        lines = [json.loads(line) for line in
+                 response.get_data(as_text=True).splitlines()]
+        self.assertEqual([line['id'] for line in lines], ids)
+        self.assertEqual(set(lines[0]), {'id', 'author'})
+        self.assertEqual(lines[0]['author']['username'], 'susan')
+
+        since = db.session.get(Recipe, ids[1]).timestamp.isoformat()
+        response = self.client.get(f'/api/recipes/export?since={since}',
+                                   headers=headers)
+        lines = response.get_data(as_text=True).splitlines()
+        self.assertEqual([json.loads(line)['id'] for line in lines], ids[2:])
+        self.assertEqual(self.client.get('/api/recipes/export?fields=bogus',
+                                         headers=headers).status_code, 400)
+
+        result = self.app.test_cli_runner().invoke(
+            args=['recipes', 'export', '--fields', 'id,title',
+                  '--chunk-size', '2'])
+        self.assertEqual(result.exit_code, 0)
+        self.assertEqual([json.loads(line)['title'] for line in
+                          result.output.splitlines()],
+                         [f'recipe {i}' for i in range(5)])
+
+        # chunks continue after the last (timestamp, id), also across
+        # recipes that share a timestamp
+        for fields in (None, ['id', 'author']):
+            chunks = list(export_recipes(fields=fields, chunk_size=2))
+            self.assertEqual(len(chunks), 3)
+            self.assertEqual([json.loads(line)['id'] for chunk in chunks
+                              for line in chunk.splitlines()], ids)
+
+
+    def test_by_ingredients(self):
+        u = User(username='john', email='john@example.com')
+        pancakes = Recipe(title='pancakes', instructions='fry', author=u,
+                          ingredients='2 eggs\n200 g flour\n300 ml milk')
+        omelette = Recipe(title='omelette', instructions='fry', author=u,
+                          ingredients='3 eggs\nsalt')
+        cake = Recipe(title='cake', instructions='bake', author=u,
+                      ingredients='2 eggs\nflour\nsugar\n50 g walnuts')
+        bread = Recipe(title='bread', instructions='bake', author=u,
+                       ingredients='flour\nwater\nyeast')
+        db.session.add_all([u, pancakes, omelette, cake, bread])
+        db.session.commit()
+
+        data = self.client.get('/api/recipes/by-ingredients'
+                               '?have=egg,flour,Milk').get_json()
+        self.assertEqual([(item['title'], item['missing_count'])
+                          for item in data['items']],
+                         [('pancakes', 0), ('omelette', 1), ('cake', 2),
+                          ('bread', 2)])
+        self.assertEqual(data['items'][2]['missing_ingredients'],
+                         ['sugar', 'walnuts'])
+        data = self.client.get('/api/recipes/by-ingredients?have=egg,flour'
+                               '&exclude=walnut&max_missing=1').get_json()
+        self.assertEqual([item['title'] for item in data['items']],
+                         ['pancakes', 'omelette'])
+        self.assertEqual(data['_meta']['total_items'], 2)
+        self.assertEqual(self.client.get(
+            '/api/recipes/by-ingredients').status_code, 400)
+
+        # the index picks up new recipes once its refresh interval passes
+        db.session.add(Recipe(title='crepes', instructions='fry', author=u,
+                              ingredients='eggs\nflour\nmilk'))
+        db.session.commit()
+        get_ingredient_index().checked_at = None
+        # the first search after the interval still reads the old snapshot
+        # and starts the rebuild
+        get_ingredient_index().refresh(wait=True)
+        data = self.client.get('/api/recipes/by-ingredients'
+                               '?have=egg,flour,milk&per_page=2').get_json()
+        self.assertEqual([item['title'] for item in data['items']],
+                         ['crepes', 'pancakes'])
+
+        # other recipe updates keep the index, ingredient changes rebuild it
+        index = get_ingredient_index()
+        snapshot = index.snapshot
+        bread.title = 'white bread'
+        bread.update_rating_stats(new_rating=4)
+        db.session.commit()
+        index.checked_at = None
+        index.refresh(wait=True)
+        self.assertIs(index.snapshot, snapshot)
+        bread.ingredients = 'flour\nwater\nyeast\negg'
+        db.session.commit()
+        index.checked_at = None
+        index.refresh(wait=True)
+        self.assertIsNot(index.snapshot, snapshot)
+        self.assertIn(bread.id, index.snapshot[0]['egg'])
+
+    def test_conditional_get(self):
+        ids = self.add_recipes(3)
+        url = f'/api/recipes/{ids[0]}'
+        response = self.client.get(url)
+        etag = response.headers['ETag']
+        last_modified = response.headers['Last-Modified']
+        response = self.client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.get_data(), b'')
+        response = self.client.get(
+            url, headers={'If-Modified-Since': last_modified})
+        self.assertEqual(response.status_code, 304)
+
+        db.session.get(Recipe, ids[0]).update_rating_stats(new_rating=5)
+        db.session.commit()
+        response = self.client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['rating_count'], 1)
+
+        data = self.client.get('/api/recipes/facets?category=none').get_json()
+        self.assertEqual(data['total'], 0)
+        self.assertEqual(data['time_bucket'], {})
+        for url in ('/api/recipes/categories', '/api/recipes'):
+            etag = self.client.get(url).headers['ETag']
+            response = self.client.get(url, headers={'If-None-Match': etag})
+            self.assertEqual(response.status_code, 304)
+        db.session.delete(db.session.get(Recipe, ids[1]))
+        db.session.commit()
+        response = self.client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get('/api/recipes/999').status_code, 404)
+
+        # the ratings list follows rating timestamps too, which a re-rating
+        # with the same value moves without touching the recipe
+        rating = Rating(recipe_id=ids[0], rating=4,
+                        user_id=db.session.get(Recipe, ids[0]).user_id)
+        db.session.add(rating)
+        db.session.commit()
+        url = f'/api/recipes/{ids[0]}/ratings'
+        etag = self.client.get(url).headers['ETag']
+        response = self.client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        db.session.execute(sa.update(Rating).values(
+            timestamp=rating.timestamp + timedelta(seconds=1)))
+        db.session.commit()
+        response = self.client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+
+        # a 304 for an indexed filter runs the aggregate only
+        author_id = db.session.get(Recipe, ids[0]).user_id
+        url = f'/api/recipes?author_id={author_id}&cursor=&per_page=1'
+        etag = self.client.get(url).headers['ETag']
+        responses = []
+        self.assertEqual(self.count_statements(lambda: responses.append(
+            self.client.get(url, headers={'If-None-Match': etag}))), 1)
+        self.assertEqual(responses[0].status_code, 304)
+        db.session.get(Recipe, ids[2]).title = 'renamed'
+        db.session.commit()
+        response = self.client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+
+        # combined filters are validated by the page served
+        url += '&ingredient=egg'
+        etag = self.client.get(url).headers['ETag']
+        response = self.client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+
+class NotificationStreamCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.app.config.update(NOTIFICATION_POLL_INTERVAL=0.05,
+                               NOTIFICATION_HEARTBEAT=0.05,
+                               NOTIFICATION_STREAM_TIMEOUT=0.5)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.user = User(username='john', email='john@example.com')
+        self.user.set_password('cat')
+        db.session.add(self.user)
+        db.session.commit()
+        self.client = self.app.test_client()
+        self.client.post('/auth/login', data={'username': 'john',
+                                              'password': 'cat'})
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def events(self, chunks):
+        return [json.loads(line[6:]) for chunk in chunks
+                for line in chunk.decode().splitlines()
+                if line.startswith('data: ')]
+
+    def test_stream(self):
+        self.user.add_notification('unread_message_count', 1)
+        db.session.commit()
+        response = self.client.get('/notifications/stream')
+        self.assertEqual(response.mimetype, 'text/event-stream')
+        body = response.get_data(as_text=True)
+        self.assertTrue(body.startswith('retry: '))
+        self.assertIn(': keepalive', body)
+        self.assertEqual([(e['name'], e['data'])
+                          for e in self.events([response.data])],
+                         [('unread_message_count', 1)])
+        last_id = int(body.split('id: ')[1].split()[0])
+
+        # resume after the last event; new rows are pushed while open
+        response = self.client.get('/notifications/stream', buffered=False,
+                                   headers={'Last-Event-ID': str(last_id)})
+        chunks = iter(response.response)
+        self.assertTrue(next(chunks).startswith(b'retry: '))
+        self.user.add_notification('task_progress', {'task_id': 'x',
+                                                     'progress': 50})
+        db.session.commit()
+        received = []
+        for chunk in chunks:
+            received += self.events([chunk])
+            if received:
+                break
+        response.close()
+        self.assertEqual([(e['name'], e['data']) for e in received],
+                         [('task_progress', {'task_id': 'x', 'progress': 50})])
+        hub = get_notification_hub(self.app)
+        self.assertEqual(hub.subscribers, {})
+        self.assertEqual(hub.streams, 0)
+
+    def test_stream_limit(self):
+        self.app.config['NOTIFICATION_MAX_STREAMS'] = 1
+        self.assertIn(b'new EventSource', self.client.get('/index').data)
+        response = self.client.get('/notifications/stream', buffered=False)
+        self.assertEqual(response.status_code, 200)
+        # the worker's only stream is taken; the page has to poll
+        busy = self.client.get('/notifications/stream')
+        self.assertEqual(busy.status_code, 503)
+        self.assertIn('Retry-After', busy.headers)
+        response.close()
+        response = self.client.get('/notifications/stream', buffered=False)
+        self.assertEqual(response.status_code, 200)
+        response.close()
+
+        self.app.config['NOTIFICATION_MAX_STREAMS'] = 0
+        self.assertNotIn(b'new EventSource', self.client.get('/index').data)
+
+
+class WorkerCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.user = User(username='john', email='john@example.com')
+        db.session.add(self.user)
+        db.session.commit()
+        self.calls = []
+
+        def succeed(user_id, value):
+            _set_task_progress(50)
+            self.calls.append((user_id, value))
+
+        def fail(user_id):
+            raise RuntimeError('boom')
+
+        TASKS.update(test_succeed=succeed, test_fail=fail)
+
+    def tearDown(self):
+        TASKS.pop('test_succeed')
+        TASKS.pop('test_fail')
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_run_task(self):
+        task = self.user.launch_task('test_succeed', 'testing', value=42)
+        db.session.commit()
+        self.assertFalse(task.complete)
+        worker = Worker()
+        self.assertTrue(worker.run_once())
+        self.assertFalse(worker.run_once())
+        self.assertEqual(self.calls, [(self.user.id, 42)])
+        task = db.session.get(Task, task.id)
+        self.assertEqual(task.status, 'finished')
+        self.assertTrue(task.complete)
+        self.assertEqual(task.get_progress(), 100)
+
+    def test_retry_with_backoff(self):
+        task = self.user.launch_task('test_fail', 'testing')
+        task.max_attempts = 2
+        db.session.commit()
+        task_id = task.id
+        worker = Worker()
+        self.assertTrue(worker.run_once())
+        task = db.session.get(Task, task_id)
+        self.assertEqual(task.status, 'queued')
+        self.assertIn('boom', task.error)
+        # backing off: not runnable until run_at
+        self.assertFalse(worker.run_once())
+        task.run_at = datetime.now(timezone.utc) - timedelta(seconds=1)
+        db.session.commit()
+        self.assertTrue(worker.run_once())
+        task = db.session.get(Task, task_id)
+        self.assertEqual((task.status, task.attempts), ('failed', 2))
+        self.assertTrue(task.complete)
+
+    def test_visibility_timeout(self):
+        task = self.user.launch_task('test_succeed', 'testing', value=1)
+        db.session.commit()
+        task_id = task.id
+        # a worker claims the task and dies
+        self.assertIsNotNone(Worker('crashed').claim())
+        self.assertIsNone(Worker().claim())
+        task = db.session.get(Task, task_id)
+        task.locked_until = datetime.now(timezone.utc) - timedelta(seconds=1)
+        db.session.commit()
+        self.assertTrue(Worker().run_once())
+        self.assertEqual(db.session.get(Task, task_id).status, 'finished')
+
+
+class EmailOutboxCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def queue(self, count):
+        for i in range(count):
+            send_email(f'hello {i}', 'foody@example.com',
+                       ['susan@example.com'], 'text', '<p>html</p>',
+                       attachments=[('a.txt', 'text/plain', 'data')])
+        db.session.commit()
+
+    def test_queued_with_the_callers_transaction(self):
+        send_email('hello', 'foody@example.com', ['susan@example.com'],
+                   'text', '<p>html</p>')
+        db.session.rollback()
+        self.assertEqual(outbox_depth(), {})
+
+    def test_stuck_message_gives_up(self):
+        self.queue(2)
+        self.app.config['MAIL_MAX_ATTEMPTS'] = 2
+        expired = datetime.now(timezone.utc) - timedelta(seconds=1)
+        for email, attempts in zip(db.session.scalars(
+                sa.select(OutgoingEmail).order_by(OutgoingEmail.id)), (1, 2)):
+            email.status = 'sending'
+            email.attempts = attempts
+            email.locked_until = expired
+        db.session.commit()
+        drainer = OutboxDrainer(connections=1, rate=0)
+        self.assertEqual([email.subject for email in drainer.claim()],
+                         ['hello 0'])
+        self.assertEqual(outbox_depth(), {'sending': 1, 'failed': 1})
+
+    def test_drain(self):
+        self.queue(5)
+        self.assertEqual(outbox_depth(), {'queued': 5})
+        with mail.record_messages() as outbox:
+            drainer = OutboxDrainer(connections=2, batch_size=3, rate=0)
+            drainer.drain(once=True)
+        self.assertEqual(outbox_depth(), {'sent': 5})
+        self.assertEqual(sorted(msg.subject for msg in outbox),
+                         [f'hello {i}' for i in range(5)])
+        self.assertEqual(outbox[0].attachments[0].data, b'data')
+
+    def test_retry_on_smtp_failure(self):
+        self.queue(1)
+        state = self.app.extensions['mail']
+        state.suppress = False
+        state.server, state.port = 'localhost', 1
+        drainer = OutboxDrainer(connections=1, rate=0)
+        drainer.start()
+        try:
+            self.assertEqual(drainer.drain_once(), (0, 1))
+            email = db.session.scalar(sa.select(OutgoingEmail))
+            self.assertEqual((email.status, email.attempts), ('queued', 1))
+            self.assertIsNotNone(email.error)
+            # backing off, nothing to send yet
+            self.assertEqual(drainer.drain_once(), (0, 0))
+        finally:
+            drainer.close()
+
+class StubTranslator(BaseHTTPRequestHandler):
+    """Translator v3 stand-in that upper-cases every text."""
+    requests = []
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        self.requests.append(body)
+        payload = json.dumps([{'translations': [{'text': item['Text'].upper()}]}
+                              for item in body]).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+class TranslateCase(unittest.TestCase):
+    def setUp(self):
+        self.server = HTTPServer(('127.0.0.1', 0), StubTranslator)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        StubTranslator.requests = []
+
+        class StubConfig(TestConfig):
+            MS_TRANSLATOR_KEY = 'test'
+            MS_TRANSLATOR_URL = 'http://127.0.0.1:{}/translate'.format(
+                self.server.server_port)
+            MS_TRANSLATOR_BATCH_SIZE = 2
+
+        self.app = create_app(StubConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_batch_and_cache(self):
+        self.assertEqual(translate_batch(['egg', 'milk', 'egg', 'flour'],
+                                         'en', 'es'),
+                         ['EGG', 'MILK', 'EGG', 'FLOUR'])
+        # three distinct texts in batches of two
+        self.assertEqual(StubTranslator.requests,
+                         [[{'Text': 'egg'}, {'Text': 'milk'}],
+                          [{'Text': 'flour'}]])
+        self.assertEqual(translate('milk', 'en', 'es'), 'MILK')
+        self.assertEqual(len(StubTranslator.requests), 2)
+
+        # a fresh process only has the database level
+        cache = get_translation_cache()
+        cache.memory.clear()
+        self.assertEqual(translate('egg', 'en', 'es'), 'EGG')
+        self.assertEqual(translate('egg', 'en', 'fr'), 'EGG')
+        self.assertEqual(len(StubTranslator.requests), 3)
+        stats = cache.stats()
+        self.assertEqual((stats['db_hits'], stats['misses'],
+                          stats['upstream_requests']), (1, 4, 3))
+
+    def test_expired_entries(self):
+        translate('egg', 'en', 'es')
+        get_translation_cache().memory.clear()
+        self.app.config['TRANSLATION_CACHE_TTL'] = 0
+        get_translation_cache().ttl = 0
+        translate('egg', 'en', 'es')
+        self.assertEqual(len(StubTranslator.requests), 2)
+
+
+class TimingConfig(TestConfig):
+    REQUEST_TIMING = True
+    QUERY_BUDGETS = {'main.index': 4, 'api.get_recipes': 1}
+
+
+class RequestTimingCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TimingConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_server_timing(self):
+        u = User(username='john', email='john@example.com')
+        u.set_password('cat')
+        db.session.add_all([u] + [
+            Recipe(title=f'recipe {i}', ingredients='[]', instructions='cook',
+                   author=u) for i in range(3)])
+        db.session.commit()
+        self.client.post('/auth/login', data={'username': 'john',
+                                              'password': 'cat'})
+
+        with self.assertNoLogs(self.app.logger, 'WARNING'):
+            response = self.client.get('/index')
+        timing = response.headers['Server-Timing']
+        self.assertRegex(timing, r'^db;dur=[\d.]+;desc="[1-4] queries", '
+                                 r'tpl;dur=[\d.]+, total;dur=[\d.]+$')
+        self.assertNotIn('tpl;dur=0.0,', timing)
+
+        token = self.client.post('/api/tokens', auth=('john', 'cat')) \
+            .get_json()['token']
+        with self.assertLogs(self.app.logger, 'WARNING') as logs:
+            response = self.client.get(
+                '/api/recipes', headers={'Authorization': f'Bearer {token}'})
+        self.assertIn('Server-Timing', response.headers)
+        line = json.loads(logs.output[0].split(' budget ', 1)[1])
+        self.assertEqual(line['endpoint'], 'api.get_recipes')
+        self.assertEqual(line['query_budget'], 1)
+        self.assertGreater(line['queries'], 1)
+
+        # off by default
+        self.assertNotIn('Server-Timing', create_app(TestConfig)
+                         .test_client().get('/auth/login').headers)
+
+
+class ConcurrencyProfileCase(unittest.TestCase):
+    def test_profiles(self):
+        sync = concurrency_profile('sync', cpus=4)
+        self.assertEqual((sync['workers'], sync['concurrency']), (9, 1))
+        # a notification stream would hold a whole sync worker
+        self.assertEqual(sync['streams'], 0)
+        gthread = concurrency_profile('gthread', cpus=4)
+        self.assertEqual((gthread['workers'], gthread['concurrency']), (5, 8))
+        self.assertEqual(gthread['streams'], 2)
+        gevent = concurrency_profile('gevent', cpus=4)
+        self.assertEqual(gevent['concurrency'], 1000)
+        self.assertRaises(ValueError, concurrency_profile, 'forking')
+
+        self.assertEqual(engine_options('sqlite://', gthread), {})
+        options = engine_options('mysql+pymysql://localhost/foody', gthread)
+        self.assertEqual(options['pool_size'], 8)
+        self.assertTrue(options['pool_pre_ping'])
+        # evented workers queue for a capped pool
+        options = engine_options('mysql+pymysql://localhost/foody', gevent)
+        self.assertEqual(options['pool_size'], 20)
+
+    def test_pool_metrics(self):
+        fd, path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+
+        class PoolConfig(TestConfig):
+            SQLALCHEMY_DATABASE_URI = 'sqlite:///' + path
+            SQLALCHEMY_ENGINE_OPTIONS = {'pool_size': 1, 'max_overflow': 0,
+                                         'pool_timeout': 1}
+
+        app = create_app(PoolConfig)
+        try:
+            with app.app_context():
+                db.create_all()
+                engine = db.engine
+                with engine.connect():
+                    with self.assertRaises(sa.exc.TimeoutError):
+                        engine.connect()
+                with engine.connect():
+                    pass
+                stats = app.test_client().get('/health').get_json()['db_pool']
+            self.assertEqual(stats['class'], 'InstrumentedQueuePool')
+            self.assertEqual(stats['size'], 1)
+            self.assertEqual(stats['timeouts'], 1)
+            self.assertGreaterEqual(stats['checkouts'], 3)
+            self.assertGreaterEqual(stats['wait_max'], 1)
+        finally:
+            with app.app_context():
+                db.engine.dispose()
+            os.remove(path)
+
+
+class BenchmarkCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_suite_and_compare(self):
+        self.assertTrue(dataset.ensure(60))
+        self.assertFalse(dataset.ensure(60))
+        self.assertGreater(db.session.scalar(
+            sa.select(sa.func.count(RecipeIngredient.id))), 0)
+
+        results = suite.run(self.app, 60, iterations=2, warmup=1)
+        self.assertEqual(set(results['cases']), set(suite.CASES))
+        self.assertGreater(results['cases']['index']['statements'], 0)
+        # the page, its ingredients and one lazy load per distinct author
+        authors = set(db.session.scalars(
+            sa.select(Recipe.user_id).order_by(Recipe.timestamp.desc())
+            .limit(25)))
+        self.assertEqual(results['cases']['to_dict']['statements'],
+                         2 + len(authors))
+        self.assertEqual(suite.compare(results, results), [])
+
+        baseline = json.loads(json.dumps(results))
+        baseline['cases']['index']['statements'] -= 1
+        baseline['cases']['search']['p50_ms'] /= 10
+        baseline['cases']['search']['p50_ms'] -= 1
+        regressions = suite.compare(results, baseline)
+        self.assertEqual(len(regressions), 2)
+        self.assertTrue(regressions[0].startswith('index: '))
+        baseline['recipes'] = 1000
+        self.assertRaises(ValueError, suite.compare, results, baseline)
+
 
 if __name__ == '__main__':
     unittest.main(verbosity=2)